@@ -0,0 +1,240 @@
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import click
+import requests
+import yaml
+from rich.console import Console as RichConsole
+from rich.table import Table
+
+from scripts.utils.replay_node import (ReplayCorpus, ReplayNode,
+                                       start_replay_node)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_FILES = ["scripts", "contracts", "ape-config.yaml"]
+TRICRYPTO2_MAX_BLOCK = 15537394
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+
+def _configured_port() -> int:
+
+    # ape connects to the geth uri in ape-config.yaml, so that's where the
+    # replay node has to listen:
+    with open(os.path.join(PROJECT_DIR, "ape-config.yaml")) as f:
+        config = yaml.safe_load(f)
+
+    uri = config["geth"]["ethereum"]["mainnet"]["uri"]
+    return int(uri.rsplit(":", 1)[1].strip("/"))
+
+
+def _run_benchmark(name: str, argv: List[str], node_uri: str) -> Dict:
+
+    # run in a scratch copy of the project so output files and trace caches
+    # of one benchmark don't leak into the next (or into the repo):
+    with tempfile.TemporaryDirectory() as workdir:
+        for project_file in PROJECT_FILES:
+            src = os.path.join(PROJECT_DIR, project_file)
+            dst = os.path.join(workdir, project_file)
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, ignore=shutil.ignore_patterns("__pycache__"))
+            elif os.path.exists(src):
+                shutil.copy(src, dst)
+
+        requests.post(f"{node_uri}/reset")
+        RICH_CONSOLE.log(f"Running [bold blue]{name}: [white]{shlex.join(argv)}")
+
+        stderr_file = os.path.join(workdir, "stderr.txt")
+        with open(stderr_file, "wb") as stderr:
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                argv, cwd=workdir, stdout=subprocess.DEVNULL, stderr=stderr
+            )
+            # wait4 gives us the child's own resource usage (peak memory):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - start
+
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code != 0:
+            RICH_CONSOLE.log(f"[red]{name} exited with code {exit_code}:")
+            with open(stderr_file, "rb") as f:
+                RICH_CONSOLE.log(f.read().decode(errors="replace")[-2000:])
+
+    stats = requests.get(f"{node_uri}/stats").json()
+    return {
+        "name": name,
+        "ok": exit_code == 0,
+        "seconds": elapsed,
+        "txs_per_sec": stats["traced_txes"] / elapsed,
+        "traced_txes": stats["traced_txes"],
+        "rpc_calls": stats["rpc_calls"],
+        "http_requests": stats["http_requests"],
+        "peak_rss_mb": rusage.ru_maxrss / 1024,  # ru_maxrss is in KiB on linux
+    }
+
+
+@click.group(short_help="End-to-end throughput benchmarks against a replay node")
+def cli():
+    """
+    Command-line helper for benchmarking the gas estimate pipeline offline
+    """
+
+
+@cli.command(
+    name="run",
+    short_help=("Benchmark gas_tools and newton_math_tools against a replay node"),
+)
+@click.option("--corpus", "-c", required=True, help="Corpus directory", type=str)
+@click.option(
+    "--pool",
+    "-p",
+    required=True,
+    help="Stableswap pool to run gas_tools pools for",
+    type=str,
+)
+@click.option(
+    "--max_transactions",
+    "-mt",
+    default=1000,
+    help="Max number of txes per run",
+    type=int,
+)
+@click.option(
+    "--variant",
+    "-v",
+    default=[""],
+    multiple=True,
+    help="Extra gas_tools pools args to compare, e.g. '--concurrency 8'",
+    type=str,
+)
+@click.option(
+    "--newton_variant",
+    default=[""],
+    multiple=True,
+    help="Extra newton_math_tools tricrypto2 args to compare",
+    type=str,
+)
+@click.option(
+    "--latency_ms",
+    default=0.0,
+    help="Injected latency per HTTP request",
+    type=float,
+)
+@click.option(
+    "--call_latency_ms",
+    default=0.0,
+    help="Injected latency per JSON-RPC call",
+    type=float,
+)
+@click.option(
+    "--error_rate",
+    default=0.0,
+    help="Fraction of JSON-RPC calls that get an injected error",
+    type=float,
+)
+@click.option(
+    "--network",
+    default="ethereum:mainnet:geth",
+    help="ape network the benchmarked commands connect with",
+    type=str,
+)
+def run(
+    corpus,
+    pool,
+    max_transactions,
+    variant,
+    newton_variant,
+    latency_ms,
+    call_latency_ms,
+    error_rate,
+    network,
+):
+
+    port = _configured_port()
+    node = ReplayNode(
+        ReplayCorpus(corpus),
+        latency_ms=latency_ms,
+        call_latency_ms=call_latency_ms,
+        error_rate=error_rate,
+    )
+    server = start_replay_node(node, "127.0.0.1", port)
+    node_uri = f"http://127.0.0.1:{port}"
+
+    benchmarks = []
+    for args in variant:
+        benchmarks.append(
+            (
+                f"gas_tools pools {args}".strip(),
+                [
+                    "ape",
+                    "run",
+                    "gas_tools",
+                    "pools",
+                    "--network",
+                    network,
+                    "--pool_type",
+                    "stableswap",
+                    "--pool",
+                    pool,
+                    "--max_transactions",
+                    str(max_transactions),
+                    *shlex.split(args),
+                ],
+            )
+        )
+    for args in newton_variant:
+        benchmarks.append(
+            (
+                f"newton_math_tools tricrypto2 {args}".strip(),
+                [
+                    "ape",
+                    "run",
+                    "newton_math_tools",
+                    "tricrypto2",
+                    "--network",
+                    network,
+                    "--max_transactions",
+                    str(max_transactions),
+                    "--max_block",
+                    str(TRICRYPTO2_MAX_BLOCK),
+                    *shlex.split(args),
+                ],
+            )
+        )
+
+    try:
+        results = [_run_benchmark(name, argv, node_uri) for name, argv in benchmarks]
+    finally:
+        server.shutdown()
+
+    table = Table(title="Pipeline throughput")
+    for column in [
+        "benchmark",
+        "ok",
+        "seconds",
+        "txs/sec",
+        "traced txs",
+        "rpc calls",
+        "http requests",
+        "peak rss (MB)",
+    ]:
+        table.add_column(column)
+
+    for result in results:
+        table.add_row(
+            result["name"],
+            "yes" if result["ok"] else "[red]no",
+            f"{result['seconds']:.1f}",
+            f"{result['txs_per_sec']:.1f}",
+            str(result["traced_txes"]),
+            str(result["rpc_calls"]),
+            str(result["http_requests"]),
+            f"{result['peak_rss_mb']:.0f}",
+        )
+
+    RICH_CONSOLE.print(table)
@@ -0,0 +1,265 @@
+import http.client
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import click
+import numpy
+from rich.console import Console as RichConsole
+from rich.table import Table
+
+from scripts.gas_tools import (CRYPTOSWAP_GAS_TABLE_FILE,
+                               STABLESWAP_GAS_TABLE_FILE)
+from scripts.utils.estimate_server import (DEFAULT_RELOAD_INTERVAL,
+                                           EstimateIndex,
+                                           start_estimate_server)
+from scripts.utils.fast_json import json_dumps
+
+DEFAULT_PORT = 8547
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+
+@click.group(short_help="Local query service for gas estimates")
+def cli():
+    """
+    Command-line helper for serving gas estimates to routers and other clients
+    """
+
+
+def _table_option(f):
+    return click.option(
+        "--table",
+        "-t",
+        default=[STABLESWAP_GAS_TABLE_FILE, CRYPTOSWAP_GAS_TABLE_FILE],
+        multiple=True,
+        help="Gas estimate JSON file to serve",
+        type=str,
+    )(f)
+
+
+@cli.command(
+    name="serve",
+    short_help=("Answer (pool, method[, percentile]) gas estimate queries over HTTP"),
+)
+@_table_option
+@click.option("--host", default="127.0.0.1", help="Host to bind to", type=str)
+@click.option("--port", "-p", default=DEFAULT_PORT, help="Port to bind to", type=int)
+@click.option(
+    "--reload_interval",
+    default=DEFAULT_RELOAD_INTERVAL,
+    help="Seconds between checks for newly exported estimates",
+    type=float,
+)
+def serve(table, host, port, reload_interval):
+
+    index = EstimateIndex(list(table))
+    server = start_estimate_server(index, host, port, reload_interval)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        RICH_CONSOLE.log("Shutting down ...")
+    finally:
+        server.shutdown()
+
+
+def _get_latency_stats(name: str, latencies_ns: List[int], seconds: float) -> Dict:
+
+    latencies_us = numpy.array(latencies_ns) / 1000
+    return {
+        "name": name,
+        "requests": latencies_us.size,
+        "p50": numpy.percentile(latencies_us, 50),
+        "p99": numpy.percentile(latencies_us, 99),
+        "max": latencies_us.max(),
+        "requests_per_sec": latencies_us.size / seconds,
+    }
+
+
+def _run_client(
+    host: str,
+    port: int,
+    batches: List[List[Dict]],
+    latencies_ns: List[int],
+    errors: List[str],
+):
+
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        for batch in batches:
+
+            if len(batch) == 1:
+                method, path, body = (
+                    "GET",
+                    f"/estimate?{urlencode(batch[0])}",
+                    None,
+                )
+            else:
+                method, path, body = "POST", "/estimates", json_dumps(batch)
+
+            start = time.perf_counter_ns()
+            connection.request(method, path, body=body)
+            response = connection.getresponse()
+            response.read()
+            latencies_ns.append(time.perf_counter_ns() - start)
+            if response.status not in (200, 404):
+                errors.append(f"{response.status} for {path}")
+    finally:
+        connection.close()
+
+
+def _get_queries(
+    keys: List[Tuple[str, str]],
+    num_queries: int,
+    percentile: Optional[float],
+    seed: int,
+) -> List[Dict]:
+
+    rng = random.Random(seed)
+    queries = []
+    for pool_addr, method in rng.choices(keys, k=num_queries):
+        query = {"pool": pool_addr, "method": method}
+        if percentile is not None:
+            query["percentile"] = percentile
+        queries.append(query)
+
+    return queries
+
+
+@cli.command(
+    name="loadtest",
+    short_help="Measure query latency of the gas estimate service",
+)
+@_table_option
+@click.option("--host", default="127.0.0.1", help="Host of the service", type=str)
+@click.option(
+    "--port", "-p", default=DEFAULT_PORT, help="Port of the service", type=int
+)
+@click.option(
+    "--serve",
+    "start_server",
+    is_flag=True,
+    default=False,
+    help="Start the service in this process instead of querying a running one",
+)
+@click.option(
+    "--requests",
+    "-n",
+    "num_requests",
+    default=10000,
+    help="Requests",
+    type=int,
+)
+@click.option("--concurrency", "-c", default=4, help="Concurrent connections", type=int)
+@click.option(
+    "--batch_size",
+    "-b",
+    default=1,
+    help="Queries per request. 1 queries GET /estimate, more POST /estimates",
+    type=int,
+)
+@click.option(
+    "--percentile",
+    default=None,
+    help="Ask for this percentile (0 to 100) in every query",
+    type=float,
+)
+@click.option("--seed", default=0, help="Seed of the random queries", type=int)
+def loadtest(
+    table,
+    host,
+    port,
+    start_server,
+    num_requests,
+    concurrency,
+    batch_size,
+    percentile,
+    seed,
+):
+
+    # queries are drawn from the estimates the service is expected to serve:
+    index = EstimateIndex(list(table))
+    keys = index.get_keys()
+    if not keys:
+        RICH_CONSOLE.print(f"[red]No gas estimates in {', '.join(table)}.")
+        return
+
+    queries = _get_queries(keys, num_requests * batch_size, percentile, seed)
+    server = start_estimate_server(index, host, port) if start_server else None
+
+    # the index lookup on its own, without HTTP:
+    latencies_ns = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter_ns()
+        index.query(query["pool"], query["method"], query.get("percentile"))
+        latencies_ns.append(time.perf_counter_ns() - query_start)
+    results = [
+        _get_latency_stats("index lookup", latencies_ns, time.perf_counter() - start)
+    ]
+
+    batches = [
+        queries[start:end]
+        for start, end in zip(
+            range(0, len(queries), batch_size),
+            range(batch_size, len(queries) + batch_size, batch_size),
+        )
+    ]
+    client_latencies = [[] for _ in range(concurrency)]
+    errors = []
+    threads = [
+        threading.Thread(
+            target=_run_client,
+            args=(
+                host,
+                port,
+                batches[i::concurrency],
+                client_latencies[i],
+                errors,
+            ),
+        )
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.append(
+        _get_latency_stats(
+            f"HTTP ({concurrency} conns, batch {batch_size})",
+            [latency for latencies in client_latencies for latency in latencies],
+            time.perf_counter() - start,
+        )
+    )
+
+    if server is not None:
+        server.shutdown()
+
+    latency_table = Table(title="Gas estimate query latency")
+    for column in [
+        "",
+        "requests",
+        "p50 (µs)",
+        "p99 (µs)",
+        "max (µs)",
+        "requests/sec",
+    ]:
+        latency_table.add_column(column)
+    for result in results:
+        latency_table.add_row(
+            result["name"],
+            str(result["requests"]),
+            f"{result['p50']:.1f}",
+            f"{result['p99']:.1f}",
+            f"{result['max']:.1f}",
+            f"{result['requests_per_sec']:.0f}",
+        )
+
+    RICH_CONSOLE.print(latency_table)
+    if errors:
+        RICH_CONSOLE.print(f"[red]{len(errors)} failed requests, e.g. {errors[0]}")
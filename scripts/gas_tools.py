@@ -1,7 +1,7 @@
 import json
 import os
 import sys
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 import ape
 import click
@@ -9,13 +9,36 @@ from rich.console import Console as RichConsole
 
 from scripts.utils.call_tree_parser_utils import get_calltree
 from scripts.utils.call_tree_parsers import parse_as_tree
+from scripts.utils.contract_store import (DEFAULT_REQUESTS_PER_SECOND,
+                                          get_contract, get_contract_store,
+                                          group_by_implementation,
+                                          prefetch_contract_types)
+from scripts.utils.estimate_store import (estimate_store_options,
+                                          get_estimate_store)
+from scripts.utils.event_index import (event_index_options,
+                                       get_transactions_for_contract,
+                                       get_transactions_for_contracts)
+from scripts.utils.gas_samples import (GasSamples, concat_gas_samples,
+                                       get_method_counts, get_newest_txes,
+                                       select_gas_samples)
 from scripts.utils.gas_stats_calculator import (
+    GAS_STATS_MERGERS, PoolGasAccumulator, attribute_gas_for_txes,
+    attribute_gas_for_txes_by_block,
     compute_bimodal_gaussian_gas_stats_for_txes,
+    compute_mixture_gas_stats_for_txes,
+    compute_quantile_sketch_gas_stats_for_txes,
+    compute_rolling_gas_stats_for_txes,
     compute_univariate_gaussian_gas_stats_for_txes,
-    get_avg_gas_cost_per_method_for_tx, get_gas_cost_for_txes)
+    get_avg_gas_cost_per_method_for_tx, get_gas_cost_for_pools_by_block,
+    get_gas_cost_for_txes, get_gas_costs_from_samples, merge_gas_stats)
+from scripts.utils.mixture import (DEFAULT_MAX_COMPONENTS,
+                                   configure_mixture_selection)
 from scripts.utils.pool_getter import (get_cryptoswap_registry_pools,
                                        get_stableswap_registry_pools)
-from scripts.utils.transactions_getter import get_all_transactions_for_contract
+from scripts.utils.pooling import fill_in_thin_methods, get_thin_methods
+from scripts.utils.rolling_stats import rolling_stats_options
+from scripts.utils.sample_store import get_sample_store, sample_store_options
+from scripts.utils.trace_cache import trace_cache_options
 
 STABLESWAP_GAS_TABLE_FILE = "./stableswap_pools_gas_estimates.json"
 CRYPTOSWAP_GAS_TABLE_FILE = "./cryptoswap_pools_gas_estimates.json"
@@ -23,89 +46,440 @@ RICH_CONSOLE = RichConsole(file=sys.stdout)
 
 
 def _load_cache(filename: str):
+    return get_estimate_store().get_table(filename)
 
-    costs = {}
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            try:
-                costs = json.load(f)
-            except json.decoder.JSONDecodeError:
-                pass
 
-    return costs
+def _write_gas_table(output_file_name: str, costs: Dict):
+    get_estimate_store().put_many(output_file_name, costs)
 
 
 def _append_gas_table_to_output_file(
     output_file_name: str, pool_addr: str, decoded_gas_table: Dict
 ):
 
-    # save gas costs to file
-    RICH_CONSOLE.log(f"saving gas costs to file [green]{output_file_name}...")
-    costs = _load_cache(output_file_name)
+    # only the pool's row is written, the JSON file is exported once the
+    # run is done (see _export_gas_tables):
+    get_estimate_store().put(output_file_name, pool_addr, decoded_gas_table)
+    RICH_CONSOLE.log(f"Saved gas costs of [blue]{pool_addr}.")
+
 
-    costs[pool_addr] = decoded_gas_table
-    with open(output_file_name, "w") as f:
-        json.dump(costs, f, indent=4)
+def _export_gas_tables(output_file_names: List[str]):
 
-    RICH_CONSOLE.log("... saved!")
+    for output_file_name in dict.fromkeys(output_file_names):
+        get_estimate_store().export_json(output_file_name)
 
 
 # ---- writes gas table to file ---- #
 
 
-def _fetch_costs_and_save(pools, max_transactions, output_file_name, gas_stats_methods):
-    # load cache if it exists:
-    cached_costs = _load_cache(output_file_name)
-    for pool_addr in pools:
+def _get_txes_to_update(
+    pool_addr: str,
+    max_transactions: int,
+    cached_costs: Dict,
+    discovered_txes: Optional[Dict[str, List[Tuple[int, str]]]] = None,
+    incremental: bool = True,
+) -> Optional[Tuple[ape.Contract, List[Tuple[int, str]], Optional[Dict]]]:
+
+    try:
+        pool = get_contract(pool_addr)
+    except ape.exceptions.ChainError:
+        RICH_CONSOLE.log(f"[red]{pool_addr} is not verified on Etherskem. Moving on.")
+        return None
+
+    # get the newest max_transactions txes, in block order:
+    if discovered_txes is not None:
+        txes = discovered_txes.get(pool_addr.lower(), [])
+    else:
+        txes = get_transactions_for_contract(pool, max_transactions)
+    if len(txes) == 0:
+        RICH_CONSOLE.log(f"No transactions found for {pool.address}. Moving on.")
+        return None
+
+    # check if we have cached gas costs for this pool. if we do
+    # then we check if the current txes > tx count in cached stats.
+    # if so, we update the cached stats:
+    max_block = max(block for block, _ in txes)
+    if (
+        pool.address in cached_costs
+        and cached_costs[pool.address]["max_block"] >= max_block
+    ):
+        RICH_CONSOLE.log("Pool cached with similar gas stats. Moving on.")
+        return None
+
+    # if the txes pick up where the cached stats left off, only the new txes
+    # are traced and folded into the cached stats:
+    cached_gas_stats = cached_costs.get(pool.address)
+    if (
+        incremental
+        and cached_gas_stats
+        and min(block for block, _ in txes) <= cached_gas_stats["max_block"]
+    ):
+        txes = [
+            (block, tx) for block, tx in txes if block > cached_gas_stats["max_block"]
+        ]
+        RICH_CONSOLE.log(f"Folding [blue]{len(txes)} new txes into cached stats.")
+        return pool, txes, cached_gas_stats
+
+    return pool, txes, None
+
+
+def _get_own_gas_stats(gas_stats: Dict) -> Dict:
+
+    # undo pooling: methods that were filled in from the pool's implementation
+    # get the pool's own stats back
+    own_gas_stats = {
+        stats_type: dict(gas_stats[stats_type])
+        for stats_type in GAS_STATS_MERGERS
+        if stats_type in gas_stats
+    }
+    for stats_type, gas_table in own_gas_stats.items():
+        for method in gas_stats.get("pooled_methods", []):
+            gas_table.pop(method, None)
+        gas_table.update(gas_stats.get("own_stats", {}).get(stats_type, {}))
+
+    return own_gas_stats
+
+
+def _save_gas_stats(
+    pool_addr: str,
+    gas_samples: GasSamples,
+    output_file_name: str,
+    gas_stats_methods,
+    cached_gas_stats: Optional[Dict] = None,
+    previous_gas_stats: Optional[Dict] = None,
+) -> Optional[Dict]:
+
+    if cached_gas_stats is not None:
+        # the accumulator can hold txes older than the cached stats (traced
+        # for other pools), which are already counted in them:
+        gas_samples = select_gas_samples(
+            gas_samples, gas_samples.block > cached_gas_stats["max_block"]
+        )
 
-        try:
-            pool = ape.Contract(pool_addr)
-        except ape.exceptions.ChainError:
-            RICH_CONSOLE.log(
-                f"[red]{pool_addr} is not verified on Etherskem. Moving on."
-            )
-            continue
+    if gas_samples.empty:
+        RICH_CONSOLE.log(f"No gas costs found for {pool_addr}. Moving on.")
+        return None
+
+    # get gas stats:
+    gas_stats = {}
+    has_data = False
+    for gas_stats_method in gas_stats_methods:
+
+        # the previous run's stats warm start the mixture fits:
+        gstats = gas_stats_method(gas_samples, previous_gas_stats)
+        gas_stats_keys = list(gstats.keys())
+        if gstats[gas_stats_keys[0]]:
+            has_data = True or has_data
+            gas_stats[gas_stats_keys[0]] = gstats[gas_stats_keys[0]]
+
+    if not has_data:
+        return None
+
+    gas_stats["min_block"] = int(gas_samples.block.min())
+    gas_stats["max_block"] = int(gas_samples.block.max())
+    if cached_gas_stats is not None:
+        gas_stats = {
+            **merge_gas_stats(_get_own_gas_stats(cached_gas_stats), gas_stats),
+            "min_block": cached_gas_stats["min_block"],
+            "max_block": gas_stats["max_block"],
+        }
 
-        # get transaction
-        txes = list(set(get_all_transactions_for_contract(pool, max_transactions)))
-        if len(txes) == 0:
-            RICH_CONSOLE.log(f"No transactions found for {pool.address}. Moving on.")
-            continue
+    # save gas costs to file
+    _append_gas_table_to_output_file(output_file_name, pool_addr, gas_stats)
+    return gas_stats
+
+
+def _track_for_pooling(
+    pooling: Dict,
+    pool_addr: str,
+    gas_stats: Optional[Dict],
+    gas_samples: GasSamples,
+    max_transactions: int,
+):
 
-        # truncate list if max_transactions is specified:
-        if len(txes) > max_transactions:
-            txes = txes[-max_transactions:]
+    if not gas_stats:
+        return
+
+    # merged stats count more calls than this run's gas costs:
+    if "univariate" in gas_stats:
+        pooling["counts"][pool_addr] = {
+            method: stats["count"] for method, stats in gas_stats["univariate"].items()
+        }
+    else:
+        pooling["counts"][pool_addr] = get_method_counts(gas_samples)
+    group = get_contract_store().get_group(pool_addr)
+    if not group:
+        return
+
+    # keep the newest max_transactions txes across all pools of the group:
+    group_samples = [gas_samples]
+    if group in pooling["gas_costs"]:
+        group_samples.insert(0, pooling["gas_costs"][group])
+    pooling["gas_costs"][group] = get_newest_txes(
+        concat_gas_samples(group_samples), max_transactions
+    )
+
+
+def _save_pooled_gas_stats(
+    pooling: Dict, output_file_name: str, gas_stats_methods, min_samples: int
+):
 
-        # check if we have cached gas costs for this pool. if we do
-        # then we check if the current txes > tx count in cached stats.
-        # if so, we update the cached stats:
-        blocks = list(list(zip(*txes))[0])
-        if pool.address not in cached_costs or cached_costs[pool.address][
-            "max_block"
-        ] < max(blocks):
+    # methods with fewer than min_samples calls in a pool fall back to the
+    # stats of all pools running the same implementation:
+    costs = _load_cache(output_file_name)
+    group_stats = {}
+    pooled_costs = {}
+    for pool_addr, method_counts in pooling["counts"].items():
 
-            txes = list(list(zip(*txes))[1])
-            df_gas_costs = get_gas_cost_for_txes(pool, txes)
+        group = get_contract_store().get_group(pool_addr)
+        thin_methods = get_thin_methods(method_counts, min_samples)
+        if group not in pooling["gas_costs"] or not thin_methods:
+            continue
 
-            # get gas stats:
-            gas_stats = {}
-            has_data = False
+        if group not in group_stats:
+            group_stats[group] = {}
             for gas_stats_method in gas_stats_methods:
+                group_stats[group].update(gas_stats_method(pooling["gas_costs"][group]))
 
-                gstats = gas_stats_method(df_gas_costs)
-                gas_stats_keys = list(gstats.keys())
-                if gstats[gas_stats_keys[0]]:
-                    has_data = True or has_data
-                    gas_stats[gas_stats_keys[0]] = gstats[gas_stats_keys[0]]
-
-            # save gas costs to file
-            if has_data:
-                gas_stats["min_block"] = min(blocks)
-                gas_stats["max_block"] = max(blocks)
-                _append_gas_table_to_output_file(output_file_name, pool_addr, gas_stats)
+        gas_stats = costs[pool_addr]
+        pooled_methods = fill_in_thin_methods(
+            gas_stats, group_stats[group], method_counts, thin_methods
+        )
+        if pooled_methods:
+            gas_stats["implementation"] = group
+            gas_stats["pooled_methods"] = sorted(pooled_methods)
+            pooled_costs[pool_addr] = gas_stats
+
+    if pooled_costs:
+        RICH_CONSOLE.log(
+            f"Filled in thin methods of [red]{len(pooled_costs)} pools from "
+            f"their implementation's stats."
+        )
+        _write_gas_table(output_file_name, pooled_costs)
+
+
+def _fetch_costs_and_save(
+    jobs,
+    max_transactions,
+    concurrency=1,
+    batch_size=1,
+    accumulator: Optional[PoolGasAccumulator] = None,
+    discovered_txes: Optional[Dict[str, List[Tuple[int, str]]]] = None,
+    min_samples: int = 0,
+    incremental: bool = True,
+):
+
+    pool_jobs = []
+    for pools, output_file_name, gas_stats_methods in jobs:
+        # load cache if it exists:
+        cached_costs = _load_cache(output_file_name)
+        for pool_addr in pools:
+            txes_to_update = _get_txes_to_update(
+                pool_addr,
+                max_transactions,
+                cached_costs,
+                discovered_txes,
+                incremental,
+            )
+            if txes_to_update:
+                pool_jobs.append(
+                    (
+                        pool_addr,
+                        *txes_to_update,
+                        output_file_name,
+                        gas_stats_methods,
+                        cached_costs.get(pool_addr),
+                    )
+                )
+
+    # the txes of every pool (in every job) are attributed before any pool is
+    # saved, so samples that a later pool's traces attribute to an earlier
+    # pool count for it in this run too, whatever the job order:
+    if accumulator:
+        attribute_gas_for_txes(
+            accumulator,
+            list(dict.fromkeys(tx for _, _, txes, *_ in pool_jobs for _, tx in txes)),
+            concurrency,
+            batch_size,
+        )
+
+    poolings = {}
+    for (
+        pool_addr,
+        pool,
+        txes,
+        cached_gas_stats,
+        output_file_name,
+        gas_stats_methods,
+        previous_gas_stats,
+    ) in pool_jobs:
+
+        if accumulator:
+            gas_samples = accumulator.get_gas_costs(pool, max_transactions)
         else:
+            gas_samples = get_gas_cost_for_txes(pool, txes, concurrency, batch_size)
+        gas_stats = _save_gas_stats(
+            pool_addr,
+            gas_samples,
+            output_file_name,
+            gas_stats_methods,
+            cached_gas_stats,
+            previous_gas_stats,
+        )
+        if min_samples:
+            pooling = poolings.setdefault(
+                output_file_name, {"counts": {}, "gas_costs": {}}
+            )
+            _track_for_pooling(
+                pooling, pool_addr, gas_stats, gas_samples, max_transactions
+            )
+
+    for _, output_file_name, gas_stats_methods in jobs:
+        if output_file_name in poolings:
+            _save_pooled_gas_stats(
+                poolings[output_file_name],
+                output_file_name,
+                gas_stats_methods,
+                min_samples,
+            )
+
+
+def _fetch_costs_and_save_by_block(
+    jobs,
+    max_transactions,
+    concurrency=1,
+    accumulator: Optional[PoolGasAccumulator] = None,
+    discovered_txes: Optional[Dict[str, List[Tuple[int, str]]]] = None,
+    min_samples: int = 0,
+    incremental: bool = True,
+):
+
+    # discover txes for every pool first, so that blocks shared between pools
+    # (even pools in different output files) are only traced once:
+    pool_txes = {}
+    pool_outputs = {}
+    pool_cached_gas_stats = {}
+    pool_previous_gas_stats = {}
+    for pools, output_file_name, gas_stats_methods in jobs:
+        cached_costs = _load_cache(output_file_name)
+        for pool_addr in pools:
+            txes_to_update = _get_txes_to_update(
+                pool_addr,
+                max_transactions,
+                cached_costs,
+                discovered_txes,
+                incremental,
+            )
+            if txes_to_update:
+                pool, txes, cached_gas_stats = txes_to_update
+                pool_txes[pool_addr] = (pool, txes)
+                pool_outputs[pool_addr] = (output_file_name, gas_stats_methods)
+                pool_cached_gas_stats[pool_addr] = cached_gas_stats
+                pool_previous_gas_stats[pool_addr] = cached_costs.get(pool_addr)
+
+    if not pool_txes:
+        return
+
+    if accumulator:
+        attribute_gas_for_txes_by_block(
+            accumulator,
+            [tx for _, txes in pool_txes.values() for tx in txes],
+            concurrency,
+        )
+        gas_costs = (
+            (pool_addr, accumulator.get_gas_costs(pool, max_transactions))
+            for pool_addr, (pool, _) in pool_txes.items()
+        )
+    else:
+        gas_costs = get_gas_cost_for_pools_by_block(pool_txes, concurrency).items()
+
+    poolings = {}
+    for pool_addr, gas_samples in gas_costs:
+        output_file_name, gas_stats_methods = pool_outputs[pool_addr]
+        gas_stats = _save_gas_stats(
+            pool_addr,
+            gas_samples,
+            output_file_name,
+            gas_stats_methods,
+            pool_cached_gas_stats[pool_addr],
+            pool_previous_gas_stats[pool_addr],
+        )
+        if min_samples:
+            pooling = poolings.setdefault(
+                output_file_name, {"counts": {}, "gas_costs": {}}
+            )
+            _track_for_pooling(
+                pooling, pool_addr, gas_stats, gas_samples, max_transactions
+            )
+
+    for _, output_file_name, gas_stats_methods in jobs:
+        if output_file_name in poolings:
+            _save_pooled_gas_stats(
+                poolings[output_file_name],
+                output_file_name,
+                gas_stats_methods,
+                min_samples,
+            )
 
-            RICH_CONSOLE.log("Pool cached with similar gas stats. Moving on.")
+
+def _get_pool_type_settings(pool_type: str) -> Dict:
+
+    settings = {}
+    match pool_type:
+        case "stableswap":
+            settings["pool_getter"] = [get_stableswap_registry_pools]
+            settings["output_file_name"] = [STABLESWAP_GAS_TABLE_FILE]
+            settings["statmethods"] = [
+                [
+                    compute_univariate_gaussian_gas_stats_for_txes,
+                    compute_quantile_sketch_gas_stats_for_txes,
+                    compute_rolling_gas_stats_for_txes,
+                ]
+            ]
+        case "cryptoswap":
+            settings["pool_getter"] = [get_cryptoswap_registry_pools]
+            settings["output_file_name"] = [CRYPTOSWAP_GAS_TABLE_FILE]
+            settings["statmethods"] = [
+                [
+                    compute_univariate_gaussian_gas_stats_for_txes,
+                    compute_quantile_sketch_gas_stats_for_txes,
+                    compute_rolling_gas_stats_for_txes,
+                    compute_bimodal_gaussian_gas_stats_for_txes,
+                    compute_mixture_gas_stats_for_txes,
+                ]
+            ]
+        case "all":
+            settings = {
+                "pool_getter": [
+                    get_stableswap_registry_pools,
+                    get_cryptoswap_registry_pools,
+                ],
+                "output_file_name": [
+                    STABLESWAP_GAS_TABLE_FILE,
+                    CRYPTOSWAP_GAS_TABLE_FILE,
+                ],
+                "statmethods": [
+                    [
+                        compute_univariate_gaussian_gas_stats_for_txes,
+                        compute_quantile_sketch_gas_stats_for_txes,
+                        compute_rolling_gas_stats_for_txes,
+                    ],
+                    [
+                        compute_univariate_gaussian_gas_stats_for_txes,
+                        compute_quantile_sketch_gas_stats_for_txes,
+                        compute_rolling_gas_stats_for_txes,
+                        compute_bimodal_gaussian_gas_stats_for_txes,
+                        compute_mixture_gas_stats_for_txes,
+                    ],
+                ],
+            }
+        case _:
+            RICH_CONSOLE.print(
+                "[red]Invalid pool type. " "Must be either stableswap or cryptoswap"
+            )
+            return {}
+
+    return settings
 
 
 @click.group(short_help="Gets average gas costs for contracts")
@@ -147,49 +521,119 @@ def cli():
     help="Type of pool to get gas costs for. Must be either stableswap or cryptoswap",
     type=str,
 )
-def pool_gas_stats(network, max_transactions, pool, pool_type):
+@click.option(
+    "--concurrency",
+    "-c",
+    required=False,
+    help="Number of trace requests to keep in flight at once",
+    type=int,
+    default=1,
+)
+@click.option(
+    "--batch_size",
+    "-b",
+    required=False,
+    help="Number of trace_transaction calls to pack into one JSON-RPC batch",
+    type=int,
+    default=1,
+)
+@click.option(
+    "--fetch_mode",
+    "-f",
+    required=False,
+    help=(
+        "tx: trace each transaction separately. block: trace whole blocks "
+        "with trace_block and share them between all pools"
+    ),
+    type=click.Choice(["tx", "block"]),
+    default="tx",
+)
+@click.option(
+    "--attribute_all_pools",
+    "-a",
+    is_flag=True,
+    default=False,
+    help=(
+        "Walk each trace once and attribute its gas to every registry pool in "
+        "it, not just the pool the tx was found for"
+    ),
+)
+@click.option(
+    "--discovery_mode",
+    "-d",
+    required=False,
+    help=(
+        "pool: scan logs for each pool separately. bulk: scan logs for all "
+        "pools at once, with many pool addresses in each eth_getLogs filter"
+    ),
+    type=click.Choice(["pool", "bulk"]),
+    default="pool",
+)
+@click.option(
+    "--min_samples",
+    "-ms",
+    required=False,
+    help=(
+        "Methods with fewer calls in a pool use the stats of all pools "
+        "running the same implementation. 0 disables pooling"
+    ),
+    type=int,
+    default=100,
+)
+@click.option(
+    "--full_refresh",
+    is_flag=True,
+    default=False,
+    help=(
+        "Recompute stats from the newest max_transactions txes instead of "
+        "folding new txes into the cached stats"
+    ),
+)
+@click.option(
+    "--max_components",
+    "-k",
+    required=False,
+    help=(
+        "Cryptoswap pools: fit mixtures with 1 to max_components components "
+        "per method and keep the best one by BIC"
+    ),
+    type=int,
+    default=DEFAULT_MAX_COMPONENTS,
+)
+@click.option(
+    "--mixture_workers",
+    required=False,
+    help="Number of processes to fit mixtures in",
+    type=int,
+    default=os.cpu_count(),
+)
+@trace_cache_options
+@event_index_options
+@sample_store_options
+@rolling_stats_options
+@estimate_store_options
+def pool_gas_stats(
+    network,
+    max_transactions,
+    pool,
+    pool_type,
+    concurrency,
+    batch_size,
+    fetch_mode,
+    attribute_all_pools,
+    discovery_mode,
+    min_samples,
+    full_refresh,
+    max_components,
+    mixture_workers,
+):
 
-    settings = {}
-    match pool_type:
-        case "stableswap":
-            settings["pool_getter"] = [get_stableswap_registry_pools]
-            settings["output_file_name"] = [STABLESWAP_GAS_TABLE_FILE]
-            settings["statmethods"] = [[compute_univariate_gaussian_gas_stats_for_txes]]
-        case "cryptoswap":
-            settings["pool_getter"] = [get_cryptoswap_registry_pools]
-            settings["output_file_name"] = [CRYPTOSWAP_GAS_TABLE_FILE]
-            settings["statmethods"] = [
-                [
-                    compute_univariate_gaussian_gas_stats_for_txes,
-                    compute_bimodal_gaussian_gas_stats_for_txes,
-                ]
-            ]
-        case "all":
-            settings = {
-                "pool_getter": [
-                    get_stableswap_registry_pools,
-                    get_cryptoswap_registry_pools,
-                ],
-                "output_file_name": [
-                    STABLESWAP_GAS_TABLE_FILE,
-                    CRYPTOSWAP_GAS_TABLE_FILE,
-                ],
-                "statmethods": [
-                    [compute_univariate_gaussian_gas_stats_for_txes],
-                    [
-                        compute_univariate_gaussian_gas_stats_for_txes,
-                        compute_bimodal_gaussian_gas_stats_for_txes,
-                    ],
-                ],
-            }
-        case _:
-            RICH_CONSOLE.print(
-                "[red]Invalid pool type. Must be either stableswap or cryptoswap"
-            )
-            return
+    configure_mixture_selection(max_components, mixture_workers)
 
+    settings = _get_pool_type_settings(pool_type)
     if settings:
 
+        jobs = []
         for i in range(len(settings["pool_getter"])):
 
             pool_getter = settings["pool_getter"][i]
@@ -202,13 +646,214 @@ def pool_gas_stats(network, max_transactions, pool, pool_type):
             else:
                 pools = [pool]
 
+            jobs.append((pools, output_file_name, statmethods))
+
+        # pools running the same implementation share one ABI (and stats for
+        # their thin methods):
+        group_by_implementation(
+            list(
+                dict.fromkeys(pool_addr for pools, _, _ in jobs for pool_addr in pools)
+            )
+        )
+
+        # the accumulator knows every pool in every job, so a trace fetched
+        # for a stableswap pool also counts for the cryptoswap pools in it:
+        accumulator = None
+        if attribute_all_pools:
+            accumulator = PoolGasAccumulator(
+                [pool_addr for pools, _, _ in jobs for pool_addr in pools]
+            )
+
+        discovered_txes = None
+        if discovery_mode == "bulk":
+            discovered_txes = get_transactions_for_contracts(
+                list(
+                    dict.fromkeys(
+                        pool_addr for pools, _, _ in jobs for pool_addr in pools
+                    )
+                ),
+                max_transactions,
+            )
+
+        if fetch_mode == "block":
+            _fetch_costs_and_save_by_block(
+                jobs,
+                max_transactions,
+                concurrency,
+                accumulator,
+                discovered_txes,
+                min_samples,
+                not full_refresh,
+            )
+        else:
             _fetch_costs_and_save(
-                pools,
+                jobs,
                 max_transactions,
+                concurrency,
+                batch_size,
+                accumulator,
+                discovered_txes,
+                min_samples,
+                not full_refresh,
+            )
+
+        _export_gas_tables(settings["output_file_name"])
+
+
+@cli.command(
+    cls=ape.cli.NetworkBoundCommand,
+    name="recompute",
+    short_help=(
+        "Recompute gas stats of pools from the gas sample store, " "without tracing"
+    ),
+)
+@ape.cli.network_option()
+@click.option(
+    "--pool_type",
+    "-pt",
+    required=True,
+    help=(
+        "Type of pools to recompute. " "Must be either stableswap, cryptoswap or all"
+    ),
+    type=click.Choice(["stableswap", "cryptoswap", "all"]),
+)
+@click.option(
+    "--pool",
+    "-p",
+    required=False,
+    help=(
+        "Pool address to recompute. " "If specified, then it does not check registry"
+    ),
+    type=str,
+    default="",
+)
+@click.option(
+    "--max_transactions",
+    "-ma",
+    required=False,
+    help="Max number of (newest) stored transactions to use",
+    type=int,
+    default=10000,
+)
+@click.option(
+    "--min_block",
+    required=False,
+    help="Only use samples from this block on",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--max_block",
+    required=False,
+    help="Only use samples up to this block",
+    type=int,
+    default=None,
+)
+@sample_store_options
+@rolling_stats_options
+@estimate_store_options
+def recompute_gas_stats(
+    network, pool_type, pool, max_transactions, min_block, max_block
+):
+
+    sample_store = get_sample_store()
+    if sample_store is None:
+        RICH_CONSOLE.print("[red]No gas sample store to recompute from.")
+        return
+
+    settings = _get_pool_type_settings(pool_type)
+    stored_pools = set(sample_store.get_pools())
+    for pool_getter, output_file_name, gas_stats_methods in zip(
+        settings["pool_getter"],
+        settings["output_file_name"],
+        settings["statmethods"],
+    ):
+
+        pools = [pool] if pool else pool_getter()
+        cached_costs = _load_cache(output_file_name)
+        for pool_addr in pools:
+
+            if pool_addr.lower() not in stored_pools:
+                continue
+            try:
+                contract = get_contract(pool_addr)
+            except ape.exceptions.ChainError:
+                continue
+
+            RICH_CONSOLE.log(f"Recomputing gas stats for [blue]{pool_addr} ...")
+            samples = sample_store.scan(
+                pool_addr, min_block=min_block, max_block=max_block
+            )
+            _save_gas_stats(
+                pool_addr,
+                get_gas_costs_from_samples(contract, samples, max_transactions),
                 output_file_name,
-                statmethods,
+                gas_stats_methods,
+                previous_gas_stats=cached_costs.get(pool_addr),
             )
 
+    _export_gas_tables(settings["output_file_name"])
+
+
+@cli.command(
+    name="export",
+    short_help=("Export gas estimates from the estimate store to the JSON files"),
+)
+@click.option(
+    "--pool_type",
+    "-pt",
+    required=True,
+    help=("Type of pools to export. " "Must be either stableswap, cryptoswap or all"),
+    type=click.Choice(["stableswap", "cryptoswap", "all"]),
+)
+@estimate_store_options
+def export_gas_stats(pool_type):
+
+    settings = _get_pool_type_settings(pool_type)
+    _export_gas_tables(settings["output_file_name"])
+
+
+@cli.command(
+    cls=ape.cli.NetworkBoundCommand,
+    name="contract_types",
+    short_help=("Prefetch contract types of registry pools into the contract store"),
+)
+@ape.cli.network_option()
+@click.option(
+    "--pool_type",
+    "-pt",
+    required=True,
+    help=("Type of pools to prefetch. " "Must be either stableswap, cryptoswap or all"),
+    type=click.Choice(["stableswap", "cryptoswap", "all"]),
+)
+@click.option(
+    "--requests_per_second",
+    "-r",
+    required=False,
+    help="Max number of explorer lookups per second",
+    type=float,
+    default=DEFAULT_REQUESTS_PER_SECOND,
+)
+@click.option(
+    "--retry_unavailable",
+    is_flag=True,
+    default=False,
+    help="Look up contracts that were unverified or broken last time again",
+)
+def prefetch_pool_contract_types(
+    network, pool_type, requests_per_second, retry_unavailable
+):
+
+    pools = []
+    if pool_type in ["stableswap", "all"]:
+        pools.extend(get_stableswap_registry_pools())
+    if pool_type in ["cryptoswap", "all"]:
+        pools.extend(get_cryptoswap_registry_pools())
+
+    pools = list(dict.fromkeys(pools))
+    group_by_implementation(pools)  # one lookup per implementation
+    prefetch_contract_types(pools, requests_per_second, retry_unavailable)
+
 
 # ---- read only ---- #
 
@@ -223,7 +868,7 @@ def pool_gas_stats(network, max_transactions, pool, pool_type):
 @click.option("--tx", "-t", required=True, help="Transaction hash", type=str)
 def get_gas_costs_tx(network, contractaddr, tx):
 
-    contract = ape.Contract(contractaddr)
+    contract = get_contract(contractaddr)
     call_tree = get_calltree(tx_hash=tx)
     if call_tree:
         rich_call_tree = parse_as_tree(
@@ -7,7 +7,10 @@ from rich.console import Console as RichConsole
 
 from scripts.utils.call_tree_parser_utils import get_calltree
 from scripts.utils.call_tree_parsers import parse_math_calls
-from scripts.utils.transactions_getter import get_all_transactions_for_contract
+from scripts.utils.contract_store import get_contract
+from scripts.utils.event_index import (event_index_options,
+                                       get_transactions_for_contract)
+from scripts.utils.trace_cache import trace_cache_options
 
 CURVE_CRYPTO_MATH = "0x8F68f4810CcE3194B6cB6F3d50fa58c2c9bDD1d5"
 TRICRYPTO2 = "0xD51a44d3FaE010294C616388b506AcdA1bfAAE46"
@@ -43,20 +46,18 @@ def cli():
     help="Max number of txes",
     type=int,
 )
+@trace_cache_options
+@event_index_options
 def crypto_math_data_fetcher(network, max_transactions):
 
     math_contract = ape.project.CurveCryptoMath.at(CURVE_CRYPTO_MATH)
-    tricrypto2_contract = ape.Contract(TRICRYPTO2)
+    tricrypto2_contract = get_contract(TRICRYPTO2)
     geometric_mean_data = pd.DataFrame(
         columns=["tx", "x0", "x1", "x2", "output"]
     )
 
-    # get transaction
-    txes = list(
-        set(get_all_transactions_for_contract(tricrypto2_contract, max_transactions))
-    )
-    if len(txes) > max_transactions:
-        txes = txes[:max_transactions]  # truncate to max_transactions
+    # get the newest max_transactions txes, in block order:
+    txes = get_transactions_for_contract(tricrypto2_contract, max_transactions)
 
     RICH_CONSOLE.log(
         "[yellow]Getting newton_y and newton_D inputs and outputs ..."
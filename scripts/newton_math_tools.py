@@ -8,7 +8,10 @@ from rich.console import Console as RichConsole
 
 from scripts.utils.call_tree_parser_utils import get_calltree
 from scripts.utils.call_tree_parsers import parse_as_tree, parse_math_calls
-from scripts.utils.transactions_getter import get_all_transactions_for_contract
+from scripts.utils.contract_store import get_contract
+from scripts.utils.event_index import (event_index_options,
+                                       get_transactions_for_contract)
+from scripts.utils.trace_cache import trace_cache_options
 
 CURVE_CRYPTO_MATH = "0x8F68f4810CcE3194B6cB6F3d50fa58c2c9bDD1d5"
 TRICRYPTO2 = "0xD51a44d3FaE010294C616388b506AcdA1bfAAE46"
@@ -53,6 +56,8 @@ def cli():
     help="Max block height",
     type=int,
 )
+@trace_cache_options
+@event_index_options
 def crypto_math_data_fetcher(network, max_transactions, max_block):
 
     RICH_CONSOLE.log(
@@ -60,7 +65,7 @@ def crypto_math_data_fetcher(network, max_transactions, max_block):
     )
 
     math_contract = ape.project.CurveCryptoMath.at(CURVE_CRYPTO_MATH)
-    tricrypto2_contract = ape.Contract(TRICRYPTO2)
+    tricrypto2_contract = get_contract(TRICRYPTO2)
 
     newton_y_data = pd.DataFrame(
         columns=["tx", "ANN", "gamma", "x0", "x1", "x2", "D", "i", "output"]
@@ -77,16 +82,10 @@ def crypto_math_data_fetcher(network, max_transactions, max_block):
         ]
     )
 
-    # get transaction
-    txes = list(
-        set(
-            get_all_transactions_for_contract(
-                tricrypto2_contract, max_transactions, max_block
-            )
-        )
+    # get the newest max_transactions txes before max_block, in block order:
+    txes = get_transactions_for_contract(
+        tricrypto2_contract, max_transactions, max_block
     )
-    if len(txes) > max_transactions:
-        txes = txes[:max_transactions]  # truncate to max_transactions
 
     RICH_CONSOLE.log("[yellow]Getting newton_y and newton_D inputs and outputs ...")
     for txid, tx in enumerate(txes):
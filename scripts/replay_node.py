@@ -0,0 +1,81 @@
+import sys
+import time
+
+import click
+from rich.console import Console as RichConsole
+
+from scripts.utils.replay_node import (ReplayCorpus, ReplayNode,
+                                       start_replay_node)
+
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+
+@click.group(short_help="Local JSON-RPC node that replays recorded responses")
+def cli():
+    """
+    Command-line helper for serving a recorded corpus of node responses
+    """
+
+
+@cli.command(
+    name="serve",
+    short_help=("Serve eth_getLogs, trace_* and eth_call responses from a corpus"),
+)
+@click.option(
+    "--corpus",
+    "-c",
+    required=True,
+    help="Corpus directory",
+    type=str,
+)
+@click.option("--host", default="127.0.0.1", help="Host to bind to", type=str)
+@click.option("--port", "-p", default=8545, help="Port to bind to", type=int)
+@click.option(
+    "--latency_ms",
+    default=0.0,
+    help="Injected latency per HTTP request (round trip)",
+    type=float,
+)
+@click.option(
+    "--call_latency_ms",
+    default=0.0,
+    help=("Injected latency per JSON-RPC call " "(node work, paid per batch entry)"),
+    type=float,
+)
+@click.option(
+    "--error_rate",
+    default=0.0,
+    help="Fraction of JSON-RPC calls that get an injected error",
+    type=float,
+)
+@click.option(
+    "--upstream",
+    "-u",
+    default="",
+    help=(
+        "Archive node to forward unknown calls to. " "Forwarded responses are recorded"
+    ),
+    type=str,
+)
+def serve(host, port, corpus, latency_ms, call_latency_ms, error_rate, upstream):
+
+    replay_corpus = ReplayCorpus(corpus)
+    node = ReplayNode(
+        replay_corpus,
+        latency_ms=latency_ms,
+        call_latency_ms=call_latency_ms,
+        error_rate=error_rate,
+        upstream_uri=upstream or None,
+    )
+    server = start_replay_node(node, host, port)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        RICH_CONSOLE.log("Shutting down ...")
+    finally:
+        server.shutdown()
+        RICH_CONSOLE.print_json(data=node.stats())
+        if upstream:
+            replay_corpus.save()
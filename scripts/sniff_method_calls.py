@@ -6,7 +6,10 @@ from rich.console import Console as RichConsole
 
 from scripts.utils.call_tree_parser_utils import get_calltree
 from scripts.utils.call_tree_parsers import get_method_invokes_in_call_tree
-from scripts.utils.transactions_getter import get_all_transactions_for_contract
+from scripts.utils.contract_store import get_contract
+from scripts.utils.event_index import (event_index_options,
+                                       get_transactions_for_contract)
+from scripts.utils.trace_cache import trace_cache_options
 
 CURVE_CRYPTO_MATH = "0x8F68f4810CcE3194B6cB6F3d50fa58c2c9bDD1d5"
 TRICRYPTO2 = "0xD51a44d3FaE010294C616388b506AcdA1bfAAE46"
@@ -78,28 +81,27 @@ def cli():
     type=str,
     help="Text file to write output to",
 )
+@trace_cache_options
+@event_index_options
 def sniff(network, contracts, max_transactions, max_block, methods, output_file):
 
     RICH_CONSOLE.log(
         f"[red]MAX BLOCK HEIGHT is set to merge block height: {MERGE_BLOCK_HEIGHT}"
     )
 
+    # look contracts up once, not for every tx:
+    contracts = [get_contract(contract) for contract in contracts]
+
     # get transaction
-    txes = []
+    txes = set()
     for contract in contracts:
-        contract = ape.Contract(contract)
-        txes.extend(
-            list(
-                set(
-                    get_all_transactions_for_contract(
-                        contract, max_transactions, max_block
-                    )
-                )
-            )
+        txes.update(
+            get_transactions_for_contract(contract, max_transactions, max_block)
         )
 
-    if len(txes) > max_transactions:
-        txes = txes[:max_transactions]  # truncate to max_transactions
+    # keep the newest max_transactions txes across all contracts, in block
+    # order:
+    txes = sorted(txes)[-max_transactions:]
 
     sus_txes = []
     for txid, tx in enumerate(txes):
@@ -112,7 +114,6 @@ def sniff(network, contracts, max_transactions, max_block, methods, output_file)
 
         contract_methods_called = []
         for contract in contracts:
-            contract = ape.Contract(contract)
             contract_methods_called.extend(
                 get_method_invokes_in_call_tree(
                     contract=contract,
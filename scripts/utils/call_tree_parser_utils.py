@@ -2,14 +2,15 @@
 # this is just a functional version of their object oriented call trace parser
 
 import sys
+import threading
 from collections import namedtuple
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import ape
+import requests
 from ape.api import EcosystemAPI
 from ape.exceptions import ContractError, DecodingError
-from ape.utils.abi import Struct, parse_type
-from eth_abi import decode_abi
+from ape.utils.abi import Struct
 from eth_abi.exceptions import InsufficientDataBytes
 from eth_utils import humanize_hash, is_hex_address
 from ethpm_types import HexBytes
@@ -21,8 +22,15 @@ from evm_trace.display import DisplayableCallTreeNode
 from hexbytes import HexBytes
 from rich.console import Console as RichConsole
 
+from scripts.utils.fast_json import json_dumps, json_loads
+from scripts.utils.selector_index import (MethodEntry, decode_inputs,
+                                          get_method_entry)
+from scripts.utils.trace_cache import get_trace_cache
+
+BATCH_REQUEST_TIMEOUT = 120
 CallInfo = namedtuple("call", ["address", "gas_cost", "method_id", "calldata"])
 RICH_CONSOLE = RichConsole(file=sys.stdout)
+_THREAD_LOCAL = threading.local()
 
 
 class CallInfoParser(DisplayableCallTreeNode):
@@ -40,56 +48,216 @@ class CallInfoParser(DisplayableCallTreeNode):
 def attempt_decode_call_signature(contract: ape.Contract, selector: str):
 
     # decode method id (or at least try):
-    method = selector.hex()
-    if selector in contract.contract_type.mutable_methods:
-        method = contract.contract_type.mutable_methods[selector]
-        return method.name or f"<{selector}>"
-    elif selector in contract.contract_type.view_methods:
-        method = contract.contract_type.view_methods[selector]
-        return method.name or f"<{selector}>"
-    else:
-        return method
+    method = get_method_entry(contract, selector)
+    if method is None:
+        return selector.hex()
 
+    return method.name or f"<{selector.hex()}>"
 
-def get_calltree(tx_hash: str) -> Optional[CallTreeNode]:
 
-    web3 = ape.chain.provider.web3
-    raw_trace_list = web3.manager.request_blocking("trace_transaction", [tx_hash])
+def get_calltree_from_raw_trace(
+    raw_trace_list: List[Dict],
+) -> Optional[CallTreeNode]:
+
+    if not raw_trace_list:
+        return None
+
     parity_trace = ParityTraceList.parse_obj(raw_trace_list)
     tree = get_calltree_from_parity_trace(parity_trace, display_cls=CallInfoParser)
 
     return tree
 
 
+def get_raw_trace(tx_hash: str) -> List[Dict]:
+
+    trace_cache = get_trace_cache()
+    if trace_cache:
+        raw_trace_list = trace_cache.get(tx_hash)
+        if raw_trace_list is not None:
+            return raw_trace_list
+
+    web3 = ape.chain.provider.web3
+    raw_trace_list = web3.manager.request_blocking("trace_transaction", [tx_hash])
+
+    if trace_cache:
+        trace_cache.put(tx_hash, raw_trace_list)
+
+    return raw_trace_list
+
+
+def get_calltree(tx_hash: str) -> Optional[CallTreeNode]:
+
+    raw_trace_list = get_raw_trace(tx_hash)
+    return get_calltree_from_raw_trace(raw_trace_list)
+
+
+def split_block_trace(raw_block_trace: List[Dict]) -> Dict[str, List[Dict]]:
+
+    raw_traces = {}
+    for trace in raw_block_trace:
+        tx_hash = trace.get("transactionHash")
+        if tx_hash is None:  # block and uncle rewards
+            continue
+        raw_traces.setdefault(tx_hash.lower(), []).append(trace)
+
+    return raw_traces
+
+
+def get_raw_traces_in_block(
+    block_number: int, tx_hashes: List[str]
+) -> List[Optional[List[Dict]]]:
+    """
+    Fetch parity traces for transactions mined in the same block with a single
+    ``trace_block`` call. Every transaction trace in the block goes into the
+    trace cache, not just the ones asked for.
+
+    Args:
+        block_number (int): block the transactions were mined in.
+        tx_hashes (List[str]): transaction hashes to return traces for.
+
+    Returns:
+        List: raw parity trace lists in the same order as ``tx_hashes``.
+    """
+    trace_cache = get_trace_cache()
+    cached_traces = trace_cache.get_many(tx_hashes) if trace_cache else {}
+    if all(tx in cached_traces for tx in tx_hashes):
+        return [cached_traces[tx] for tx in tx_hashes]
+
+    web3 = ape.chain.provider.web3
+    try:
+        raw_block_trace = web3.manager.request_blocking(
+            "trace_block", [hex(block_number)]
+        )
+    except ValueError as e:
+        RICH_CONSOLE.log(
+            f"[yellow]Could not trace block [blue]{block_number}: {e}. "
+            "Tracing its transactions one by one."
+        )
+        return get_raw_traces(tx_hashes)
+
+    raw_traces = split_block_trace(raw_block_trace or [])
+    if trace_cache:
+        trace_cache.put_many(raw_traces)
+
+    return [cached_traces.get(tx) or raw_traces.get(tx.lower()) for tx in tx_hashes]
+
+
+def _get_session() -> requests.Session:
+
+    # requests sessions are not thread safe, so each fetch thread gets its own:
+    if not hasattr(_THREAD_LOCAL, "session"):
+        _THREAD_LOCAL.session = requests.Session()
+
+    return _THREAD_LOCAL.session
+
+
+def post_batch(method: str, params: List[List]) -> List[Dict]:
+
+    endpoint_uri = ape.chain.provider.web3.provider.endpoint_uri
+    payload = [
+        {"jsonrpc": "2.0", "id": idx, "method": method, "params": param}
+        for idx, param in enumerate(params)
+    ]
+    response = _get_session().post(
+        endpoint_uri,
+        data=json_dumps(payload),
+        headers={
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        },
+        timeout=BATCH_REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+
+    # requests inflates compressed bodies transparently:
+    responses = json_loads(response.content)
+    if not isinstance(responses, list):
+        # nodes reply with a single error object if they refuse the whole batch
+        raise ValueError(f"Batch request rejected: {responses}")
+
+    return responses
+
+
+def get_raw_traces(tx_hashes: List[str]) -> List[Optional[List[Dict]]]:
+    """
+    Fetch parity traces for several transactions. Traces found in the trace
+    cache are served from disk, the rest are fetched in a single JSON-RPC
+    batch.
+
+    Args:
+        tx_hashes (List[str]): transaction hashes to trace.
+
+    Returns:
+        List: raw parity trace lists in the same order as ``tx_hashes``.
+            Entries that the node failed to trace are ``None``.
+    """
+    trace_cache = get_trace_cache()
+    if not trace_cache:
+        return _fetch_raw_traces(tx_hashes)
+
+    cached_traces = trace_cache.get_many(tx_hashes)
+    missing_txes = [tx for tx in tx_hashes if tx not in cached_traces]
+    fetched_traces = dict(zip(missing_txes, _fetch_raw_traces(missing_txes)))
+    trace_cache.put_many(fetched_traces)
+
+    return [cached_traces.get(tx) or fetched_traces.get(tx) for tx in tx_hashes]
+
+
+def _fetch_raw_traces(tx_hashes: List[str]) -> List[Optional[List[Dict]]]:
+
+    if not tx_hashes:
+        return []
+
+    try:
+        responses = post_batch("trace_transaction", [[tx] for tx in tx_hashes])
+    except (requests.RequestException, ValueError) as e:
+        if len(tx_hashes) == 1:
+            RICH_CONSOLE.log(f"[red]Could not trace tx [bold blue]{tx_hashes[0]}: {e}")
+            return [None]
+
+        # split the batch so one bad request only costs a single trace:
+        mid = len(tx_hashes) // 2
+        return _fetch_raw_traces(tx_hashes[:mid]) + _fetch_raw_traces(tx_hashes[mid:])
+
+    raw_traces = [None] * len(tx_hashes)
+    for response in responses:
+        idx = response.get("id")
+        if not isinstance(idx, int) or not 0 <= idx < len(tx_hashes):
+            continue
+
+        if "error" in response:
+            RICH_CONSOLE.log(
+                f"[red]Could not trace tx [bold blue]{tx_hashes[idx]}: "
+                f"{response['error']}"
+            )
+            continue
+
+        raw_traces[idx] = response.get("result")
+
+    return raw_traces
+
+
 def decode_calldata(
-    method: MethodABI,
+    method: MethodEntry,
     raw_data: bytes,
     _ecosystem: EcosystemAPI,
     _chain_manager: ape.managers.chain.ChainManager,
 ) -> Dict:
-    input_types = [i.canonical_type for i in method.inputs]  # type: ignore
 
     try:
-        raw_input_values = decode_abi(input_types, raw_data)
+        raw_input_values = decode_inputs(method, raw_data)
         input_values = [
             decode_value(
-                _ecosystem.decode_primitive_value(v, parse_type(t)),
+                _ecosystem.decode_primitive_value(v, t),
                 _ecosystem,
                 _chain_manager,
             )
-            for v, t in zip(raw_input_values, input_types)
+            for v, t in zip(raw_input_values, method.input_parsed_types)
         ]
     except (DecodingError, InsufficientDataBytes):
-        input_values = ["<?>" for _ in input_types]
-
-    arguments = {}
-    index = 0
-    for i, v in zip(method.inputs, input_values):
-        name = i.name or f"{index}"
-        arguments[name] = v
-        index += 1
+        input_values = ["<?>" for _ in method.input_types]
 
-    return arguments
+    return dict(zip(method.input_names, input_values))
 
 
 def decode_returndata(
@@ -7,7 +7,6 @@ from ape.exceptions import ContractError, DecodingError
 from ape.utils.trace import (_DEFAULT_INDENT, _DEFAULT_TRACE_GAS_PATTERN,
                              _DEFAULT_WRAP_THRESHOLD, TraceStyles,
                              _MethodTraceSignature)
-from eth_abi import decode_abi
 from eth_abi.exceptions import InsufficientDataBytes
 from evm_trace import CallTreeNode
 from evm_trace.base import CallTreeNode
@@ -15,8 +14,10 @@ from evm_trace.display import DisplayableCallTreeNode
 from rich.console import Console as RichConsole
 from rich.tree import Tree
 
-from scripts.utils.call_tree_parser_utils import (
-    attempt_decode_call_signature, decode_calldata, decode_returndata)
+from scripts.utils.call_tree_parser_utils import (decode_calldata,
+                                                  decode_returndata)
+from scripts.utils.selector_index import (decode_inputs, decode_outputs,
+                                          get_method_entry, get_selector_index)
 
 RICH_CONSOLE = RichConsole(file=sys.stdout)
 
@@ -30,8 +31,8 @@ def parse_math_calls(
 
     _ecosystem = ape.networks.ecosystems["ethereum"]
     address = _ecosystem.decode_address(call.address)
-    selector = call.calldata[:4]
-    method = attempt_decode_call_signature(math_contract, selector)
+    method_entry = get_method_entry(math_contract, call.calldata[:4])
+    method = method_entry.name if method_entry else None
     parsed_math_calls = []
 
     # we only parse math contracts and ignore failed txes:
@@ -41,22 +42,18 @@ def parse_math_calls(
         and method in methods_to_parse
     ):
 
-        # only highlight contract addresses if they are in highlight_contracts
-        raw_calldata = call.calldata[4:]
-
-        # get math method name:
-        method_abi = math_contract.contract_type.view_methods[selector]
-
-        # get math args:
-        input_types = [i.canonical_type for i in method_abi.inputs]  # type: ignore
-        raw_input_values = decode_abi(input_types, raw_calldata)
+        # get math args, with the method's precompiled decoders:
+        raw_input_values = decode_inputs(method_entry, call.calldata[4:])
         arguments = [
-            _ecosystem.decode_primitive_value(v, ape.utils.abi.parse_type(t))
-            for v, t in zip(raw_input_values, input_types)
+            _ecosystem.decode_primitive_value(v, t)
+            for v, t in zip(raw_input_values, method_entry.input_parsed_types)
         ]
 
         # get returndata:
-        return_value = _ecosystem.decode_returndata(method_abi, call.returndata)[0]
+        return_value = _ecosystem.decode_primitive_value(
+            decode_outputs(method_entry, call.returndata)[0],
+            method_entry.output_parsed_types[0],
+        )
 
         # compile into return dict:
         parsed_math_calls.append(
@@ -143,11 +140,9 @@ def parse_as_tree(call: CallTreeNode, highlight_contracts: List[str]) -> Tree:
             except ContractError:
                 contract_name = contract_type.name
 
-        if selector in contract_type.mutable_methods:
-            method = contract_type.mutable_methods[selector]
-        elif selector in contract_type.view_methods:
-            method = contract_type.view_methods[selector]
-
+        method = get_selector_index(address, contract_type).get(
+            int.from_bytes(selector, "big")
+        )
         if method:
             raw_calldata = call.calldata[4:]
             arguments = decode_calldata(
@@ -158,7 +153,7 @@ def parse_as_tree(call: CallTreeNode, highlight_contracts: List[str]) -> Tree:
             try:
                 return_value = (
                     decode_returndata(
-                        method, call.returndata, _ecosystem, _chain_manager
+                        method.abi, call.returndata, _ecosystem, _chain_manager
                     )
                     if not call.failed
                     else None
@@ -223,21 +218,12 @@ def get_method_invokes_in_call_tree(
     
     method_called = []
 
-    selector = call.calldata[:4]
-
-    method = None
-    if selector in contract.contract_type.mutable_methods:
-        method = contract.contract_type.mutable_methods[selector]
-    elif selector in contract.contract_type.view_methods:
-        method = contract.contract_type.view_methods[selector]
-
+    method = get_method_entry(contract, call.calldata[:4])
     if method:
 
-        method = attempt_decode_call_signature(contract, selector)
-
         # increase num_calls if method is invoked
-        if not call.failed and method in methods_to_check:
-            method_called.append(method)
+        if not call.failed and method.name in methods_to_check:
+            method_called.append(method.name)
 
     for sub_call in call.calls:
 
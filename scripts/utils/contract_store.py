@@ -0,0 +1,379 @@
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import ape
+from eth_utils import keccak
+from ethpm_types import ContractType
+from rich.console import Console as RichConsole
+
+from scripts.utils.call_tree_parser_utils import post_batch
+from scripts.utils.fast_json import json_dumps, json_loads
+from scripts.utils.selector_index import set_selector_index_key
+
+CONTRACT_STORE_DIR = "./contract_types"
+UNAVAILABLE_FILE = "unavailable.json"
+IMPLEMENTATIONS_FILE = "implementations.json"
+GET_CODE_BATCH_SIZE = 200
+# runtime code of forwarder proxies: EIP-1167, and vyper < 0.3
+# create_forwarder_to
+FORWARDER_PATTERNS = [
+    re.compile(r"^363d3d373d3d3d363d73([0-9a-f]{40})5af43d82803e903d91602b57fd5bf3$"),
+    re.compile(
+        r"^366000600037611000600036600073([0-9a-f]{40})"
+        r"5af4602c57600080fd5b6110006000f3$"
+    ),
+]
+DEFAULT_REQUESTS_PER_SECOND = 4.0  # stays under etherscan's free tier limit
+LOOKUP_ATTEMPTS = 3  # explorer lookups that fail for transient reasons
+LOOKUP_RETRY_SECONDS = 2.0  # backoff after the first failed attempt
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+_CONTRACT_STORE = None
+_CONTRACTS: Dict[str, ape.Contract] = {}
+_CONTRACTS_LOCK = threading.Lock()
+
+
+def _to_json(contract_type: ContractType) -> str:
+
+    # pydantic v2 renamed .json(), ethpm-types has shipped with both:
+    if hasattr(contract_type, "model_dump_json"):
+        return contract_type.model_dump_json(by_alias=True)
+
+    return contract_type.json(by_alias=True)
+
+
+def _from_json(data: bytes) -> ContractType:
+
+    if hasattr(ContractType, "model_validate_json"):
+        return ContractType.model_validate_json(data)
+
+    return ContractType.parse_raw(data)
+
+
+class ContractStore:
+    """
+    On-disk store of contract types (ABIs), one JSON file per address, so
+    explorer lookups only happen once per contract.
+
+    Contracts that can't be used (unverified, or verified with a broken ABI)
+    are kept in ``unavailable.json`` with the reason, and are not looked up
+    again unless asked to. Lookups that failed (rate limits, timeouts, network
+    errors) are not stored, so they are tried again on the next run.
+
+    ``implementations.json`` groups contracts that run the same code: forwarder
+    proxies by the implementation they forward to, everything else by runtime
+    code hash. Contracts in a group share one contract type, so only one of
+    them (the group's representative) is ever looked up.
+    """
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.unavailable = {}
+        unavailable_file = os.path.join(directory, UNAVAILABLE_FILE)
+        if os.path.exists(unavailable_file):
+            with open(unavailable_file, "rb") as f:
+                self.unavailable = json_loads(f.read())
+        # transient lookup failures used to be stored too, retry those:
+        self.unavailable = {
+            address: reason
+            for address, reason in self.unavailable.items()
+            if not reason.startswith("lookup failed")
+        }
+
+        self.groups = {}
+        self.representatives = {}
+        implementations_file = os.path.join(directory, IMPLEMENTATIONS_FILE)
+        if os.path.exists(implementations_file):
+            with open(implementations_file, "rb") as f:
+                implementations = json_loads(f.read())
+            self.groups = implementations["groups"]
+            self.representatives = implementations["representatives"]
+
+    def _filename(self, address: str) -> str:
+        return os.path.join(self.directory, f"{address.lower()}.json")
+
+    def get_contract_type(self, address: str) -> Optional[ContractType]:
+
+        filename = self._filename(address)
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename, "rb") as f:
+            return _from_json(f.read())
+
+    def put(self, address: str, contract_type: ContractType):
+
+        filename = self._filename(address)
+        with open(f"{filename}.tmp", "w") as f:
+            f.write(_to_json(contract_type))
+        os.replace(f"{filename}.tmp", filename)
+
+        with self._lock:
+            if self.unavailable.pop(address.lower(), None):
+                self._save_unavailable()
+
+    def get_unavailable_reason(self, address: str) -> Optional[str]:
+        return self.unavailable.get(address.lower())
+
+    def mark_unavailable(self, address: str, reason: str):
+
+        with self._lock:
+            self.unavailable[address.lower()] = reason
+            self._save_unavailable()
+
+    def get_group(self, address: str) -> Optional[str]:
+        return self.groups.get(address.lower())
+
+    def get_lookup_address(self, address: str) -> str:
+        """
+        The address whose contract type ``address`` uses: the group's
+        representative, the implementation of a forwarder proxy, or itself.
+        """
+        group = self.get_group(address)
+        if group is None:
+            return address
+        if group in self.representatives:
+            return self.representatives[group]
+        if not group.startswith("code:"):
+            return group  # a forwarder's implementation
+
+        return address
+
+    def set_groups(self, groups: Dict[str, str]):
+
+        with self._lock:
+            self.groups.update(groups)
+            self._save_implementations()
+
+    def set_representative(self, group: str, address: str):
+
+        with self._lock:
+            self.representatives.setdefault(group, address.lower())
+            self._save_implementations()
+
+    def _save_implementations(self):
+
+        implementations_file = os.path.join(self.directory, IMPLEMENTATIONS_FILE)
+        with open(f"{implementations_file}.tmp", "wb") as f:
+            f.write(
+                json_dumps(
+                    {
+                        "groups": self.groups,
+                        "representatives": self.representatives,
+                    }
+                )
+            )
+        os.replace(f"{implementations_file}.tmp", implementations_file)
+
+    def _save_unavailable(self):
+
+        unavailable_file = os.path.join(self.directory, UNAVAILABLE_FILE)
+        with open(f"{unavailable_file}.tmp", "wb") as f:
+            f.write(json_dumps(self.unavailable))
+        os.replace(f"{unavailable_file}.tmp", unavailable_file)
+
+
+def get_contract_store() -> ContractStore:
+
+    global _CONTRACT_STORE
+    if _CONTRACT_STORE is None:
+        _CONTRACT_STORE = ContractStore(CONTRACT_STORE_DIR)
+
+    return _CONTRACT_STORE
+
+
+def _fetch_contract_type(store: ContractStore, address: str) -> Optional[ContractType]:
+
+    # hits the explorer (or ape's own cache). only definitive answers are
+    # stored as unavailable; rate limits, timeouts and network errors are
+    # retried, then raised without being stored, so the next run tries again:
+    for attempt in range(1, LOOKUP_ATTEMPTS + 1):
+        try:
+            contract_type = ape.chain.contracts.get(address)
+            break
+        except ape.exceptions.ContractNotFoundError:
+            contract_type = None
+            break
+        except ape.exceptions.ApeException as e:
+            if attempt == LOOKUP_ATTEMPTS:
+                raise ape.exceptions.ChainError(f"{address} lookup failed: {e}") from e
+            time.sleep(LOOKUP_RETRY_SECONDS * attempt)
+        except ValueError as e:
+            # the explorer answered, but with an ABI that doesn't validate:
+            store.mark_unavailable(address, f"undecodable abi: {e}")
+            return None
+
+    if contract_type is None:
+        store.mark_unavailable(address, "not verified")
+        return None
+
+    if not contract_type.abi:
+        store.mark_unavailable(address, "empty abi")
+        return None
+
+    store.put(address, contract_type)
+    return contract_type
+
+
+def _get_group_key(code: str) -> str:
+
+    code = code.lower().removeprefix("0x")
+    for pattern in FORWARDER_PATTERNS:
+        match = pattern.match(code)
+        if match:
+            return f"0x{match.group(1)}"
+
+    return f"code:{keccak(hexstr=code).hex()}"
+
+
+def group_by_implementation(addresses: List[str]) -> Dict[str, str]:
+    """
+    Group contracts by the code they run (see ``ContractStore``). Only
+    contracts the store hasn't grouped yet are looked up, with batched
+    ``eth_getCode`` calls.
+
+    Returns:
+        Dict[str, str]: group key of each (lowercased) address.
+    """
+    store = get_contract_store()
+    to_group = [address for address in addresses if store.get_group(address) is None]
+    groups = {}
+    for start in range(0, len(to_group), GET_CODE_BATCH_SIZE):
+        end = start + GET_CODE_BATCH_SIZE
+        chunk = to_group[start:end]
+        responses = post_batch(
+            "eth_getCode", [[address, "latest"] for address in chunk]
+        )
+        for response in responses:
+            code = response.get("result")
+            if code and code != "0x":
+                groups[chunk[response["id"]].lower()] = _get_group_key(code)
+
+    if groups:
+        store.set_groups(groups)
+
+    group_sizes = {}
+    for address in addresses:
+        group = store.get_group(address)
+        group_sizes[group] = group_sizes.get(group, 0) + 1
+    RICH_CONSOLE.log(
+        f"[red]{len(addresses)} contracts run [red]{len(group_sizes)} "
+        f"distinct implementations."
+    )
+
+    return {
+        address.lower(): store.get_group(address)
+        for address in addresses
+        if store.get_group(address)
+    }
+
+
+def get_contract(address: str) -> ape.Contract:
+    """
+    ``ape.Contract``, but with contract types from the contract store. Only
+    contracts that aren't in the store yet are looked up on the explorer, and
+    contracts grouped by ``group_by_implementation`` reuse the contract type
+    (and selector index) of their group.
+
+    Raises:
+        ape.exceptions.ChainError: if the contract is unavailable (see
+            ``ContractStore``), or its explorer lookup kept failing.
+    """
+    key = address.lower()
+    contract = _CONTRACTS.get(key)
+    if contract is not None:
+        return contract
+
+    store = get_contract_store()
+    lookup_address = store.get_lookup_address(address)
+    reason = store.get_unavailable_reason(lookup_address)
+    if reason:
+        raise ape.exceptions.ChainError(f"{address} is unavailable: {reason}")
+
+    contract_type = store.get_contract_type(lookup_address)
+    if contract_type is None:
+        contract_type = _fetch_contract_type(store, lookup_address)
+    if contract_type is None:
+        raise ape.exceptions.ChainError(
+            f"{address} is unavailable: "
+            f"{store.get_unavailable_reason(lookup_address)}"
+        )
+
+    group = store.get_group(address)
+    if group:
+        store.set_representative(group, lookup_address)
+        set_selector_index_key(address, group)
+
+    contract = ape.Contract(address, contract_type=contract_type)
+    with _CONTRACTS_LOCK:
+        _CONTRACTS[key] = contract
+
+    return contract
+
+
+def prefetch_contract_types(
+    addresses: List[str],
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    retry_unavailable: bool = False,
+):
+    """
+    Fill the contract store for ``addresses``, with at most
+    ``requests_per_second`` explorer lookups. Contracts already in the store
+    are skipped, and so are unavailable ones unless ``retry_unavailable``.
+    """
+    store = get_contract_store()
+    lookup_addresses = list(
+        dict.fromkeys(store.get_lookup_address(address) for address in addresses)
+    )
+    to_fetch = []
+    for address in lookup_addresses:
+        if store.get_contract_type(address) is not None:
+            continue
+        if store.get_unavailable_reason(address) and not retry_unavailable:
+            continue
+        to_fetch.append(address)
+
+    RICH_CONSOLE.log(
+        f"Fetching [red]{len(to_fetch)} contract types for "
+        f"[red]{len(addresses)} contracts "
+        f"([blue]{len(lookup_addresses) - len(to_fetch)} already stored)."
+    )
+    min_interval = 1 / requests_per_second
+    for idx, address in enumerate(to_fetch):
+
+        start = time.perf_counter()
+
+        # an earlier lookup may have covered this contract's group by now:
+        group = store.get_group(address)
+        if group and group in store.representatives:
+            continue
+
+        try:
+            contract_type = _fetch_contract_type(store, address)
+        except ape.exceptions.ChainError as e:
+            RICH_CONSOLE.log(f"[yellow]{e}, will try again next run.")
+        else:
+            if contract_type is None:
+                RICH_CONSOLE.log(
+                    f"[yellow]{address}: " f"{store.get_unavailable_reason(address)}"
+                )
+            elif group:
+                store.set_representative(group, address)
+        if (idx + 1) % 100 == 0:
+            RICH_CONSOLE.log(f"Fetched [blue]{idx + 1}/{len(to_fetch)} contract types.")
+
+        elapsed = time.perf_counter() - start
+        if elapsed < min_interval:
+            time.sleep(min_interval - elapsed)
+
+    RICH_CONSOLE.log(
+        f"... done, [red]{len(store.unavailable)} contracts are unavailable."
+    )
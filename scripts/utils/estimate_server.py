@@ -0,0 +1,255 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from rich.console import Console as RichConsole
+
+from scripts.utils.fast_json import json_dumps, json_loads
+from scripts.utils.quantile_sketch import QuantileSketch
+
+DEFAULT_RELOAD_INTERVAL = 1.0  # seconds between checks for new estimate files
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+
+def _get_file_id(filename: str) -> Optional[Tuple[int, int, int]]:
+
+    # gas_tools replaces estimate files with os.replace, which gives them a
+    # new inode, so this changes on every export:
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _get_estimate(gas_stats: Dict, method: str) -> Dict:
+
+    univariate = gas_stats.get("univariate", {}).get(method, {})
+    quantiles = gas_stats.get("quantiles", {}).get(method, {})
+    estimate = {
+        "gas": univariate.get("mean", quantiles.get("p50")),
+        "mean": univariate.get("mean"),
+        "std": univariate.get("std"),
+        "count": univariate.get("count", quantiles.get("count")),
+        "p50": quantiles.get("p50"),
+        "p90": quantiles.get("p90"),
+        "p99": quantiles.get("p99"),
+    }
+    current = gas_stats.get("rolling", {}).get(method, {}).get("current")
+    if current:
+        estimate["current_mean"] = current["mean"]
+        estimate["current_std"] = current["std"]
+
+    return estimate
+
+
+class EstimateIndex:
+    """
+    Gas estimates of every (pool, method) in the estimate JSON files, for
+    lookups. Methods get their univariate stats, the quantiles of their sketch,
+    and their decayed current estimate (if there are rolling stats).
+
+    ``reload_if_changed`` rebuilds the index when one of the files was
+    replaced. The new index is swapped in with one assignment, so a query sees
+    either all of the old estimates or all of the new ones.
+    """
+
+    def __init__(self, json_files: List[str]):
+
+        self.json_files = json_files
+        self._file_ids = {}
+        # (estimates, sketches) keyed by (lowercased pool, method). sketches
+        # are decoded the first time a percentile of the method is asked for.
+        self._index: Tuple[Dict, Dict] = ({}, {})
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    @property
+    def size(self) -> int:
+        return len(self._index[0])
+
+    def get_keys(self) -> List[Tuple[str, str]]:
+        return list(self._index[0])
+
+    def reload_if_changed(self) -> bool:
+
+        with self._lock:
+            file_ids = {
+                json_file: _get_file_id(json_file) for json_file in self.json_files
+            }
+            if file_ids == self._file_ids:
+                return False
+
+            estimates, sketches = {}, {}
+            for json_file, file_id in file_ids.items():
+                if file_id is None:
+                    continue
+
+                with open(json_file, "rb") as f:
+                    costs = json_loads(f.read())
+                for pool_addr, gas_stats in costs.items():
+                    methods = {
+                        **gas_stats.get("univariate", {}),
+                        **gas_stats.get("quantiles", {}),
+                    }
+                    for method in methods:
+                        key = (pool_addr.lower(), method)
+                        estimates[key] = _get_estimate(gas_stats, method)
+                        sketch = gas_stats.get("quantiles", {}).get(method, {})
+                        if "sketch" in sketch:
+                            sketches[key] = sketch["sketch"]
+
+            self._index = (estimates, sketches)
+            self._file_ids = file_ids
+
+        RICH_CONSOLE.log(f"Loaded gas estimates of [red]{len(estimates)} pool methods.")
+        return True
+
+    def query(
+        self, pool_addr: str, method: str, percentile: Optional[float] = None
+    ) -> Optional[Dict]:
+        """
+        Gas estimate of a pool's method, None if there is none. With a
+        ``percentile`` (0 to 100), ``gas`` is that percentile of the method's
+        quantile sketch instead of the mean.
+
+        Raises:
+            ValueError: if ``percentile`` is not between 0 and 100.
+        """
+        if percentile is not None and not 0 <= percentile <= 100:
+            raise ValueError(f"percentile {percentile} is not between 0 and 100")
+
+        estimates, sketches = self._index
+        key = (pool_addr.lower(), method)
+        estimate = estimates.get(key)
+        if estimate is None:
+            return None
+        if percentile is None:
+            return estimate
+
+        sketch = sketches.get(key)
+        if sketch is None:
+            return {**estimate, "percentile": percentile, "gas": None}
+        if isinstance(sketch, dict):
+            # decoded once, then cached in place of its serialized form:
+            sketch = sketches[key] = QuantileSketch.from_dict(sketch)
+
+        gas = sketch.get_quantile(percentile / 100)
+        return {**estimate, "percentile": percentile, "gas": int(round(gas))}
+
+    def query_many(self, queries: List[Dict]) -> List[Optional[Dict]]:
+        return [
+            self.query(query["pool"], query["method"], query.get("percentile"))
+            for query in queries
+        ]
+
+
+def _watch(index: EstimateIndex, reload_interval: float):
+
+    while True:
+        time.sleep(reload_interval)
+        try:
+            index.reload_if_changed()
+        except Exception as e:
+            # e.g. a file that was edited by hand: keep serving the old index
+            RICH_CONSOLE.log(f"[red]Could not reload gas estimates: {e}")
+
+
+def make_handler(index: EstimateIndex):
+    class EstimateHandler(BaseHTTPRequestHandler):
+
+        # keep-alive, so clients don't pay for a connection per query, and
+        # no Nagle: headers and body are separate writes, which would
+        # otherwise wait out the client's delayed ACK (~40ms) on every query
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, body: bytes, status: int = 200):
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+
+            url = urlsplit(self.path)
+            if url.path == "/health":
+                self._send(json_dumps({"estimates": index.size}))
+                return
+            if url.path != "/estimate":
+                self._send(b"{}", status=404)
+                return
+
+            params = parse_qs(url.query)
+            if "pool" not in params or "method" not in params:
+                self._send(b'{"error": "pool and method are required"}', status=400)
+                return
+
+            try:
+                percentile = (
+                    float(params["percentile"][0]) if "percentile" in params else None
+                )
+                estimate = index.query(
+                    params["pool"][0], params["method"][0], percentile
+                )
+            except ValueError as e:
+                self._send(json_dumps({"error": str(e)}), status=400)
+                return
+
+            if estimate is None:
+                self._send(b"null", status=404)
+            else:
+                self._send(json_dumps(estimate))
+
+        def do_POST(self):
+
+            if urlsplit(self.path).path != "/estimates":
+                self._send(b"{}", status=404)
+                return
+
+            try:
+                queries = json_loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                estimates = index.query_many(queries)
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(json_dumps({"error": f"bad batch query: {e}"}), status=400)
+                return
+
+            self._send(json_dumps(estimates))
+
+    return EstimateHandler
+
+
+def start_estimate_server(
+    index: EstimateIndex,
+    host: str,
+    port: int,
+    reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+) -> ThreadingHTTPServer:
+    """
+    Serve ``index`` over HTTP in a background thread, reloading it whenever
+    gas_tools exports new estimates:
+
+    - ``GET /estimate?pool=...&method=...[&percentile=99]``: one estimate, 404
+      if the pool's method has none.
+    - ``POST /estimates`` with a JSON list of ``{"pool", "method"[,
+      "percentile"]}`` queries: a list of estimates (null where there is none).
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=_watch, args=(index, reload_interval), daemon=True).start()
+    RICH_CONSOLE.log(f"Serving gas estimates on [green]http://{host}:{port}")
+
+    return server
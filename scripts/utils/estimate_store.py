@@ -0,0 +1,232 @@
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+import click
+from rich.console import Console as RichConsole
+
+from scripts.utils.fast_json import json_dumps, json_loads
+
+DEFAULT_ESTIMATE_STORE_FILE = "./gas_estimates.sqlite"
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+_ESTIMATE_STORE = None
+_ESTIMATE_STORE_FILE = DEFAULT_ESTIMATE_STORE_FILE
+
+
+def _get_table_name(json_file: str) -> str:
+    return os.path.normpath(json_file)
+
+
+def _get_file_stamp(json_file: str) -> Optional[Tuple[int, int]]:
+
+    try:
+        stat = os.stat(json_file)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+class EstimateStore:
+    """
+    On-disk store of gas estimates, one row per (table, pool). A table holds
+    the estimates of one gas estimate JSON file (e.g.
+    ``stableswap_pools_gas_estimates.json``), keyed by the file's path.
+
+    Each pool's stats are upserted in their own transaction, so saving a pool
+    costs the same however many pools there are, and a crash loses at most
+    the pool being written. The JSON files are exported from the store in one
+    go (see ``export_json``). The first time a table is used, the JSON file it
+    replaces is imported, if there is one.
+
+    The store remembers the mtime and size of each JSON file as of its last
+    import or export. If the file changed since (e.g. a ``git pull`` brought
+    newer estimates), it is imported again: its pools overwrite the stored
+    ones, and pools that are only in the store are kept.
+    """
+
+    def __init__(self, filename: str):
+
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS estimates ("
+            "table_name TEXT NOT NULL, "
+            "pool TEXT NOT NULL, "
+            "stats BLOB NOT NULL, "
+            "PRIMARY KEY (table_name, pool))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tables ("
+            "table_name TEXT PRIMARY KEY, "
+            "json_mtime_ns INTEGER, "
+            "json_size INTEGER)"
+        )
+        # stores made before file stamps were kept get the columns added, and
+        # their tables are imported again once (their stamps are NULL):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tables)")}
+        for column in ["json_mtime_ns", "json_size"]:
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE tables ADD COLUMN {column} INTEGER")
+        self._db.commit()
+
+    def _ensure_table(self, json_file: str) -> str:
+
+        table_name = _get_table_name(json_file)
+        stamp = _get_file_stamp(json_file)
+        row = self._db.execute(
+            "SELECT json_mtime_ns, json_size FROM tables " "WHERE table_name = ?",
+            (table_name,),
+        ).fetchone()
+        if row is not None and (stamp is None or tuple(row) == stamp):
+            return table_name
+
+        costs = {}
+        if os.path.exists(json_file):
+            with open(json_file, "rb") as f:
+                try:
+                    costs = json_loads(f.read())
+                except ValueError as e:
+                    raise click.ClickException(
+                        f"Can't import {json_file} into the estimate store, "
+                        f"it is not valid JSON ({e}). Fix or remove it first."
+                    )
+            if row is not None:
+                RICH_CONSOLE.log(
+                    f"[yellow]{json_file} changed outside the estimate "
+                    "store, importing it again."
+                )
+            RICH_CONSOLE.log(
+                f"Imported [red]{len(costs)} pools from [green]{json_file}."
+            )
+
+        self._upsert(table_name, costs)
+        self._set_file_stamp(table_name, stamp)
+        self._db.commit()
+        return table_name
+
+    def _upsert(self, table_name: str, costs: Dict[str, Dict]):
+
+        self._db.executemany(
+            "INSERT INTO estimates VALUES (?, ?, ?) "
+            "ON CONFLICT (table_name, pool) "
+            "DO UPDATE SET stats = excluded.stats",
+            [(table_name, pool, json_dumps(stats)) for pool, stats in costs.items()],
+        )
+
+    def _set_file_stamp(self, table_name: str, stamp: Optional[Tuple[int, int]]):
+
+        self._db.execute(
+            "INSERT INTO tables VALUES (?, ?, ?) "
+            "ON CONFLICT (table_name) DO UPDATE SET "
+            "json_mtime_ns = excluded.json_mtime_ns, "
+            "json_size = excluded.json_size",
+            (table_name, *(stamp or (None, None))),
+        )
+
+    def get_table(self, json_file: str) -> Dict[str, Dict]:
+        """
+        Returns:
+            Dict[str, Dict]: gas stats of each pool, in the order the pools
+                were first stored.
+        """
+        with self._lock:
+            return self._get_table(self._ensure_table(json_file))
+
+    def _get_table(self, table_name: str) -> Dict[str, Dict]:
+
+        rows = self._db.execute(
+            "SELECT pool, stats FROM estimates WHERE table_name = ? " "ORDER BY rowid",
+            (table_name,),
+        ).fetchall()
+
+        return {pool: json_loads(stats) for pool, stats in rows}
+
+    def get(self, json_file: str, pool_addr: str) -> Optional[Dict]:
+
+        with self._lock:
+            table_name = self._ensure_table(json_file)
+            row = self._db.execute(
+                "SELECT stats FROM estimates " "WHERE table_name = ? AND pool = ?",
+                (table_name, pool_addr),
+            ).fetchone()
+
+        return json_loads(row[0]) if row else None
+
+    def put_many(self, json_file: str, costs: Dict[str, Dict]):
+        """
+        Upsert the gas stats of several pools, in one transaction. Pools that
+        are already stored keep their place in the table.
+        """
+        with self._lock:
+            table_name = self._ensure_table(json_file)
+            self._upsert(table_name, costs)
+            self._db.commit()
+
+    def put(self, json_file: str, pool_addr: str, gas_stats: Dict):
+        self.put_many(json_file, {pool_addr: gas_stats})
+
+    def export_json(self, json_file: str):
+        """
+        Write a table to its JSON file, in the same schema (and indentation)
+        as always. The file is replaced atomically, so readers never see a
+        partly written file.
+        """
+        with self._lock:
+            costs = self._get_table(self._ensure_table(json_file))
+            with open(f"{json_file}.tmp", "w") as f:
+                json.dump(costs, f, indent=4)
+            os.replace(f"{json_file}.tmp", json_file)
+            # so the export itself doesn't look like an outside change:
+            self._set_file_stamp(_get_table_name(json_file), _get_file_stamp(json_file))
+            self._db.commit()
+
+        RICH_CONSOLE.log(f"Exported [red]{len(costs)} pools to [green]{json_file}.")
+
+
+def configure_estimate_store(filename: str):
+
+    global _ESTIMATE_STORE, _ESTIMATE_STORE_FILE
+    if filename != _ESTIMATE_STORE_FILE:
+        _ESTIMATE_STORE = None
+    _ESTIMATE_STORE_FILE = filename
+
+
+def get_estimate_store() -> EstimateStore:
+
+    global _ESTIMATE_STORE
+    if _ESTIMATE_STORE is None:
+        _ESTIMATE_STORE = EstimateStore(_ESTIMATE_STORE_FILE)
+        RICH_CONSOLE.log(f"Using estimate store [green]{_ESTIMATE_STORE_FILE}.")
+
+    return _ESTIMATE_STORE
+
+
+def estimate_store_options(f):
+    """
+    Adds ``--estimate_store`` to a click command, and sets up the gas estimate
+    store before the command runs.
+    """
+
+    @click.option(
+        "--estimate_store",
+        required=False,
+        help=(
+            "Gas estimate store file, " "the JSON estimate files are exported from it"
+        ),
+        type=str,
+        default=DEFAULT_ESTIMATE_STORE_FILE,
+    )
+    @functools.wraps(f)
+    def wrapper(*args, estimate_store, **kwargs):
+        configure_estimate_store(estimate_store)
+        return f(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,462 @@
+import functools
+import sqlite3
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import ape
+import click
+from eth_utils import to_checksum_address
+from rich.console import Console as RichConsole
+
+from scripts.utils.contract_store import get_contract
+from scripts.utils.transactions_getter import (
+    get_all_transactions_for_addresses, get_all_transactions_for_contract,
+    get_deploy_block, scan_logs_backwards, scan_logs_backwards_for_addresses,
+    scan_logs_forwards, scan_logs_forwards_for_addresses,
+    scan_logs_in_parallel)
+
+DEFAULT_EVENT_INDEX_FILE = "./event_index.sqlite"
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+_EVENT_INDEX = None
+_SCAN_CONCURRENCY = 1
+
+
+class EventIndex:
+    """
+    On-disk index of the logs each pool emitted, so tx discovery only has to
+    scan blocks it hasn't seen before.
+
+    For every pool we keep one contiguous scanned block range
+    ``[min_block, max_block]``: every log the pool emitted in that range is in
+    ``events``. ``exhausted`` is set once a backwards scan ran out of history
+    (pool deployment or genesis), so we never scan below ``min_block`` again.
+    ``deploy_block`` is kept once it was looked up.
+    """
+
+    def __init__(self, filename: str):
+
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "pool TEXT NOT NULL, "
+            "block_number INTEGER NOT NULL, "
+            "tx_index INTEGER NOT NULL, "
+            "tx_hash TEXT NOT NULL, "
+            "log_index INTEGER NOT NULL, "
+            "PRIMARY KEY (pool, block_number, log_index))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "pool TEXT PRIMARY KEY, "
+            "min_block INTEGER NOT NULL, "
+            "max_block INTEGER NOT NULL, "
+            "exhausted INTEGER NOT NULL DEFAULT 0, "
+            "deploy_block INTEGER)"
+        )
+        # indexes made before deploy blocks were kept:
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(checkpoints)")}
+        if "deploy_block" not in columns:
+            self._db.execute("ALTER TABLE checkpoints ADD COLUMN deploy_block INTEGER")
+        self._db.commit()
+
+    def get_checkpoint(self, pool: str) -> Optional[Tuple[int, int, bool]]:
+        """
+        Returns:
+            Optional[Tuple[int, int, bool]]: (min block, max block, exhausted)
+                of the pool's scanned range, None if it was never scanned.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT min_block, max_block, exhausted FROM checkpoints "
+                "WHERE pool = ?",
+                (pool.lower(),),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0], row[1], bool(row[2])
+
+    def add_window(
+        self,
+        pool: str,
+        block_start: int,
+        block_end: int,
+        logs: List[Tuple[int, int, str, int]],
+    ):
+        """
+        Store the logs of a scanned block window and extend the pool's scanned
+        range to cover it, in one transaction: an interrupted scan resumes from
+        the last window that made it to disk. The window has to be adjacent to
+        (or overlap) the already scanned range.
+        """
+        pool = pool.lower()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?)",
+                [
+                    (pool, block_number, tx_index, tx_hash.lower(), log_index)
+                    for block_number, tx_index, tx_hash, log_index in logs
+                ],
+            )
+            self._db.execute(
+                "INSERT INTO checkpoints (pool, min_block, max_block) "
+                "VALUES (?, ?, ?) ON CONFLICT (pool) DO UPDATE SET "
+                "min_block = MIN(min_block, excluded.min_block), "
+                "max_block = MAX(max_block, excluded.max_block)",
+                (pool, block_start, block_end),
+            )
+            self._db.commit()
+
+    def mark_exhausted(self, pool: str):
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE checkpoints SET exhausted = 1 WHERE pool = ?",
+                (pool.lower(),),
+            )
+            self._db.commit()
+
+    def get_deploy_block(self, pool: str) -> Optional[int]:
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT deploy_block FROM checkpoints WHERE pool = ?",
+                (pool.lower(),),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def set_deploy_block(self, pool: str, deploy_block: int):
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE checkpoints SET deploy_block = ? WHERE pool = ?",
+                (deploy_block, pool.lower()),
+            )
+            self._db.commit()
+
+    def count_transactions(self, pool: str, max_block: int) -> int:
+
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(DISTINCT tx_hash) FROM events "
+                "WHERE pool = ? AND block_number <= ?",
+                (pool.lower(), max_block),
+            ).fetchone()
+
+        return count
+
+    def get_transactions(
+        self, pool: str, max_transactions: int, max_block: int
+    ) -> List[Tuple[int, str]]:
+        """
+        Returns:
+            List[Tuple[int, str]]: the newest ``max_transactions`` (block
+                number, tx hash) up to ``max_block``, oldest first.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT block_number, tx_hash, MIN(tx_index) AS position "
+                "FROM events WHERE pool = ? AND block_number <= ? "
+                "GROUP BY block_number, tx_hash "
+                "ORDER BY block_number DESC, position DESC LIMIT ?",
+                (pool.lower(), max_block, max_transactions),
+            ).fetchall()
+
+        return [(block_number, tx_hash) for block_number, tx_hash, _ in reversed(rows)]
+
+
+def _scanned_to_deploy_block(event_index: EventIndex, pool: str, head: int) -> bool:
+    """
+    Whether the pool's scanned range reaches down to its deploy block (or
+    genesis), i.e. there is no older history to scan.
+    """
+    min_block = event_index.get_checkpoint(pool)[0]
+    if min_block <= 0:
+        return True
+
+    # the binary search over eth_getCode only runs once per pool:
+    deploy_block = event_index.get_deploy_block(pool)
+    if deploy_block is None:
+        try:
+            deploy_block = get_deploy_block(to_checksum_address(pool), head)
+        except ValueError as e:
+            # e.g. not an archive node: we can't tell, so assume there's more
+            RICH_CONSOLE.log(f"[yellow]Could not get deploy block of {pool}: {e}")
+            return False
+        # ``head`` also means there's no code at the head yet, which can
+        # change, so only earlier blocks are kept:
+        if deploy_block < head:
+            event_index.set_deploy_block(pool, deploy_block)
+
+    return deploy_block >= min_block
+
+
+def get_indexed_transactions_for_contract(
+    event_index: EventIndex,
+    contract: ape.Contract,
+    max_transactions: int,
+    max_block: int = None,
+    decode_events: bool = False,
+    concurrency: int = 1,
+) -> List[Tuple[int, str]]:
+    """
+    Same as ``get_all_transactions_for_contract``, but only scans blocks that
+    aren't in ``event_index`` yet: forwards from the pool's checkpoint up to
+    the head, and backwards below it if the index holds fewer than
+    ``max_transactions`` txes.
+    """
+    pool = contract.address
+    head = max_block or ape.chain.blocks.height
+
+    checkpoint = event_index.get_checkpoint(pool)
+    if checkpoint is not None and checkpoint[1] < head:
+        RICH_CONSOLE.log(
+            f"Updating event index for [red]{pool} from block "
+            f"[blue]{checkpoint[1] + 1} to [blue]{head}."
+        )
+        for block_start, block_end, logs in scan_logs_forwards(
+            contract, checkpoint[1] + 1, head, decode_events
+        ):
+            event_index.add_window(pool, block_start, block_end, logs)
+
+    # the scanned range has to stay contiguous, so a backwards scan always
+    # continues below the checkpoint (or starts at the head for new pools).
+    # txes above ``head`` don't count, which is why this can take > 1 round:
+    while True:
+
+        checkpoint = event_index.get_checkpoint(pool)
+        num_indexed = event_index.count_transactions(pool, head)
+        if checkpoint is not None and (
+            num_indexed >= max_transactions or checkpoint[2]
+        ):
+            break
+
+        scan_from = head if checkpoint is None else checkpoint[0] - 1
+        if scan_from < 0:
+            event_index.mark_exhausted(pool)
+            break
+
+        num_txes_needed = max_transactions - num_indexed
+        RICH_CONSOLE.log(
+            f"Extending event index for [red]{pool} below block "
+            f"[blue]{scan_from + 1}."
+        )
+        found_txes = set()
+        if concurrency > 1:
+            windows = scan_logs_in_parallel(
+                contract,
+                scan_from,
+                num_txes_needed,
+                concurrency,
+                decode_events,
+            )
+        else:
+            windows = scan_logs_backwards(
+                contract, scan_from, num_txes_needed, decode_events
+            )
+        for block_start, block_end, logs in windows:
+            event_index.add_window(pool, block_start, block_end, logs)
+            found_txes.update(tx for _, _, tx, _ in logs)
+
+        if event_index.get_checkpoint(pool) is None:
+            # nothing was scanned at all (pool didn't exist at the head):
+            event_index.add_window(pool, head, head, [])
+
+        if len(found_txes) < num_txes_needed:
+            # the scan stopped before it found enough txes. That's only the
+            # end of the pool's history if it got down to the deploy block,
+            # otherwise it gave up after a run of empty windows, and the next
+            # run scans on from there:
+            if _scanned_to_deploy_block(event_index, pool, head):
+                event_index.mark_exhausted(pool)
+            break
+
+    txes = event_index.get_transactions(pool, max_transactions, head)
+    RICH_CONSOLE.log(f"Total transactions: [blue]{len(txes)}")
+    return txes
+
+
+def get_indexed_transactions_for_addresses(
+    event_index: EventIndex,
+    addresses: List[str],
+    max_transactions: int,
+    max_block: int = None,
+    concurrency: int = 1,
+) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    ``get_indexed_transactions_for_contract`` for many contracts: indexed
+    contracts are brought up to the head, and new ones are scanned back from
+    the head, with one multi address log scan each. Contracts that still
+    need more txes after that are extended one by one.
+    """
+    head = max_block or ape.chain.blocks.height
+    addresses = [address.lower() for address in addresses]
+    checkpoints = {
+        address: event_index.get_checkpoint(address) for address in addresses
+    }
+
+    stale = {
+        address: checkpoint[1]
+        for address, checkpoint in checkpoints.items()
+        if checkpoint is not None and checkpoint[1] < head
+    }
+    if stale:
+        RICH_CONSOLE.log(
+            f"Updating event index for [red]{len(stale)} pools " f"up to [blue]{head}."
+        )
+        for block_start, block_end, logs in scan_logs_forwards_for_addresses(
+            list(stale), min(stale.values()) + 1, head
+        ):
+            for address, address_logs in logs.items():
+                # windows below a pool's checkpoint are already indexed:
+                if block_end > stale[address]:
+                    event_index.add_window(
+                        address, block_start, block_end, address_logs
+                    )
+
+    new = [address for address, checkpoint in checkpoints.items() if checkpoint is None]
+    if new:
+        RICH_CONSOLE.log(f"Indexing [red]{len(new)} new pools.")
+        found_txes = {address: set() for address in new}
+        for block_start, block_end, logs in scan_logs_backwards_for_addresses(
+            new, head, max_transactions
+        ):
+            for address, address_logs in logs.items():
+                event_index.add_window(address, block_start, block_end, address_logs)
+                found_txes[address].update(tx for _, _, tx, _ in address_logs)
+
+        # same rule as for a single contract: running out of logs only ends a
+        # pool's history if the scan got down to its deploy block. Pools that
+        # stopped short are extended one by one below:
+        for address, address_txes in found_txes.items():
+            if len(address_txes) < max_transactions and (
+                _scanned_to_deploy_block(event_index, address, head)
+            ):
+                event_index.mark_exhausted(address)
+
+    txes = {}
+    for address in addresses:
+
+        _, _, exhausted = event_index.get_checkpoint(address)
+        if (
+            not exhausted
+            and event_index.count_transactions(address, head) < max_transactions
+        ):
+            try:
+                contract = get_contract(address)
+            except ape.exceptions.ChainError:
+                pass
+            else:
+                get_indexed_transactions_for_contract(
+                    event_index,
+                    contract,
+                    max_transactions,
+                    max_block,
+                    concurrency=concurrency,
+                )
+
+        txes[address] = event_index.get_transactions(address, max_transactions, head)
+
+    return txes
+
+
+def configure_event_index(filename: str, scan_concurrency: int = 1):
+
+    global _EVENT_INDEX, _SCAN_CONCURRENCY
+    _SCAN_CONCURRENCY = scan_concurrency
+    if not filename:
+        _EVENT_INDEX = None
+        return
+
+    _EVENT_INDEX = EventIndex(filename)
+    RICH_CONSOLE.log(f"Using event index [green]{filename}.")
+
+
+def get_event_index() -> Optional[EventIndex]:
+    return _EVENT_INDEX
+
+
+def get_transactions_for_contract(
+    contract: ape.Contract,
+    max_transactions: int,
+    max_block: int = None,
+    decode_events: bool = False,
+) -> List[Tuple[int, str]]:
+    """
+    Get the newest ``max_transactions`` txes of ``contract``, oldest first.
+    Goes through the event index if one is configured, and scans block
+    segments in parallel if ``--scan_concurrency`` > 1.
+    """
+    if _EVENT_INDEX is None:
+        return get_all_transactions_for_contract(
+            contract,
+            max_transactions,
+            max_block,
+            decode_events,
+            _SCAN_CONCURRENCY,
+        )
+
+    return get_indexed_transactions_for_contract(
+        _EVENT_INDEX,
+        contract,
+        max_transactions,
+        max_block,
+        decode_events,
+        _SCAN_CONCURRENCY,
+    )
+
+
+def get_transactions_for_contracts(
+    addresses: List[str], max_transactions: int, max_block: int = None
+) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    Get the newest ``max_transactions`` txes of many contracts at once, with
+    ``eth_getLogs`` calls shared between all of them.
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]]: txes of each (lowercased) address,
+            oldest first.
+    """
+    if _EVENT_INDEX is None:
+        return get_all_transactions_for_addresses(
+            addresses, max_transactions, max_block
+        )
+
+    return get_indexed_transactions_for_addresses(
+        _EVENT_INDEX, addresses, max_transactions, max_block, _SCAN_CONCURRENCY
+    )
+
+
+def event_index_options(f):
+    """
+    Adds ``--event_index`` and ``--scan_concurrency`` to a click command, and
+    sets up tx discovery before the command runs.
+    """
+
+    @click.option(
+        "--event_index",
+        required=False,
+        help="Event index file. Pass an empty string to always rescan logs",
+        type=str,
+        default=DEFAULT_EVENT_INDEX_FILE,
+    )
+    @click.option(
+        "--scan_concurrency",
+        required=False,
+        help="Number of block segments to scan for logs in parallel",
+        type=int,
+        default=1,
+    )
+    @functools.wraps(f)
+    def wrapper(*args, event_index, scan_concurrency, **kwargs):
+        configure_event_index(event_index, scan_concurrency)
+        return f(*args, **kwargs)
+
+    return wrapper
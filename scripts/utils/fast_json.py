@@ -0,0 +1,12 @@
+try:
+    from orjson import dumps as json_dumps
+    from orjson import loads as json_loads
+except ImportError:  # fall back to the (much slower) stdlib parser
+    from json import dumps as _dumps
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return _dumps(obj).encode()
+
+
+__all__ = ["json_dumps", "json_loads"]
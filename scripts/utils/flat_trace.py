@@ -0,0 +1,106 @@
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy
+
+NO_SELECTOR = -1
+NO_GAS = -1
+
+_ADDRESS_IDS: Dict[str, int] = {}
+_ADDRESS_IDS_LOCK = threading.Lock()
+
+
+class FlatTrace(NamedTuple):
+    """
+    Struct-of-arrays view of a parity trace: one entry per call frame, in the
+    same (depth first) order as the raw trace.
+    """
+
+    block_number: int
+    tx_position: int
+    address_id: numpy.ndarray  # int32, see ``get_address_id``
+    # int64 4-byte selector, NO_SELECTOR if no calldata:
+    selector: numpy.ndarray
+    gas: numpy.ndarray  # int64 gas used, NO_GAS if the frame reports none
+    depth: numpy.ndarray  # int16 length of the frame's trace address
+    failed: numpy.ndarray  # bool
+
+
+def get_address_id(address: str) -> int:
+
+    address = address.lower()
+    address_id = _ADDRESS_IDS.get(address)
+    if address_id is None:
+        with _ADDRESS_IDS_LOCK:
+            address_id = _ADDRESS_IDS.setdefault(address, len(_ADDRESS_IDS))
+
+    return address_id
+
+
+def parse_flat_trace(raw_trace_list: List[Dict]) -> Optional[FlatTrace]:
+    """
+    Parse a raw ``trace_transaction`` response straight into a ``FlatTrace``,
+    without going through ``ParityTraceList`` and ``CallTreeNode``.
+    """
+    if not raw_trace_list:
+        return None
+
+    num_frames = len(raw_trace_list)
+    address_id = numpy.empty(num_frames, dtype=numpy.int32)
+    selector = numpy.full(num_frames, NO_SELECTOR, dtype=numpy.int64)
+    gas = numpy.full(num_frames, NO_GAS, dtype=numpy.int64)
+    depth = numpy.empty(num_frames, dtype=numpy.int16)
+    failed = numpy.zeros(num_frames, dtype=bool)
+
+    for idx, trace in enumerate(raw_trace_list):
+
+        action = trace["action"]
+        result = trace.get("result") or {}
+
+        if trace["type"] == "call":
+            address = action["to"]
+            calldata = action.get("input") or "0x"
+            if len(calldata) >= 10:
+                selector[idx] = int(calldata[2:10], 16)
+        elif trace["type"] == "create":
+            address = result.get("address") or action["from"]
+        else:  # suicide
+            address = action.get("address") or action.get("from")
+
+        address_id[idx] = get_address_id(address)
+        if result.get("gasUsed") is not None:
+            gas[idx] = int(result["gasUsed"], 16)
+        depth[idx] = len(trace["traceAddress"])
+        failed[idx] = trace.get("error") is not None
+
+    return FlatTrace(
+        block_number=raw_trace_list[0].get("blockNumber", 0),
+        tx_position=raw_trace_list[0].get("transactionPosition", 0),
+        address_id=address_id,
+        selector=selector,
+        gas=gas,
+        depth=depth,
+        failed=failed,
+    )
+
+
+def get_avg_gas_cost_per_selector(
+    flat_trace: FlatTrace, address_id: int
+) -> Dict[int, int]:
+
+    mask = (
+        (flat_trace.address_id == address_id)
+        & (flat_trace.selector != NO_SELECTOR)
+        & (flat_trace.gas != NO_GAS)
+    )
+    if not mask.any():
+        return {}
+
+    selectors, inverse = numpy.unique(flat_trace.selector[mask], return_inverse=True)
+    total_gas = numpy.bincount(inverse, weights=flat_trace.gas[mask])
+    num_calls = numpy.bincount(inverse)
+
+    return {
+        int(selector): int(total_gas[idx]) // int(num_calls[idx])
+        for idx, selector in enumerate(selectors)
+    }
@@ -0,0 +1,156 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy
+
+
+class GasSamples(NamedTuple):
+    """
+    Gas costs of a pool in long format: one entry per (tx, method) instead of
+    a wide, mostly empty (tx x method) table. Methods are int32 codes into
+    ``method_names``, and ``tx`` numbers the txes (by block, oldest first).
+    """
+
+    method_names: List[str]
+    method: numpy.ndarray  # int32
+    gas: numpy.ndarray  # uint64, avg gas of the method's calls in the tx
+    block: numpy.ndarray  # uint32
+    tx: numpy.ndarray  # int32
+
+    @property
+    def empty(self) -> bool:
+        return self.gas.size == 0
+
+    @property
+    def num_txes(self) -> int:
+        return int(self.tx.max()) + 1 if self.tx.size else 0
+
+
+def get_empty_gas_samples() -> GasSamples:
+    return GasSamples(
+        method_names=[],
+        method=numpy.zeros(0, numpy.int32),
+        gas=numpy.zeros(0, numpy.uint64),
+        block=numpy.zeros(0, numpy.uint32),
+        tx=numpy.zeros(0, numpy.int32),
+    )
+
+
+def gas_samples_from_rows(rows: List[Tuple[int, Dict[str, int]]]) -> GasSamples:
+    """
+    Gas samples from (block number, method name -> gas) rows, one per tx.
+    """
+    method_codes: Dict[str, int] = {}
+    num_entries = sum(len(gas_costs) for _, gas_costs in rows)
+    method = numpy.empty(num_entries, numpy.int32)
+    gas = numpy.empty(num_entries, numpy.uint64)
+    block = numpy.empty(num_entries, numpy.uint32)
+    tx = numpy.empty(num_entries, numpy.int32)
+
+    idx = 0
+    for tx_idx, (block_number, gas_costs) in enumerate(rows):
+        for method_name, gas_cost in gas_costs.items():
+            method[idx] = method_codes.setdefault(method_name, len(method_codes))
+            gas[idx] = gas_cost
+            block[idx] = block_number
+            tx[idx] = tx_idx
+            idx += 1
+
+    return GasSamples(list(method_codes), method, gas, block, tx)
+
+
+def select_gas_samples(samples: GasSamples, mask: numpy.ndarray) -> GasSamples:
+
+    # tx numbers are kept as they are, gaps don't matter:
+    return samples._replace(
+        method=samples.method[mask],
+        gas=samples.gas[mask],
+        block=samples.block[mask],
+        tx=samples.tx[mask],
+    )
+
+
+def concat_gas_samples(samples_list: List[GasSamples]) -> GasSamples:
+    """
+    Gas samples of several pools (or runs) as one, with method codes mapped by
+    name and txes renumbered by block.
+    """
+    samples_list = [samples for samples in samples_list if not samples.empty]
+    if not samples_list:
+        return get_empty_gas_samples()
+
+    method_codes: Dict[str, int] = {}
+    methods, txes = [], []
+    tx_offset = 0
+    for samples in samples_list:
+        code_map = numpy.array(
+            [
+                method_codes.setdefault(method_name, len(method_codes))
+                for method_name in samples.method_names
+            ],
+            dtype=numpy.int32,
+        )
+        methods.append(code_map[samples.method])
+        txes.append(samples.tx + tx_offset)
+        tx_offset += samples.num_txes
+
+    block = numpy.concatenate([samples.block for samples in samples_list])
+    tx = numpy.concatenate(txes)
+
+    # renumber txes in block order (stable, so each pool's order is kept):
+    tx_blocks = numpy.zeros(tx_offset, numpy.uint32)
+    tx_blocks[tx] = block
+    tx_order = numpy.empty(tx_offset, numpy.int32)
+    tx_order[numpy.argsort(tx_blocks, kind="stable")] = numpy.arange(tx_offset)
+
+    return GasSamples(
+        method_names=list(method_codes),
+        method=numpy.concatenate(methods),
+        gas=numpy.concatenate([samples.gas for samples in samples_list]),
+        block=block,
+        tx=tx_order[tx],
+    )
+
+
+def get_newest_txes(samples: GasSamples, max_transactions: int) -> GasSamples:
+    return select_gas_samples(
+        samples, samples.tx >= samples.num_txes - max_transactions
+    )
+
+
+def get_method_counts(samples: GasSamples) -> Dict[str, int]:
+
+    counts = numpy.bincount(samples.method, minlength=len(samples.method_names))
+    return {
+        method_name: int(count)
+        for method_name, count in zip(samples.method_names, counts)
+        if count
+    }
+
+
+def group_by_method(
+    samples: GasSamples,
+) -> Tuple[List[str], numpy.ndarray, numpy.ndarray]:
+    """
+    Gas sorted by method, for vectorized group-by reductions (e.g. with
+    ``numpy.ufunc.reduceat``).
+
+    Returns:
+        Tuple[List[str], numpy.ndarray, numpy.ndarray]: the names of the
+            methods that have samples, the start of each method's group, and
+            the sorted gas (as float64).
+    """
+    order = numpy.argsort(samples.method, kind="stable")
+    counts = numpy.bincount(samples.method, minlength=len(samples.method_names))
+    codes = numpy.flatnonzero(counts)
+    starts = numpy.concatenate([[0], numpy.cumsum(counts[codes])[:-1]])
+    return (
+        [samples.method_names[code] for code in codes],
+        starts.astype(numpy.intp),
+        samples.gas[order].astype(numpy.float64),
+    )
+
+
+def split_by_method(samples: GasSamples) -> List[Tuple[str, numpy.ndarray]]:
+
+    method_names, starts, gas = group_by_method(samples)
+    return list(zip(method_names, numpy.split(gas, starts[1:])))
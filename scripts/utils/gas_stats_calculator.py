@@ -1,88 +1,750 @@
 import sys
-from typing import Dict, List
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 
 import ape
 import numpy
 from evm_trace import CallTreeNode
-from pandas import DataFrame
 from rich.console import Console as RichConsole
-from sklearn.mixture import GaussianMixture
 
-from scripts.utils.call_tree_parser_utils import get_calltree
-from scripts.utils.call_tree_parsers import attempt_decode_call_signature
+from scripts.utils.call_tree_parser_utils import (
+    attempt_decode_call_signature, get_raw_trace, get_raw_traces,
+    get_raw_traces_in_block)
+from scripts.utils.flat_trace import (FlatTrace, get_address_id,
+                                      get_avg_gas_cost_per_selector,
+                                      parse_flat_trace)
+from scripts.utils.gas_samples import (GasSamples, gas_samples_from_rows,
+                                       get_empty_gas_samples, split_by_method)
+from scripts.utils.mixture import (WarmStart, fit_gaussian_mixtures,
+                                   get_max_components,
+                                   select_gaussian_mixtures)
+from scripts.utils.quantile_sketch import QuantileSketch, get_sketch_gas_table
+from scripts.utils.rolling_stats import (BucketMoments, get_bucket_moments,
+                                         get_rolling_gas_table,
+                                         get_rolling_stats_settings)
+from scripts.utils.sample_store import (TX_INDEX_BITS, get_tx_keys,
+                                        record_gas_samples)
+from scripts.utils.selector_index import get_method_name
+from scripts.utils.univariate_stats import (get_m2, get_univariate_gas_tables,
+                                            merge_moments,
+                                            merge_univariate_gas_stats)
 
 RICH_CONSOLE = RichConsole(file=sys.stdout)
 
 
-def get_gas_cost_for_txes(pool: ape.Contract, txes: List[str]) -> DataFrame:
+def _map_concurrently(fn: Callable, items: List, concurrency: int) -> List:
+
+    if concurrency <= 1:
+        return [fn(item) for item in items]
+
+    # results are slotted back at their item's index as they complete, so the
+    # output has the same ordering as the sequential path:
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(fn, item): idx for idx, item in enumerate(items)}
+        for num_completed, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if num_completed % 1000 == 0:
+                RICH_CONSOLE.log(f"... done [blue]{num_completed}/{len(items)}")
+
+    return results
+
+
+def _get_raw_traces_for_tx_batch(
+    tx_batch: List[str],
+) -> List[Optional[List[Dict]]]:
+
+    if len(tx_batch) == 1:
+        return [get_raw_trace(tx_batch[0])]
+
+    return get_raw_traces(tx_batch)
+
+
+def _get_tx_batches(txes: List, batch_size: int) -> List[List]:
+    return [
+        txes[start:end]
+        for start, end in zip(
+            range(0, len(txes), batch_size),
+            range(batch_size, len(txes) + batch_size, batch_size),
+        )
+    ]
+
+
+def _get_block_txes(txes: List[Tuple[int, str]]) -> Dict[int, List[str]]:
+
+    # dicts as ordered sets, so deduplicating stays O(1) per tx:
+    block_txes = defaultdict(dict)
+    for block_number, tx in txes:
+        block_txes[block_number][tx] = None
+
+    return {
+        block_number: list(block_tx_set)
+        for block_number, block_tx_set in block_txes.items()
+    }
+
+
+def get_gas_cost_for_txes(
+    pool: ape.Contract,
+    txes: List[Tuple[int, str]],
+    concurrency: int = 1,
+    batch_size: int = 1,
+) -> GasSamples:
 
     RICH_CONSOLE.log("Fetching gas costs ...")
-    gas_costs_for_pool = []
-    for tx in txes:
-        gas_costs = get_gas_cost_for_contract(pool, tx)
-        if gas_costs:
-            gas_costs_for_pool.append(gas_costs)
 
-    return DataFrame(gas_costs_for_pool)
+    def _get_gas_cost_for_tx_batch(
+        tx_batch: List[Tuple[int, str]]
+    ) -> List[Dict[str, int]]:
+        raw_traces = _get_raw_traces_for_tx_batch([tx for _, tx in tx_batch])
+        return [
+            get_gas_cost_for_raw_trace(pool, tx, raw_trace)
+            for (_, tx), raw_trace in zip(tx_batch, raw_traces)
+        ]
+
+    tx_batches = _get_tx_batches(txes, batch_size)
+    gas_costs_for_batches = _map_concurrently(
+        _get_gas_cost_for_tx_batch, tx_batches, concurrency
+    )
+    return gas_samples_from_rows(
+        [
+            (block_number, gas_costs)
+            for tx_batch, gas_costs_for_batch in zip(tx_batches, gas_costs_for_batches)
+            for (block_number, _), gas_costs in zip(tx_batch, gas_costs_for_batch)
+            if gas_costs
+        ]
+    )
+
+
+def get_gas_cost_for_pools_by_block(
+    pool_txes: Dict[str, Tuple[ape.Contract, List[Tuple[int, str]]]],
+    concurrency: int = 1,
+) -> Dict[str, GasSamples]:
+    """
+    Get gas costs for several pools at once, tracing whole blocks with
+    ``trace_block`` instead of tracing each transaction separately. Each block
+    is traced once, and its transaction traces are handed to every pool that
+    has transactions in it.
+
+    Args:
+        pool_txes (Dict): pool address -> (pool contract, [(block, tx hash)]).
+        concurrency (int): number of ``trace_block`` requests in flight.
+
+    Returns:
+        Dict[str, GasSamples]: pool address -> gas costs.
+    """
+
+    # tx hash -> pools that need the tx:
+    tx_pools = defaultdict(list)
+    for pool_addr, (_, txes) in pool_txes.items():
+        for _, tx in txes:
+            tx_pools[tx].append(pool_addr)
+    block_txes = _get_block_txes([tx for _, txes in pool_txes.values() for tx in txes])
+
+    RICH_CONSOLE.log(
+        f"Fetching gas costs for [blue]{len(pool_txes)} pools from "
+        f"[blue]{len(block_txes)} blocks ..."
+    )
+    gas_costs = {pool_addr: {} for pool_addr in pool_txes}
+
+    def _get_gas_cost_for_block(block_number: int):
+        txes = block_txes[block_number]
+        raw_traces = get_raw_traces_in_block(block_number, txes)
+        for tx, raw_trace in zip(txes, raw_traces):
+            for pool_addr in tx_pools[tx]:
+                gas_costs[pool_addr][tx] = get_gas_cost_for_raw_trace(
+                    pool_txes[pool_addr][0], tx, raw_trace
+                )
+
+    _map_concurrently(_get_gas_cost_for_block, list(block_txes), concurrency)
+
+    return {
+        pool_addr: gas_samples_from_rows(
+            [
+                (block_number, gas_costs[pool_addr][tx])
+                for block_number, tx in txes
+                if gas_costs[pool_addr].get(tx)
+            ]
+        )
+        for pool_addr, (_, txes) in pool_txes.items()
+    }
+
+
+class PoolGasAccumulator:
+    """
+    Attributes the gas in a trace to every known pool that shows up in it.
+
+    Each trace is walked once, and per-method gas rows are written for every
+    pool in the trace, not just the pool the tx was discovered for. Router and
+    zap txes fetched for one pool then also count towards the stats of every
+    other pool they touch, at no extra RPC cost. Rows are kept per selector;
+    selectors are decoded with a pool's ABI only when its gas costs are read.
+    """
+
+    def __init__(self, pool_addresses: List[str]):
+
+        self._pools = {get_address_id(addr): addr for addr in pool_addresses}
+        self._pool_address_ids = numpy.array(sorted(self._pools), dtype=numpy.int32)
+        # pool address -> tx hash -> (block number, selector -> avg gas):
+        self._rows = {addr: {} for addr in self._pools.values()}
+        self._traced_txes = set()
+        self._lock = threading.Lock()
+
+    def has_traced(self, tx_hash: str) -> bool:
+        return tx_hash in self._traced_txes
+
+    def add_raw_trace(self, tx_hash: str, raw_trace: Optional[List[Dict]]):
+
+        try:
+            flat_trace = parse_flat_trace(raw_trace)
+        except Exception:
+            RICH_CONSOLE.log(f"[yellow]Could not parse trace for tx [red]{tx_hash}.")
+            RICH_CONSOLE.print_exception()
+            flat_trace = None
+
+        rows = {}
+        if flat_trace:
+            pool_address_ids = numpy.unique(
+                flat_trace.address_id[
+                    numpy.isin(flat_trace.address_id, self._pool_address_ids)
+                ]
+            )
+            for address_id in pool_address_ids:
+                pool_addr = self._pools[int(address_id)]
+                record_gas_samples(pool_addr, flat_trace, int(address_id))
+                gas_costs = get_avg_gas_cost_per_selector(flat_trace, int(address_id))
+                if gas_costs:
+                    rows[pool_addr] = gas_costs
+
+        with self._lock:
+            self._traced_txes.add(tx_hash)
+            for pool_addr, gas_costs in rows.items():
+                self._rows[pool_addr][tx_hash] = (
+                    flat_trace.block_number,
+                    gas_costs,
+                )
+
+    def get_gas_costs(self, pool: ape.Contract, max_transactions: int) -> GasSamples:
+        """
+        Gas costs for the newest ``max_transactions`` txes that touched a pool.
+        """
+        pool_addr = self._pools[get_address_id(pool.address)]
+        rows = sorted(self._rows[pool_addr].values(), key=lambda row: row[0])
+        rows = rows[-max_transactions:]
+
+        # decode each selector once with the pool's ABI:
+        method_names = {}
+        for _, gas_costs in rows:
+            for selector in gas_costs:
+                if selector not in method_names:
+                    method_names[selector] = get_method_name(pool, selector)
+
+        return gas_samples_from_rows(
+            [
+                (
+                    block_number,
+                    {
+                        method_names[selector]: gas_cost
+                        for selector, gas_cost in gas_costs.items()
+                    },
+                )
+                for block_number, gas_costs in rows
+            ]
+        )
+
+
+def get_gas_costs_from_samples(
+    pool: ape.Contract,
+    samples: Dict[str, numpy.ndarray],
+    max_transactions: int,
+) -> GasSamples:
+    """
+    Gas costs of the newest ``max_transactions`` txes in a pool's stored
+    samples (see ``SampleStore.scan``), averaged per tx and method like traced
+    gas costs are.
+    """
+    if samples["gas"].size == 0:
+        return get_empty_gas_samples()
+
+    txes, tx_idx = numpy.unique(
+        get_tx_keys(samples["block"], samples["tx_index"]), return_inverse=True
+    )
+    first_tx = max(0, txes.size - max_transactions)
+    keep = tx_idx >= first_tx
+    tx_idx = tx_idx[keep] - first_tx
+    selectors, selector_idx = numpy.unique(
+        samples["selector"][keep], return_inverse=True
+    )
+
+    # average gas per (tx, selector):
+    cells, cell_idx = numpy.unique(
+        tx_idx.astype(numpy.int64) * selectors.size + selector_idx,
+        return_inverse=True,
+    )
+    total_gas = numpy.bincount(cell_idx, weights=samples["gas"][keep])
+    num_calls = numpy.bincount(cell_idx)
+    cell_tx = cells // selectors.size
+
+    # overloaded methods share a name, and a method code:
+    method_codes = {}
+    selector_codes = numpy.array(
+        [
+            method_codes.setdefault(
+                get_method_name(pool, int(selector)), len(method_codes)
+            )
+            for selector in selectors
+        ],
+        dtype=numpy.int32,
+    )
+
+    return GasSamples(
+        method_names=list(method_codes),
+        method=selector_codes[cells % selectors.size],
+        gas=(total_gas // num_calls).astype(numpy.uint64),
+        block=(txes[first_tx:][cell_tx] >> numpy.uint64(TX_INDEX_BITS)).astype(
+            numpy.uint32
+        ),
+        tx=cell_tx.astype(numpy.int32),
+    )
+
+
+def attribute_gas_for_txes(
+    accumulator: PoolGasAccumulator,
+    txes: List[str],
+    concurrency: int = 1,
+    batch_size: int = 1,
+):
+
+    txes = [tx for tx in txes if not accumulator.has_traced(tx)]
+    RICH_CONSOLE.log(f"Attributing gas costs for [blue]{len(txes)} new txes ...")
+
+    def _attribute_tx_batch(tx_batch: List[str]):
+        raw_traces = _get_raw_traces_for_tx_batch(tx_batch)
+        for tx, raw_trace in zip(tx_batch, raw_traces):
+            accumulator.add_raw_trace(tx, raw_trace)
+
+    _map_concurrently(
+        _attribute_tx_batch, _get_tx_batches(txes, batch_size), concurrency
+    )
+
+
+def attribute_gas_for_txes_by_block(
+    accumulator: PoolGasAccumulator,
+    txes: List[Tuple[int, str]],
+    concurrency: int = 1,
+):
+
+    block_txes = _get_block_txes(
+        [(block, tx) for block, tx in txes if not accumulator.has_traced(tx)]
+    )
+    RICH_CONSOLE.log(f"Attributing gas costs from [blue]{len(block_txes)} blocks ...")
+
+    def _attribute_block(block_number: int):
+        txes_in_block = block_txes[block_number]
+        raw_traces = get_raw_traces_in_block(block_number, txes_in_block)
+        for tx, raw_trace in zip(txes_in_block, raw_traces):
+            accumulator.add_raw_trace(tx, raw_trace)
+
+    _map_concurrently(_attribute_block, list(block_txes), concurrency)
 
 
 def compute_univariate_gaussian_gas_stats_for_txes(
-    gas_costs_for_pool: DataFrame,
+    gas_costs_for_pool: GasSamples,
+    previous_gas_stats: Optional[Dict] = None,
 ) -> Dict:
 
     RICH_CONSOLE.log("Computing univariate gas stats ...")
 
-    gas_table = (
-        gas_costs_for_pool.describe()
-        .loc[["mean", "std", "min", "max", "count"]]
-        .fillna(0)
-        .astype(int)
-        .to_dict()
+    if gas_costs_for_pool.empty:
+        return {"univariate": {}}
+
+    return {"univariate": get_univariate_gas_tables(gas_costs_for_pool)}
+
+
+def compute_quantile_sketch_gas_stats_for_txes(
+    gas_costs_for_pool: GasSamples,
+    previous_gas_stats: Optional[Dict] = None,
+) -> Dict:
+
+    RICH_CONSOLE.log("Computing gas quantile sketches ...")
+
+    gas_table = {}
+    for method_name, gas_costs in split_by_method(gas_costs_for_pool):
+        sketch = QuantileSketch()
+        sketch.add(gas_costs)
+        gas_table[method_name] = get_sketch_gas_table(sketch)
+
+    return {"quantiles": gas_table}
+
+
+def _get_bimodal_warm_start(stats: Optional[Dict]) -> Optional[WarmStart]:
+
+    if not stats:
+        return None
+
+    # tables written before weights were stored: equal weights
+    components = sorted(
+        (stats[f"mean_{i}"], stats[f"std_{i}"], stats.get(f"weight_{i}", 0.5))
+        for i in (1, 2)
+    )
+    means, stds, weights = zip(*components)
+    return WarmStart(
+        weights=numpy.array(weights) / sum(weights),
+        means=numpy.array(means, dtype=float),
+        stds=numpy.array(stds, dtype=float),
     )
-    return {"univariate": gas_table}
 
 
 def compute_bimodal_gaussian_gas_stats_for_txes(
-    gas_costs_for_pool: DataFrame,
+    gas_costs_for_pool: GasSamples,
+    previous_gas_stats: Optional[Dict] = None,
 ) -> Dict:
 
     RICH_CONSOLE.log("Computing bimodal gaussian gas stats ...")
 
-    gas_table = {}
-    for method_name, gas_costs in gas_costs_for_pool.items():
-
-        gas_costs = gas_costs.dropna().to_numpy().reshape(-1, 1)
+    previous_gas_table = (previous_gas_stats or {}).get("bimodal", {})
+    method_names, samples, warm_starts = [], [], []
+    for method_name, gas_costs in split_by_method(gas_costs_for_pool):
 
-        if gas_costs.shape[0] < 2:
+        if gas_costs.size < 2:
             RICH_CONSOLE.log(
                 f"Not enough txes to compute bimodal gaussian gas stats "
                 f"for method: {method_name}. Skipping."
             )
             continue
 
-        bimodal_model_fit = GaussianMixture(n_components=2).fit(gas_costs)
+        method_names.append(method_name)
+        samples.append(gas_costs)
+        warm_starts.append(_get_bimodal_warm_start(previous_gas_table.get(method_name)))
 
-        # min, max:
-        gas_table_method = {}
-        gas_table_method["min"] = int(min(gas_costs)[0])
-        gas_table_method["max"] = int(max(gas_costs)[0])
-
-        # means:
-        gas_table_method["mean_1"] = int(bimodal_model_fit.means_[0][0])
-        gas_table_method["mean_2"] = int(bimodal_model_fit.means_[1][0])
-
-        # standard deviations:
-        covariances = bimodal_model_fit.covariances_
-        std = [numpy.sqrt(numpy.trace(covariances[i]) / 2) for i in range(2)]
-        gas_table_method["std_1"] = int(std[0])
-        gas_table_method["std_2"] = int(std[1])
-        gas_table_method["count"] = gas_costs.shape[0]
+    # all methods are fitted in one go, warm started from the previous run:
+    gas_table = {}
+    fits = fit_gaussian_mixtures(samples, 2, warm_starts)
+    for method_name, gas_costs, fit in zip(method_names, samples, fits):
+
+        gas_table_method = {
+            "min": int(gas_costs.min()),
+            "max": int(gas_costs.max()),
+        }
+        for idx in range(2):
+            gas_table_method[f"mean_{idx + 1}"] = int(fit.means[idx])
+            gas_table_method[f"std_{idx + 1}"] = int(fit.stds[idx])
+            gas_table_method[f"weight_{idx + 1}"] = round(float(fit.weights[idx]), 4)
+        gas_table_method["count"] = gas_costs.size
 
         gas_table[method_name] = gas_table_method
 
     return {"bimodal": gas_table}
 
 
+def _get_mixture_warm_start(stats: Optional[Dict]) -> Optional[WarmStart]:
+
+    if not stats:
+        return None
+
+    components = stats["components"]
+    return WarmStart(
+        weights=numpy.array([c["weight"] for c in components], dtype=float),
+        means=numpy.array([c["mean"] for c in components], dtype=float),
+        stds=numpy.array([c["std"] for c in components], dtype=float),
+    )
+
+
+def compute_mixture_gas_stats_for_txes(
+    gas_costs_for_pool: GasSamples,
+    previous_gas_stats: Optional[Dict] = None,
+) -> Dict:
+
+    max_components = get_max_components()
+    RICH_CONSOLE.log(
+        f"Selecting gaussian mixtures with up to {max_components} " f"components ..."
+    )
+
+    previous_gas_table = (previous_gas_stats or {}).get("mixture", {})
+    method_names, samples, warm_starts = [], [], []
+    for method_name, gas_costs in split_by_method(gas_costs_for_pool):
+        method_names.append(method_name)
+        samples.append(gas_costs)
+        warm_starts.append(_get_mixture_warm_start(previous_gas_table.get(method_name)))
+
+    # a warm start only applies to fits with its number of components:
+    gas_table = {}
+    best_fits = select_gaussian_mixtures(samples, max_components, warm_starts)
+    for method_name, gas_costs, (fit, bic) in zip(method_names, samples, best_fits):
+        gas_table[method_name] = {
+            "k": len(fit.means),
+            "bic": round(bic, 1),
+            "components": [
+                {
+                    "mean": int(mean),
+                    "std": int(std),
+                    "weight": round(float(weight), 4),
+                }
+                for mean, std, weight in zip(fit.means, fit.stds, fit.weights)
+            ],
+            "min": int(gas_costs.min()),
+            "max": int(gas_costs.max()),
+            "count": gas_costs.size,
+        }
+
+    return {"mixture": gas_table}
+
+
+def compute_rolling_gas_stats_for_txes(
+    gas_costs_for_pool: GasSamples,
+    previous_gas_stats: Optional[Dict] = None,
+) -> Dict:
+
+    bucket_blocks, half_life_buckets = get_rolling_stats_settings()
+    if not bucket_blocks or gas_costs_for_pool.empty:
+        return {"rolling": {}}
+
+    RICH_CONSOLE.log(
+        f"Computing rolling gas stats over {bucket_blocks} block buckets ..."
+    )
+
+    moments = get_bucket_moments(gas_costs_for_pool, bucket_blocks)
+    gas_table = get_rolling_gas_table(
+        gas_costs_for_pool.method_names,
+        moments,
+        bucket_blocks,
+        half_life_buckets,
+    )
+    return {"rolling": gas_table}
+
+
+def _get_bimodal_components(stats: Dict) -> List[Tuple[float, float, float]]:
+
+    # (count, mean, std) of each component, by mean. tables written before
+    # weights were stored split the count evenly.
+    return sorted(
+        (
+            stats["count"] * stats.get(f"weight_{i}", 0.5),
+            stats[f"mean_{i}"],
+            stats[f"std_{i}"],
+        )
+        for i in (1, 2)
+    )
+
+
+def merge_bimodal_gas_stats(cached_gas_table: Dict, gas_table: Dict) -> Dict:
+
+    # components are matched by mean, and merged as if each one held exactly
+    # its weight's share of the samples. unlike the univariate merge, this is
+    # an approximation.
+    merged_gas_table = dict(cached_gas_table)
+    for method_name, stats in gas_table.items():
+
+        cached_stats = cached_gas_table.get(method_name)
+        if not cached_stats:
+            merged_gas_table[method_name] = stats
+            continue
+
+        merged_stats = {
+            "min": min(cached_stats["min"], stats["min"]),
+            "max": max(cached_stats["max"], stats["max"]),
+        }
+        total_count = cached_stats["count"] + stats["count"]
+        components = zip(
+            _get_bimodal_components(cached_stats),
+            _get_bimodal_components(stats),
+        )
+        for idx, (
+            (count_a, mean_a, std_a),
+            (count_b, mean_b, std_b),
+        ) in enumerate(components, start=1):
+            count, mean, m2 = merge_moments(
+                count_a,
+                mean_a,
+                std_a**2 * count_a,
+                count_b,
+                mean_b,
+                std_b**2 * count_b,
+            )
+            merged_stats[f"mean_{idx}"] = int(mean)
+            merged_stats[f"std_{idx}"] = int(numpy.sqrt(m2 / count)) if count else 0
+            merged_stats[f"weight_{idx}"] = round(count / total_count, 4)
+        merged_stats["count"] = total_count
+
+        merged_gas_table[method_name] = merged_stats
+
+    return merged_gas_table
+
+
+def merge_mixture_gas_stats(cached_gas_table: Dict, gas_table: Dict) -> Dict:
+
+    # mixtures with the same number of components are merged component by
+    # component (matched by mean), like bimodal stats. otherwise the mixture
+    # fitted on more samples is kept. both are approximations.
+    merged_gas_table = dict(cached_gas_table)
+    for method_name, stats in gas_table.items():
+
+        cached_stats = cached_gas_table.get(method_name)
+        if not cached_stats:
+            merged_gas_table[method_name] = stats
+            continue
+
+        total_count = cached_stats["count"] + stats["count"]
+        if cached_stats["k"] == stats["k"]:
+            components = []
+            for component_a, component_b in zip(
+                cached_stats["components"], stats["components"]
+            ):
+                count_a = cached_stats["count"] * component_a["weight"]
+                count_b = stats["count"] * component_b["weight"]
+                count, mean, m2 = merge_moments(
+                    count_a,
+                    component_a["mean"],
+                    component_a["std"] ** 2 * count_a,
+                    count_b,
+                    component_b["mean"],
+                    component_b["std"] ** 2 * count_b,
+                )
+                components.append(
+                    {
+                        "mean": int(mean),
+                        "std": int(numpy.sqrt(m2 / count)) if count else 0,
+                        "weight": round(count / total_count, 4),
+                    }
+                )
+            merged_stats = {"k": stats["k"], "components": components}
+        elif cached_stats["count"] > stats["count"]:
+            merged_stats = {
+                "k": cached_stats["k"],
+                "components": cached_stats["components"],
+            }
+        else:
+            merged_stats = {"k": stats["k"], "components": stats["components"]}
+
+        # bic is per fit, and there is no single fit behind merged components:
+        merged_gas_table[method_name] = {
+            **merged_stats,
+            "min": min(cached_stats["min"], stats["min"]),
+            "max": max(cached_stats["max"], stats["max"]),
+            "count": total_count,
+        }
+
+    return merged_gas_table
+
+
+def merge_quantile_sketch_gas_stats(cached_gas_table: Dict, gas_table: Dict) -> Dict:
+
+    merged_gas_table = dict(cached_gas_table)
+    for method_name, stats in gas_table.items():
+
+        cached_stats = cached_gas_table.get(method_name)
+        if not cached_stats:
+            merged_gas_table[method_name] = stats
+            continue
+
+        sketch = QuantileSketch.from_dict(cached_stats["sketch"])
+        sketch.merge(QuantileSketch.from_dict(stats["sketch"]))
+        merged_gas_table[method_name] = get_sketch_gas_table(sketch)
+
+    return merged_gas_table
+
+
+def merge_rolling_gas_stats(cached_gas_table: Dict, gas_table: Dict) -> Dict:
+
+    if not gas_table:
+        return cached_gas_table
+
+    # buckets of different sizes don't line up, the new ones replace them:
+    settings = next(iter(gas_table.values()))
+    bucket_blocks = settings["bucket_blocks"]
+    if any(
+        stats["bucket_blocks"] != bucket_blocks for stats in cached_gas_table.values()
+    ):
+        return gas_table
+
+    method_names = list(dict.fromkeys([*cached_gas_table, *gas_table]))
+    bucket_rows = []
+    for code, method_name in enumerate(method_names):
+
+        buckets = {
+            bucket["start_block"]: bucket
+            for bucket in cached_gas_table.get(method_name, {}).get("buckets", [])
+        }
+        for bucket in gas_table.get(method_name, {}).get("buckets", []):
+            cached_bucket = buckets.get(bucket["start_block"])
+            if cached_bucket is None:
+                buckets[bucket["start_block"]] = bucket
+                continue
+
+            count, mean, m2 = merge_moments(
+                cached_bucket["count"],
+                cached_bucket["mean"],
+                get_m2(cached_bucket),
+                bucket["count"],
+                bucket["mean"],
+                get_m2(bucket),
+            )
+            buckets[bucket["start_block"]] = {
+                "count": count,
+                "mean": mean,
+                "m2": m2,
+                "min": min(cached_bucket["min"], bucket["min"]),
+                "max": max(cached_bucket["max"], bucket["max"]),
+            }
+
+        bucket_rows.extend(
+            (
+                code,
+                start_block,
+                bucket["count"],
+                bucket["mean"],
+                get_m2(bucket),
+                bucket["min"],
+                bucket["max"],
+            )
+            for start_block, bucket in sorted(buckets.items())
+        )
+
+    columns = numpy.array(bucket_rows, dtype=numpy.float64).T
+    moments = BucketMoments(
+        method=columns[0].astype(numpy.int64),
+        start_block=columns[1].astype(numpy.int64),
+        count=columns[2],
+        mean=columns[3],
+        m2=columns[4],
+        min=columns[5],
+        max=columns[6],
+    )
+    return get_rolling_gas_table(
+        method_names, moments, bucket_blocks, settings["half_life_buckets"]
+    )
+
+
+GAS_STATS_MERGERS = {
+    "univariate": merge_univariate_gas_stats,
+    "bimodal": merge_bimodal_gas_stats,
+    "mixture": merge_mixture_gas_stats,
+    "quantiles": merge_quantile_sketch_gas_stats,
+    "rolling": merge_rolling_gas_stats,
+}
+
+
+def merge_gas_stats(cached_gas_stats: Dict, gas_stats: Dict) -> Dict:
+    """
+    Fold gas stats of new txes into gas stats of older txes, per stats type
+    (see ``GAS_STATS_MERGERS``). Stats types that only one side has are kept
+    as they are.
+    """
+    merged_gas_stats = {}
+    for stats_type in GAS_STATS_MERGERS:
+        if stats_type in cached_gas_stats and stats_type in gas_stats:
+            merged_gas_stats[stats_type] = GAS_STATS_MERGERS[stats_type](
+                cached_gas_stats[stats_type], gas_stats[stats_type]
+            )
+        elif stats_type in gas_stats:
+            merged_gas_stats[stats_type] = gas_stats[stats_type]
+        elif stats_type in cached_gas_stats:
+            merged_gas_stats[stats_type] = cached_gas_stats[stats_type]
+
+    return merged_gas_stats
+
+
 def get_avg_gas_cost_per_method_for_tx(
     contract: ape.Contract,
     tree: CallTreeNode,
@@ -101,7 +763,7 @@ def get_avg_gas_cost_per_method_for_tx(
         # decode call signature
         method_name = attempt_decode_call_signature(contract, call.info.calldata[:4])
 
-        if call.info.method_id not in call_costs.keys():
+        if method_name not in call_costs.keys():
             call_costs[method_name] = [call.info.gas_cost]
             continue
 
@@ -109,20 +771,44 @@ def get_avg_gas_cost_per_method_for_tx(
 
     # average gas cost per method
     # warning: this is data compression!!! we only keep the average!
+    avg_call_costs = {}
     for method_name, costs in call_costs.items():
         costs = [i for i in costs if i is not None]
         if costs:
-            call_costs[method_name] = sum(costs) // len(costs)
+            avg_call_costs[method_name] = sum(costs) // len(costs)
 
-    return call_costs
+    return avg_call_costs
 
 
-def get_gas_cost_for_contract(contract: ape.Contract, tx_hash: str) -> Dict[str, int]:
+def get_avg_gas_cost_per_method_for_flat_trace(
+    contract: ape.Contract,
+    flat_trace: FlatTrace,
+) -> Dict[str, int]:
 
-    call_tree = get_calltree(tx_hash=tx_hash)
-    if call_tree:
+    # same as get_avg_gas_cost_per_method_for_tx, but aggregates on the flat
+    # trace arrays and only decodes each selector once:
+    avg_call_costs = get_avg_gas_cost_per_selector(
+        flat_trace, get_address_id(contract.address)
+    )
+    return {
+        get_method_name(contract, selector): gas_cost
+        for selector, gas_cost in avg_call_costs.items()
+    }
+
+
+def get_gas_cost_for_raw_trace(
+    contract: ape.Contract, tx_hash: str, raw_trace: Optional[List[Dict]]
+) -> Dict[str, int]:
+
+    if raw_trace:
         try:
-            agg_gas_costs = get_avg_gas_cost_per_method_for_tx(contract, call_tree)
+            flat_trace = parse_flat_trace(raw_trace)
+            record_gas_samples(
+                contract.address, flat_trace, get_address_id(contract.address)
+            )
+            agg_gas_costs = get_avg_gas_cost_per_method_for_flat_trace(
+                contract, flat_trace
+            )
             return agg_gas_costs
         except:
             RICH_CONSOLE.log(
@@ -132,3 +818,9 @@ def get_gas_cost_for_contract(contract: ape.Contract, tx_hash: str) -> Dict[str,
             return {}
     else:
         return {}
+
+
+def get_gas_cost_for_contract(contract: ape.Contract, tx_hash: str) -> Dict[str, int]:
+
+    raw_trace = get_raw_trace(tx_hash)
+    return get_gas_cost_for_raw_trace(contract, tx_hash, raw_trace)
@@ -0,0 +1,269 @@
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy
+
+MAX_ITER = 200
+TOL = 1e-6  # change in mean log likelihood per sample
+VAR_FLOOR = 1.0  # gas^2, keeps components on repeated values from collapsing
+# stored weights are rounded, so a warm start can have weights of 0, which
+# would pin those components at 0 (log(0) in the e-step) for good:
+WARM_START_WEIGHT_FLOOR = 1e-3
+DEFAULT_MAX_COMPONENTS = 3
+MIN_VALUES_PER_COMPONENT = 3
+PARALLEL_MIN_VALUES = 20000  # values per worker task, below that fits run inline
+
+_MAX_COMPONENTS = DEFAULT_MAX_COMPONENTS
+_WORKERS = 1
+_EXECUTOR = None
+
+
+class GaussianMixtureFit(NamedTuple):
+    """
+    A 1-D gaussian mixture, components ordered by mean.
+    """
+
+    weights: numpy.ndarray
+    means: numpy.ndarray
+    stds: numpy.ndarray
+    log_likelihood: float  # total, over all samples
+    n_iter: int
+
+
+class WarmStart(NamedTuple):
+
+    weights: numpy.ndarray
+    means: numpy.ndarray
+    stds: numpy.ndarray
+
+
+def _pad(samples: List[numpy.ndarray]):
+
+    max_size = max(x.size for x in samples)
+    x = numpy.zeros((len(samples), max_size))
+    mask = numpy.zeros((len(samples), max_size), dtype=bool)
+    for idx, sample in enumerate(samples):
+        x[idx, : sample.size] = sample
+        mask[idx, : sample.size] = True
+
+    return x, mask
+
+
+def _init_params(
+    samples: List[numpy.ndarray],
+    n_components: int,
+    warm_starts: Optional[List[Optional[WarmStart]]],
+):
+
+    weights = numpy.full((len(samples), n_components), 1 / n_components)
+    means = numpy.zeros((len(samples), n_components))
+    variances = numpy.zeros((len(samples), n_components))
+    for idx, sample in enumerate(samples):
+
+        warm_start = warm_starts[idx] if warm_starts else None
+        if warm_start is not None and len(warm_start.means) == n_components:
+            warm_weights = numpy.maximum(
+                numpy.asarray(warm_start.weights, dtype=float),
+                WARM_START_WEIGHT_FLOOR,
+            )
+            weights[idx] = warm_weights / warm_weights.sum()
+            means[idx] = warm_start.means
+            variances[idx] = numpy.asarray(warm_start.stds, dtype=float) ** 2
+            continue
+
+        # deterministic cold start: components spread over the sample's
+        # quantiles, each as wide as the whole sample
+        means[idx] = numpy.quantile(
+            sample, (numpy.arange(n_components) + 0.5) / n_components
+        )
+        variances[idx] = sample.var()
+
+    return weights, means, numpy.maximum(variances, VAR_FLOOR)
+
+
+def fit_gaussian_mixtures(
+    samples: List[numpy.ndarray],
+    n_components: int,
+    warm_starts: Optional[List[Optional[WarmStart]]] = None,
+) -> List[GaussianMixtureFit]:
+    """
+    Fit a 1-D gaussian mixture with ``n_components`` components to each
+    sample, with expectation maximization. All samples are fitted at once, as
+    one padded (samples x components x values) array, until every fit has
+    converged.
+
+    Fits are deterministic: they start from ``warm_starts`` (e.g. the previous
+    run's components) where given, and from the sample's quantiles otherwise.
+    """
+    if not samples:
+        return []
+
+    weights, means, variances = _init_params(samples, n_components, warm_starts)
+    log_likelihood = numpy.zeros(len(samples))
+    n_iters = numpy.zeros(len(samples), dtype=int)
+
+    # fits that converged are dropped from the arrays, so the remaining
+    # iterations only cost as much as the fits that still need them:
+    active = numpy.arange(len(samples))
+    x, mask = _pad(samples)
+    sizes = mask.sum(axis=1)
+    previous_log_likelihood = numpy.full(len(samples), -numpy.inf)
+    for n_iter in range(1, MAX_ITER + 1):
+
+        # (samples, components, values), so that reductions run over the
+        # last, contiguous axis:
+        xs = x[active][:, None, :]
+        masks = mask[active][:, None, :]
+        w, mu, var = weights[active], means[active], variances[active]
+
+        # e-step, in log space:
+        log_prob = (
+            numpy.log(w)[:, :, None]
+            - 0.5 * numpy.log(2 * numpy.pi * var)[:, :, None]
+            - 0.5 * (xs - mu[:, :, None]) ** 2 / var[:, :, None]
+        )
+        max_log_prob = log_prob.max(axis=1, keepdims=True)
+        log_norm = max_log_prob + numpy.log(
+            numpy.exp(log_prob - max_log_prob).sum(axis=1, keepdims=True)
+        )
+        resp = numpy.exp(log_prob - log_norm) * masks
+        log_likelihood[active] = (log_norm * masks).sum(axis=(1, 2))
+
+        # m-step:
+        resp_sums = resp.sum(axis=2) + 10 * numpy.finfo(float).eps
+        weights[active] = resp_sums / sizes[active, None]
+        mu = (resp * xs).sum(axis=2) / resp_sums
+        means[active] = mu
+        variances[active] = numpy.maximum(
+            (resp * (xs - mu[:, :, None]) ** 2).sum(axis=2) / resp_sums,
+            VAR_FLOOR,
+        )
+        n_iters[active] = n_iter
+
+        change = (
+            numpy.abs(log_likelihood[active] - previous_log_likelihood[active])
+            / sizes[active]
+        )
+        previous_log_likelihood[active] = log_likelihood[active]
+        active = active[change >= TOL]
+        if active.size == 0:
+            break
+
+        # the padding only has to fit the longest sample that's still active:
+        x, mask = x[:, : sizes[active].max()], mask[:, : sizes[active].max()]
+
+    fits = []
+    for idx in range(len(samples)):
+        order = numpy.argsort(means[idx], kind="stable")
+        fits.append(
+            GaussianMixtureFit(
+                weights=weights[idx][order],
+                means=means[idx][order],
+                stds=numpy.sqrt(variances[idx][order]),
+                log_likelihood=float(log_likelihood[idx]),
+                n_iter=int(n_iters[idx]),
+            )
+        )
+
+    return fits
+
+
+def get_bic(fit: GaussianMixtureFit, sample_size: int) -> float:
+
+    # k means, k variances and k - 1 free weights:
+    num_params = 3 * len(fit.means) - 1
+    return -2 * fit.log_likelihood + num_params * numpy.log(sample_size)
+
+
+def configure_mixture_selection(max_components: int, workers: int):
+
+    global _MAX_COMPONENTS, _WORKERS
+    _MAX_COMPONENTS = max_components
+    _WORKERS = workers
+
+
+def get_max_components() -> int:
+    return _MAX_COMPONENTS
+
+
+def _get_executor() -> ProcessPoolExecutor:
+
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        # spawn: workers only need numpy, and don't inherit the parent's
+        # threads and open connections
+        _EXECUTOR = ProcessPoolExecutor(
+            max_workers=_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        atexit.register(_EXECUTOR.shutdown)
+
+    return _EXECUTOR
+
+
+def _fit_task(task: Tuple) -> List[GaussianMixtureFit]:
+    samples, n_components, warm_starts = task
+    return fit_gaussian_mixtures(samples, n_components, warm_starts)
+
+
+def select_gaussian_mixtures(
+    samples: List[numpy.ndarray],
+    max_components: int,
+    warm_starts: Optional[List[Optional[WarmStart]]] = None,
+) -> List[Tuple[GaussianMixtureFit, float]]:
+    """
+    Fit mixtures with 1 to ``max_components`` components to each sample, and
+    keep the one with the lowest BIC. A sample only gets mixtures with at
+    least ``MIN_VALUES_PER_COMPONENT`` values per component (and always gets
+    the 1 component fit).
+
+    The (number of components, chunk of samples) fits are spread over a pool
+    of ``_WORKERS`` processes, unless there are too few values to be worth it.
+
+    Returns:
+        List[Tuple[GaussianMixtureFit, float]]: the best fit of each sample,
+            and its BIC.
+    """
+    warm_starts = warm_starts or [None] * len(samples)
+    tasks = []
+    for n_components in range(1, max_components + 1):
+        # samples of similar size go in the same chunk, to keep padding small:
+        idxs = sorted(
+            (
+                idx
+                for idx, sample in enumerate(samples)
+                if n_components == 1
+                or sample.size >= n_components * MIN_VALUES_PER_COMPONENT
+            ),
+            key=lambda idx: samples[idx].size,
+        )
+        num_values = sum(samples[idx].size for idx in idxs)
+        num_chunks = max(1, min(_WORKERS, num_values // PARALLEL_MIN_VALUES))
+        for chunk in numpy.array_split(numpy.array(idxs, dtype=int), num_chunks):
+            if chunk.size:
+                tasks.append((n_components, chunk.tolist()))
+
+    task_args = [
+        (
+            [samples[idx] for idx in idxs],
+            n_components,
+            [warm_starts[idx] for idx in idxs],
+        )
+        for n_components, idxs in tasks
+    ]
+    total_values = sum(sum(samples[idx].size for idx in idxs) for _, idxs in tasks)
+    if _WORKERS > 1 and total_values >= PARALLEL_MIN_VALUES:
+        task_fits = list(_get_executor().map(_fit_task, task_args))
+    else:
+        task_fits = [_fit_task(args) for args in task_args]
+
+    best_fits = [None] * len(samples)
+    for (_, idxs), fits in zip(tasks, task_fits):
+        for idx, fit in zip(idxs, fits):
+            bic = get_bic(fit, samples[idx].size)
+            if best_fits[idx] is None or bic < best_fits[idx][1]:
+                best_fits[idx] = (fit, bic)
+
+    return best_fits
@@ -1,9 +1,16 @@
+import os
 import sys
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 import ape
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
 from rich.console import Console as RichConsole
 
+from scripts.utils.call_tree_parser_utils import post_batch
+from scripts.utils.fast_json import json_dumps, json_loads
+
 RICH_CONSOLE = RichConsole(file=sys.stdout)
 REGISTRIES = {
     "MAIN_REGISTRY": "0x90E00ACe148ca3b23Ac1bC8C240C2a7Dd9c2d7f5",
@@ -11,29 +18,158 @@ REGISTRIES = {
     "CRYPTOSWAP_REGISTRY": "0x8F942C20D02bEfc377D41445793068908E2250D0",
     "CRYPTOSWAP_FACTORY": "0xF18056Bbd320E96A48e3Fbf8bC061322531aac99",
 }
+REGISTRY_SNAPSHOT_FILE = "./registry_snapshot.json"
+POOL_LIST_BATCH_SIZE = 500  # pool_list eth_calls per JSON-RPC batch
+
+POOL_COUNT_SELECTOR = function_signature_to_4byte_selector("pool_count()").hex()
+POOL_LIST_SELECTOR = function_signature_to_4byte_selector("pool_list(uint256)").hex()
+
+_REGISTRY_POOLS: Dict[str, List[str]] = {}
+_REGISTRY_POOLS_LOCK = threading.Lock()
+
+
+def _eth_call_params(registry: str, calldata: str, block_number: int) -> List:
+    return [{"to": registry, "data": f"0x{calldata}"}, hex(block_number)]
+
+
+def _get_pool_count_and_last_pool(
+    registry: str, num_cached_pools: int, block_number: int
+) -> Tuple[int, Optional[str]]:
+
+    # pool_count(), and pool_list(i) of the last cached pool (if any) to
+    # check the snapshot against, in one batch:
+    params = [_eth_call_params(registry, POOL_COUNT_SELECTOR, block_number)]
+    if num_cached_pools:
+        index = num_cached_pools - 1
+        params.append(
+            _eth_call_params(
+                registry, f"{POOL_LIST_SELECTOR}{index:064x}", block_number
+            )
+        )
+    responses = sorted(
+        post_batch("eth_call", params), key=lambda response: response["id"]
+    )
+    for response in responses:
+        if "error" in response:
+            raise ValueError(response["error"])
 
+    pool_count = int(responses[0]["result"], 16)
+    if len(responses) == 1:
+        return pool_count, None
 
-def _get_pools(registry: str):
+    return pool_count, to_checksum_address(f"0x{responses[1]['result'][-40:]}")
+
+
+def _get_pool_list(
+    registry: str, index_start: int, index_end: int, block_number: int
+) -> List[str]:
+
+    # pool_list(i) for i in [index_start, index_end), batched:
     pools = []
-    registry = ape.Contract(registry)
-    pool_count = registry.pool_count()
-    for i in range(pool_count):
-        pool = registry.pool_list(i)
-        if pool not in pools:
-            pools.append(pool)
+    for batch_start in range(index_start, index_end, POOL_LIST_BATCH_SIZE):
+        batch_end = min(batch_start + POOL_LIST_BATCH_SIZE, index_end)
+        responses = post_batch(
+            "eth_call",
+            [
+                _eth_call_params(
+                    registry, f"{POOL_LIST_SELECTOR}{i:064x}", block_number
+                )
+                for i in range(batch_start, batch_end)
+            ],
+        )
+        for response in sorted(responses, key=lambda response: response["id"]):
+            if "error" in response:
+                raise ValueError(response["error"])
+            pools.append(to_checksum_address(f"0x{response['result'][-40:]}"))
 
     return pools
 
 
+def _load_registry_snapshot() -> Dict:
+
+    if not os.path.exists(REGISTRY_SNAPSHOT_FILE):
+        return {}
+
+    with open(REGISTRY_SNAPSHOT_FILE, "rb") as f:
+        return json_loads(f.read())
+
+
+def _save_registry_snapshot(snapshot: Dict):
+
+    with open(f"{REGISTRY_SNAPSHOT_FILE}.tmp", "wb") as f:
+        f.write(json_dumps(snapshot))
+    os.replace(f"{REGISTRY_SNAPSHOT_FILE}.tmp", REGISTRY_SNAPSHOT_FILE)
+
+
+def _get_pools(registry: str, snapshot: Dict, block_number: int) -> List[str]:
+
+    cached = snapshot.get(registry, {"pool_count": 0, "pools": []})
+    pool_count, last_pool = _get_pool_count_and_last_pool(
+        registry, cached["pool_count"], block_number
+    )
+
+    # registries only ever append pools, except for pool removals in the main
+    # registry: a removal moves the last pool into the removed pool's slot,
+    # so it shrinks pool_count or, if pools were added since, changes the
+    # pool at the last cached index. Then we refetch everything:
+    if pool_count < cached["pool_count"] or (
+        cached["pools"] and last_pool != cached["pools"][-1]
+    ):
+        RICH_CONSOLE.log(
+            f"[yellow]Registry [blue]{registry} changed since the snapshot, "
+            "fetching all its pools."
+        )
+        cached = {"pool_count": 0, "pools": []}
+
+    pools = cached["pools"]
+    if pool_count > cached["pool_count"]:
+        RICH_CONSOLE.log(
+            f"Fetching [red]{pool_count - cached['pool_count']} new pools "
+            f"from registry [blue]{registry}."
+        )
+        pools = pools + _get_pool_list(
+            registry, cached["pool_count"], pool_count, block_number
+        )
+
+    snapshot[registry] = {"pool_count": pool_count, "pools": pools}
+    return pools
+
+
+def get_registry_pools() -> Dict[str, List[str]]:
+    """
+    Get the pools of every registry in ``REGISTRIES``. The registries are
+    queried in parallel, at the same block, and only the pools added since
+    the last snapshot in ``REGISTRY_SNAPSHOT_FILE`` are fetched. The result is
+    kept for the rest of the run.
+    """
+    with _REGISTRY_POOLS_LOCK:
+        if _REGISTRY_POOLS:
+            return _REGISTRY_POOLS
+
+        snapshot = _load_registry_snapshot()
+        block_number = ape.chain.blocks.height
+        registries = list(REGISTRIES.values())
+        with ThreadPoolExecutor(max_workers=len(registries)) as executor:
+            registry_pools = executor.map(
+                lambda registry: _get_pools(registry, snapshot, block_number),
+                registries,
+            )
+            _REGISTRY_POOLS.update(zip(registries, registry_pools))
+
+        _save_registry_snapshot(snapshot)
+        return _REGISTRY_POOLS
+
+
 def get_stableswap_registry_pools() -> List[str]:
     RICH_CONSOLE.log("Getting all stableswap pools ...")
     pools = []
+    registry_pools = get_registry_pools()
     for registry in [
         REGISTRIES["MAIN_REGISTRY"],
         REGISTRIES["STABLESWAP_FACTORY"],
     ]:
-        pools.extend(_get_pools(registry))
-    pools = list(set(pools))
+        pools.extend(registry_pools[registry])
+    pools = list(dict.fromkeys(pools))
     RICH_CONSOLE.log(f"... found [red]{len(pools)} pools.")
     return pools
 
@@ -41,11 +177,12 @@ def get_stableswap_registry_pools() -> List[str]:
 def get_cryptoswap_registry_pools() -> List[str]:
     RICH_CONSOLE.log("Getting all cryptoswap pools ...")
     pools = []
+    registry_pools = get_registry_pools()
     for registry in [
         REGISTRIES["CRYPTOSWAP_REGISTRY"],
         REGISTRIES["CRYPTOSWAP_FACTORY"],
     ]:
-        pools.extend(_get_pools(registry))
-    pools = list(set(pools))
+        pools.extend(registry_pools[registry])
+    pools = list(dict.fromkeys(pools))
     RICH_CONSOLE.log(f"... found [red]{len(pools)} pools.")
     return pools
@@ -0,0 +1,45 @@
+from typing import Dict, List, Set
+
+# rolling stats are a time series of the pool's own calls, and have no
+# single count to compare against, so they are never pooled:
+UNPOOLED_STATS_TYPES = {"rolling"}
+
+
+def get_thin_methods(method_counts: Dict[str, int], min_samples: int) -> List[str]:
+    return [method for method, count in method_counts.items() if count < min_samples]
+
+
+def fill_in_thin_methods(
+    gas_stats: Dict,
+    group_stats: Dict,
+    method_counts: Dict[str, int],
+    thin_methods: List[str],
+) -> Set[str]:
+    """
+    Replace the stats of a pool's thin methods in ``gas_stats`` (in place)
+    with the stats of all pools running the same implementation, where those
+    count more calls. The pool's own stats are kept under ``own_stats``.
+
+    Returns:
+        Set[str]: the methods that were filled in.
+    """
+    pooled_methods = set()
+    for stats_type, gas_table in group_stats.items():
+
+        if stats_type in UNPOOLED_STATS_TYPES:
+            continue
+
+        for method in thin_methods:
+            if (
+                method in gas_table
+                and gas_table[method]["count"] > method_counts[method]
+            ):
+                pool_gas_table = gas_stats.setdefault(stats_type, {})
+                if method in pool_gas_table:
+                    gas_stats.setdefault("own_stats", {}).setdefault(stats_type, {})[
+                        method
+                    ] = pool_gas_table[method]
+                pool_gas_table[method] = gas_table[method]
+                pooled_methods.add(method)
+
+    return pooled_methods
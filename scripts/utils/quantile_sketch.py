@@ -0,0 +1,155 @@
+import math
+from typing import Dict, Optional
+
+import numpy
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+REPORTED_QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+class QuantileSketch:
+    """
+    DDSketch (Masson et al., 2019) for non-negative gas costs: every quantile
+    it returns is within ``relative_accuracy`` of the exact sample quantile.
+
+    Values are counted in logarithmically sized bins, so a sketch of any
+    number of samples only takes a few hundred counts, and two sketches with
+    the same accuracy merge exactly by adding their counts. If there are more
+    than ``MAX_BINS`` bins, the lowest ones are collapsed (only low quantiles
+    lose accuracy then).
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.offset = 0  # bin index of counts[0]
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+        self.zero_count = 0
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zero_count
+
+    def _add_bins(self, offset: int, counts: numpy.ndarray):
+
+        if counts.size == 0:
+            return
+        if self.counts.size == 0:
+            self.offset, self.counts = offset, counts.astype(numpy.int64)
+            self._collapse()
+            return
+
+        start = min(self.offset, offset)
+        end = max(self.offset + self.counts.size, offset + counts.size)
+        merged = numpy.zeros(end - start, dtype=numpy.int64)
+        for bins_offset, bins in [
+            (self.offset, self.counts),
+            (offset, counts),
+        ]:
+            bins_start = bins_offset - start
+            bins_end = bins_start + bins.size
+            merged[bins_start:bins_end] += bins
+        self.offset, self.counts = start, merged
+        self._collapse()
+
+    def _collapse(self):
+
+        if self.counts.size <= MAX_BINS:
+            return
+
+        num_collapsed = self.counts.size - MAX_BINS + 1
+        lowest = self.counts[:num_collapsed].sum()
+        first_kept = num_collapsed - 1
+        self.counts = self.counts[first_kept:].copy()
+        self.counts[0] = lowest
+        self.offset += num_collapsed - 1
+
+    def add(self, values: numpy.ndarray):
+
+        values = numpy.asarray(values, dtype=numpy.float64)
+        positive = values[values > 0]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size == 0:
+            return
+
+        indexes = numpy.ceil(numpy.log(positive) / self._log_gamma).astype(numpy.int64)
+        offset = int(indexes.min())
+        self._add_bins(offset, numpy.bincount(indexes - offset))
+
+    def merge(self, other: "QuantileSketch"):
+
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(
+                f"Can't merge sketches with relative accuracies "
+                f"{self.relative_accuracy} and {other.relative_accuracy}"
+            )
+
+        self.zero_count += other.zero_count
+        self._add_bins(other.offset, other.counts)
+
+    def get_quantile(self, quantile: float) -> Optional[float]:
+
+        count = self.count
+        if count == 0:
+            return None
+
+        rank = quantile * (count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        cumulative_counts = numpy.cumsum(self.counts)
+        idx = int(numpy.searchsorted(cumulative_counts, rank - self.zero_count + 1))
+        return 2 * self.gamma ** (self.offset + idx) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict:
+
+        # leading and trailing empty bins aren't stored, and counts are one
+        # comma separated string so that indented JSON stays small:
+        nonzero = numpy.flatnonzero(self.counts)
+        if nonzero.size:
+            first, end = nonzero[0], nonzero[-1] + 1
+            counts = self.counts[first:end]
+            offset = self.offset + int(nonzero[0])
+        else:
+            counts, offset = self.counts[:0], 0
+
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "offset": offset,
+            "counts": ",".join(map(str, counts.tolist())),
+            "zero_count": self.zero_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "QuantileSketch":
+
+        sketch = cls(data["relative_accuracy"])
+        sketch.zero_count = data["zero_count"]
+        counts = data["counts"].split(",") if data["counts"] else []
+        sketch._add_bins(data["offset"], numpy.array(counts, dtype=numpy.int64))
+        return sketch
+
+
+def get_sketch_gas_table(sketch: QuantileSketch) -> Dict:
+    """
+    Gas table entry of a sketch: the serialized sketch, its count, and the
+    quantiles in ``REPORTED_QUANTILES`` (rounded to ints, like other stats).
+    """
+    return {
+        **{
+            name: int(round(sketch.get_quantile(quantile)))
+            for name, quantile in REPORTED_QUANTILES.items()
+        },
+        "count": sketch.count,
+        "sketch": sketch.to_dict(),
+    }
+
+
+def get_gas_quantile(gas_table_entry: Dict, quantile: float) -> Optional[float]:
+    """
+    Any quantile of a method, from its entry in the ``quantiles`` gas table.
+    """
+    return QuantileSketch.from_dict(gas_table_entry["sketch"]).get_quantile(quantile)
@@ -0,0 +1,391 @@
+import gzip
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from rich.console import Console as RichConsole
+
+from scripts.utils.call_tree_parser_utils import split_block_trace
+from scripts.utils.fast_json import json_dumps, json_loads
+
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+LOGS_FILE = "logs.json.gz"
+TRACES_FILE = "traces.json.gz"
+CALLS_FILE = "calls.json.gz"
+META_FILE = "meta.json"
+MIN_GZIP_SIZE = 1024  # bytes
+
+
+def _load_gzipped_json(filename: str, default):
+
+    if not os.path.exists(filename):
+        return default
+
+    with gzip.open(filename, "rb") as f:
+        return json_loads(f.read())
+
+
+def _save_gzipped_json(filename: str, obj):
+
+    # write to a temp file first so an interrupted save can't corrupt the
+    # corpus
+    with gzip.open(f"{filename}.tmp", "wb") as f:
+        f.write(json_dumps(obj))
+    os.replace(f"{filename}.tmp", filename)
+
+
+def _to_int(value) -> int:
+
+    if isinstance(value, int):
+        return value
+
+    return int(value, 16)
+
+
+def _get_log_key(log: Dict) -> Tuple[int, int]:
+    return _to_int(log["blockNumber"]), _to_int(log["logIndex"])
+
+
+class ReplayCorpus:
+    """
+    Recorded JSON-RPC responses that the replay node answers from.
+
+    A corpus is a directory holding:
+        * ``logs.json.gz``: raw ``eth_getLogs`` log objects. ``eth_getLogs`` is
+          answered by filtering these, so any block window size works.
+        * ``traces.json.gz``: raw parity traces keyed by tx hash. These answer
+          both ``trace_transaction`` and ``trace_block``.
+        * ``calls.json.gz``: every other response (``eth_call``,
+          ``eth_getCode``, ``eth_chainId`` ...) keyed by method and params.
+        * ``meta.json``: the chain head ``eth_blockNumber`` reports.
+    """
+
+    def __init__(self, corpus_dir: str):
+
+        self.corpus_dir = corpus_dir
+        self._lock = threading.Lock()
+
+        self.logs = _load_gzipped_json(os.path.join(corpus_dir, LOGS_FILE), [])
+        self.traces = _load_gzipped_json(os.path.join(corpus_dir, TRACES_FILE), {})
+        self.calls = _load_gzipped_json(os.path.join(corpus_dir, CALLS_FILE), {})
+        self.head = 0
+        meta_file = os.path.join(corpus_dir, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file, "rb") as f:
+                self.head = json_loads(f.read())["head"]
+
+        self._index()
+
+    def _index(self):
+
+        self._log_ids = {(log["transactionHash"], log["logIndex"]) for log in self.logs}
+        self.logs.sort(key=_get_log_key)
+        # (block number, log index) of every log, in the same order as
+        # ``logs``, to bisect on:
+        self._log_keys = [_get_log_key(log) for log in self.logs]
+        self._block_txes = {}
+        for tx_hash, raw_trace in self.traces.items():
+            self._add_block_tx(tx_hash, raw_trace)
+
+    def _add_block_tx(self, tx_hash: str, raw_trace: List[Dict]):
+
+        if raw_trace:
+            block_number = raw_trace[0]["blockNumber"]
+            self._block_txes.setdefault(block_number, []).append(tx_hash)
+
+    def get_logs(self, log_filter: Dict) -> List[Dict]:
+
+        from_block = _to_int(log_filter.get("fromBlock", "0x0"))
+        to_block = log_filter.get("toBlock", "latest")
+        to_block = self.head if to_block == "latest" else _to_int(to_block)
+
+        addresses = log_filter.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {addr.lower() for addr in addresses} if addresses else None
+        topics = log_filter.get("topics") or []
+
+        logs = []
+        lo = bisect_left(self._log_keys, (from_block,))
+        hi = bisect_left(self._log_keys, (to_block + 1,))
+        for log in self.logs[lo:hi]:
+            if addresses and log["address"].lower() not in addresses:
+                continue
+            if not _topics_match(log["topics"], topics):
+                continue
+            logs.append(log)
+
+        return logs
+
+    def get_block_trace(self, block_number: int) -> List[Dict]:
+
+        return [
+            trace
+            for tx_hash in self._block_txes.get(block_number, [])
+            for trace in self.traces[tx_hash]
+        ]
+
+    def record_logs(self, logs: List[Dict]):
+
+        # logs are inserted in place, so recording stays cheap however big
+        # the corpus gets:
+        with self._lock:
+            for log in logs:
+                log_id = (log["transactionHash"], log["logIndex"])
+                if log_id in self._log_ids:
+                    continue
+                self._log_ids.add(log_id)
+                log_key = _get_log_key(log)
+                idx = bisect_right(self._log_keys, log_key)
+                self._log_keys.insert(idx, log_key)
+                self.logs.insert(idx, log)
+
+    def record_traces(self, raw_traces: Dict[str, List[Dict]]):
+
+        with self._lock:
+            for tx_hash, raw_trace in raw_traces.items():
+                # txes that already have a trace are already in their block:
+                if not self.traces.get(tx_hash):
+                    self._add_block_tx(tx_hash, raw_trace)
+                self.traces[tx_hash] = raw_trace
+
+    def record_call(self, key: str, result):
+
+        with self._lock:
+            self.calls[key] = result
+
+    def save(self):
+
+        with self._lock:
+            os.makedirs(self.corpus_dir, exist_ok=True)
+            _save_gzipped_json(os.path.join(self.corpus_dir, LOGS_FILE), self.logs)
+            _save_gzipped_json(os.path.join(self.corpus_dir, TRACES_FILE), self.traces)
+            _save_gzipped_json(os.path.join(self.corpus_dir, CALLS_FILE), self.calls)
+            with open(os.path.join(self.corpus_dir, META_FILE), "wb") as f:
+                f.write(json_dumps({"head": self.head}))
+
+        RICH_CONSOLE.log(
+            f"Saved corpus: [blue]{len(self.logs)} logs, "
+            f"[blue]{len(self.traces)} traces, [blue]{len(self.calls)} calls."
+        )
+
+
+def _topics_match(log_topics: List[str], topics_filter: List) -> bool:
+
+    for position, wanted in enumerate(topics_filter):
+        if wanted is None:
+            continue
+        if position >= len(log_topics):
+            return False
+        wanted = [wanted] if isinstance(wanted, str) else wanted
+        if log_topics[position].lower() not in {topic.lower() for topic in wanted}:
+            return False
+
+    return True
+
+
+class ReplayNode:
+    """
+    Answers JSON-RPC calls from a ``ReplayCorpus``, with injected latency and
+    errors. If ``upstream_uri`` is set, calls the corpus can't answer are
+    forwarded upstream and recorded into the corpus.
+    """
+
+    def __init__(
+        self,
+        corpus: ReplayCorpus,
+        latency_ms: float = 0,
+        call_latency_ms: float = 0,
+        error_rate: float = 0,
+        upstream_uri: Optional[str] = None,
+        seed: int = 0,
+    ):
+
+        self.corpus = corpus
+        self.latency_ms = latency_ms
+        self.call_latency_ms = call_latency_ms
+        self.error_rate = error_rate
+        self.upstream_uri = upstream_uri
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+
+        with self._lock:
+            self.http_requests = 0
+            self.rpc_calls = Counter()
+            self.traced_txes = set()
+
+    def stats(self) -> Dict:
+
+        with self._lock:
+            return {
+                "http_requests": self.http_requests,
+                "rpc_calls": sum(self.rpc_calls.values()),
+                "rpc_calls_per_method": dict(self.rpc_calls),
+                "traced_txes": len(self.traced_txes),
+            }
+
+    def _sleep(self, latency_ms: float):
+
+        if latency_ms > 0:
+            # jitter by +-50% so concurrent requests don't move in lockstep:
+            with self._lock:
+                jitter = self._random.uniform(0.5, 1.5)
+            time.sleep(latency_ms * jitter / 1000)
+
+    def _forward(self, method: str, params: List):
+
+        response = requests.post(
+            self.upstream_uri,
+            json={
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": method,
+                "params": params,
+            },
+            timeout=300,
+        ).json()
+        if "error" in response:
+            raise ValueError(response["error"])
+
+        return response["result"]
+
+    def _answer(self, method: str, params: List) -> Tuple[bool, object]:
+
+        corpus = self.corpus
+        match method:
+            case "eth_blockNumber":
+                if not corpus.head and self.upstream_uri:
+                    corpus.head = _to_int(self._forward(method, params))
+                return True, hex(corpus.head)
+
+            case "eth_getLogs":
+                if self.upstream_uri:
+                    corpus.record_logs(self._forward(method, params))
+                return True, corpus.get_logs(params[0])
+
+            case "trace_transaction":
+                tx_hash = params[0].lower()
+                if tx_hash not in corpus.traces and self.upstream_uri:
+                    corpus.record_traces({tx_hash: self._forward(method, params)})
+                if tx_hash not in corpus.traces:
+                    return False, "transaction not in replay corpus"
+                with self._lock:
+                    self.traced_txes.add(tx_hash)
+                return True, corpus.traces[tx_hash]
+
+            case "trace_block":
+                block_number = _to_int(params[0])
+                if self.upstream_uri:
+                    corpus.record_traces(
+                        split_block_trace(self._forward(method, params))
+                    )
+                block_trace = corpus.get_block_trace(block_number)
+                with self._lock:
+                    self.traced_txes.update(
+                        trace["transactionHash"] for trace in block_trace
+                    )
+                return True, block_trace
+
+            case _:
+                key = f"{method}:{json_dumps(params).decode()}"
+                if key not in corpus.calls and self.upstream_uri:
+                    corpus.record_call(key, self._forward(method, params))
+                if key not in corpus.calls:
+                    return False, f"{method} call not in replay corpus"
+                return True, corpus.calls[key]
+
+    def handle_call(self, request: Dict) -> Dict:
+
+        method = request.get("method")
+        params = request.get("params") or []
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        with self._lock:
+            self.rpc_calls[method] += 1
+            inject_error = self._random.random() < self.error_rate
+
+        self._sleep(self.call_latency_ms)
+        if inject_error:
+            response["error"] = {"code": -32000, "message": "injected error"}
+            return response
+
+        try:
+            ok, result = self._answer(method, params)
+        except Exception as e:
+            ok, result = False, str(e)
+
+        if ok:
+            response["result"] = result
+        else:
+            response["error"] = {"code": -32000, "message": result}
+
+        return response
+
+    def handle_payload(self, payload):
+
+        with self._lock:
+            self.http_requests += 1
+
+        self._sleep(self.latency_ms)
+        if isinstance(payload, list):
+            return [self.handle_call(request) for request in payload]
+
+        return self.handle_call(payload)
+
+
+def make_handler(node: ReplayNode):
+    class ReplayNodeHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, body: bytes, status: int = 200):
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if (
+                "gzip" in self.headers.get("Accept-Encoding", "")
+                and len(body) > MIN_GZIP_SIZE
+            ):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+
+            if self.path == "/stats":
+                self._send(json_dumps(node.stats()))
+            else:
+                self._send(b"{}", status=404)
+
+        def do_POST(self):
+
+            if self.path == "/reset":
+                node.reset_stats()
+                self._send(b"{}")
+                return
+
+            payload = json_loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self._send(json_dumps(node.handle_payload(payload)))
+
+    return ReplayNodeHandler
+
+
+def start_replay_node(node: ReplayNode, host: str, port: int) -> ThreadingHTTPServer:
+
+    server = ThreadingHTTPServer((host, port), make_handler(node))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    RICH_CONSOLE.log(f"Replay node listening on [green]http://{host}:{port}")
+
+    return server
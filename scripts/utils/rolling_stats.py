@@ -0,0 +1,174 @@
+import functools
+from typing import Dict, List, NamedTuple, Tuple
+
+import click
+import numpy
+
+from scripts.utils.gas_samples import GasSamples
+from scripts.utils.univariate_stats import get_univariate_gas_table
+
+DEFAULT_HALF_LIFE_BUCKETS = 4.0
+
+_BUCKET_BLOCKS = 0  # 0: no rolling stats
+_HALF_LIFE_BUCKETS = DEFAULT_HALF_LIFE_BUCKETS
+
+
+class BucketMoments(NamedTuple):
+    """
+    Gas moments of every (method, block bucket) group, ordered by method code,
+    then bucket. Buckets start at multiples of the bucket size, so buckets of
+    different runs line up.
+    """
+
+    method: numpy.ndarray  # method code
+    start_block: numpy.ndarray
+    count: numpy.ndarray
+    mean: numpy.ndarray
+    m2: numpy.ndarray  # sum of squared deviations from the mean
+    min: numpy.ndarray
+    max: numpy.ndarray
+
+
+def get_bucket_moments(samples: GasSamples, bucket_blocks: int) -> BucketMoments:
+    """
+    Moments of every method in every ``bucket_blocks`` block bucket, in one
+    pass: samples are sorted by (method, bucket) once, and each moment is a
+    single ``reduceat`` over all groups.
+    """
+    bucket = samples.block.astype(numpy.int64) // bucket_blocks
+    order = numpy.lexsort((bucket, samples.method))
+    method = samples.method[order]
+    bucket = bucket[order]
+    gas = samples.gas[order].astype(numpy.float64)
+
+    new_group = numpy.ones(gas.size, dtype=bool)
+    new_group[1:] = (method[1:] != method[:-1]) | (bucket[1:] != bucket[:-1])
+    starts = numpy.flatnonzero(new_group)
+    counts = numpy.diff(numpy.append(starts, gas.size))
+    means = numpy.add.reduceat(gas, starts) / counts
+
+    return BucketMoments(
+        method=method[starts],
+        start_block=bucket[starts] * bucket_blocks,
+        count=counts,
+        mean=means,
+        m2=numpy.add.reduceat((gas - numpy.repeat(means, counts)) ** 2, starts),
+        min=numpy.minimum.reduceat(gas, starts),
+        max=numpy.maximum.reduceat(gas, starts),
+    )
+
+
+def get_decayed_moments(
+    moments: BucketMoments, bucket_blocks: int, half_life_buckets: float
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Exponentially decayed gas moments of every method: each bucket's samples
+    weigh half as much every ``half_life_buckets`` buckets before the newest
+    bucket (of any method), so a method that hasn't been called lately is
+    down-weighted as a whole too.
+
+    Returns:
+        Tuple[numpy.ndarray, ...]: method codes, and their effective (weighted)
+            sample counts, weighted means and weighted variances.
+    """
+    codes, group_method = numpy.unique(moments.method, return_inverse=True)
+    age = (moments.start_block.max() - moments.start_block) / bucket_blocks
+    weights = 0.5 ** (age / half_life_buckets) * moments.count
+
+    weight_sums = numpy.bincount(group_method, weights)
+    means = numpy.bincount(group_method, weights * moments.mean) / weight_sums
+    # within-bucket spread (m2 / count per sample) and the spread of bucket
+    # means around the method's decayed mean:
+    spread = moments.m2 / moments.count + (moments.mean - means[group_method]) ** 2
+    variances = numpy.bincount(group_method, weights * spread) / weight_sums
+
+    return codes, weight_sums, means, variances
+
+
+def get_rolling_gas_table(
+    method_names: List[str],
+    moments: BucketMoments,
+    bucket_blocks: int,
+    half_life_buckets: float,
+) -> Dict:
+
+    codes, effective_counts, means, variances = get_decayed_moments(
+        moments, bucket_blocks, half_life_buckets
+    )
+    # moments are ordered by method code:
+    starts = numpy.searchsorted(moments.method, codes, side="left")
+    ends = numpy.searchsorted(moments.method, codes, side="right")
+
+    gas_table = {}
+    for code, start, end, effective_count, mean, variance in zip(
+        codes, starts, ends, effective_counts, means, variances
+    ):
+        gas_table[method_names[code]] = {
+            "bucket_blocks": bucket_blocks,
+            "half_life_buckets": half_life_buckets,
+            "current": {
+                "mean": int(mean),
+                "std": int(numpy.sqrt(variance)),
+                "effective_count": round(float(effective_count), 1),
+            },
+            "buckets": [
+                {
+                    "start_block": int(moments.start_block[idx]),
+                    **get_univariate_gas_table(
+                        moments.count[idx],
+                        moments.mean[idx],
+                        moments.m2[idx],
+                        moments.min[idx],
+                        moments.max[idx],
+                    ),
+                }
+                for idx in range(start, end)
+            ],
+        }
+
+    return gas_table
+
+
+def configure_rolling_stats(bucket_blocks: int, half_life_buckets: float):
+
+    global _BUCKET_BLOCKS, _HALF_LIFE_BUCKETS
+    if half_life_buckets <= 0:
+        raise click.BadParameter("must be positive", param_hint="--half_life_buckets")
+
+    _BUCKET_BLOCKS = bucket_blocks
+    _HALF_LIFE_BUCKETS = half_life_buckets
+
+
+def get_rolling_stats_settings() -> Tuple[int, float]:
+    return _BUCKET_BLOCKS, _HALF_LIFE_BUCKETS
+
+
+def rolling_stats_options(f):
+    """
+    Adds ``--bucket_blocks`` and ``--half_life_buckets`` to a click command,
+    and sets up rolling stats before the command runs.
+    """
+
+    @click.option(
+        "--bucket_blocks",
+        required=False,
+        help=(
+            "Also compute per method stats for every bucket of this many "
+            "blocks, and a decayed current estimate. 0 disables rolling stats"
+        ),
+        type=int,
+        default=0,
+    )
+    @click.option(
+        "--half_life_buckets",
+        required=False,
+        help="Half life, in buckets, of the current rolling estimate",
+        type=float,
+        default=DEFAULT_HALF_LIFE_BUCKETS,
+    )
+    @functools.wraps(f)
+    def wrapper(*args, bucket_blocks, half_life_buckets, **kwargs):
+        configure_rolling_stats(bucket_blocks, half_life_buckets)
+        return f(*args, **kwargs)
+
+    return wrapper
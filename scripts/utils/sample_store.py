@@ -0,0 +1,226 @@
+import atexit
+import functools
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+import click
+import numpy
+from rich.console import Console as RichConsole
+
+from scripts.utils.flat_trace import NO_GAS, NO_SELECTOR, FlatTrace
+
+DEFAULT_SAMPLE_STORE_DIR = "./gas_samples"
+# one raw, append-only file per column in each pool's directory:
+COLUMNS = {
+    "selector": numpy.uint32,
+    "block": numpy.uint32,
+    "tx_index": numpy.uint32,
+    "depth": numpy.uint16,
+    "gas": numpy.uint64,
+}
+FLUSH_ROWS = 100000  # buffered rows (over all pools) before writing to disk
+TX_INDEX_BITS = 20  # tx key: block << TX_INDEX_BITS | tx index
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+_SAMPLE_STORE = None
+
+
+def get_tx_keys(blocks: numpy.ndarray, tx_indexes: numpy.ndarray) -> numpy.ndarray:
+    return (blocks.astype(numpy.uint64) << TX_INDEX_BITS) | tx_indexes
+
+
+class SampleStore:
+    """
+    Append-only store of every gas observation: one row per call to a pool
+    (selector, block, tx index, call depth, gas), unaveraged.
+
+    Each pool has its own directory with one raw file per column (see
+    ``COLUMNS``), which is read back as memory-mapped NumPy arrays. A tx is
+    only ever stored once per pool. If a write was cut short, columns are cut
+    back to their shortest common length the next time the pool is opened.
+    """
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[Dict[str, numpy.ndarray]]] = {}
+        self._num_buffered = 0
+        self._tx_keys: Dict[str, set] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _pool_dir(self, pool_addr: str) -> str:
+        return os.path.join(self.directory, pool_addr.lower())
+
+    def _column_file(self, pool_addr: str, column: str) -> str:
+        return os.path.join(self._pool_dir(pool_addr), f"{column}.bin")
+
+    def _get_num_rows(self, pool_addr: str) -> int:
+
+        sizes = []
+        for column, dtype in COLUMNS.items():
+            filename = self._column_file(pool_addr, column)
+            size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            sizes.append(size // numpy.dtype(dtype).itemsize)
+
+        num_rows = min(sizes)
+        if num_rows != max(sizes):
+            for column, dtype in COLUMNS.items():
+                filename = self._column_file(pool_addr, column)
+                with open(filename, "r+b") as f:
+                    f.truncate(num_rows * numpy.dtype(dtype).itemsize)
+
+        return num_rows
+
+    def _get_stored_tx_keys(self, pool_addr: str) -> set:
+
+        tx_keys = self._tx_keys.get(pool_addr)
+        if tx_keys is None:
+            samples = self.scan(pool_addr)
+            tx_keys = set(get_tx_keys(samples["block"], samples["tx_index"]).tolist())
+            self._tx_keys[pool_addr] = tx_keys
+
+        return tx_keys
+
+    def add(self, pool_addr: str, flat_trace: FlatTrace, address_id: int):
+
+        mask = (
+            (flat_trace.address_id == address_id)
+            & (flat_trace.selector != NO_SELECTOR)
+            & (flat_trace.gas != NO_GAS)
+        )
+        if not mask.any():
+            return
+
+        num_rows = int(mask.sum())
+        rows = {
+            "selector": flat_trace.selector[mask].astype(numpy.uint32),
+            "block": numpy.full(num_rows, flat_trace.block_number, numpy.uint32),
+            "tx_index": numpy.full(num_rows, flat_trace.tx_position, numpy.uint32),
+            "depth": flat_trace.depth[mask].astype(numpy.uint16),
+            "gas": flat_trace.gas[mask].astype(numpy.uint64),
+        }
+        tx_key = (flat_trace.block_number << TX_INDEX_BITS) | flat_trace.tx_position
+
+        pool_addr = pool_addr.lower()
+        with self._lock:
+            tx_keys = self._get_stored_tx_keys(pool_addr)
+            if tx_key in tx_keys:
+                return
+
+            tx_keys.add(tx_key)
+            self._buffers.setdefault(pool_addr, []).append(rows)
+            self._num_buffered += num_rows
+            if self._num_buffered >= FLUSH_ROWS:
+                self._flush()
+
+    def flush(self):
+
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+
+        for pool_addr, buffered_rows in self._buffers.items():
+            os.makedirs(self._pool_dir(pool_addr), exist_ok=True)
+            self._get_num_rows(pool_addr)  # repairs a cut short write
+            for column in COLUMNS:
+                with open(self._column_file(pool_addr, column), "ab") as f:
+                    for rows in buffered_rows:
+                        f.write(rows[column].tobytes())
+
+        self._buffers = {}
+        self._num_buffered = 0
+
+    def get_pools(self) -> List[str]:
+        return sorted(os.listdir(self.directory))
+
+    def scan(
+        self,
+        pool_addr: str,
+        selectors: Optional[List[int]] = None,
+        min_block: Optional[int] = None,
+        max_block: Optional[int] = None,
+    ) -> Dict[str, numpy.ndarray]:
+        """
+        Samples of a pool, optionally only for some selectors and blocks
+        (inclusive). Only flushed samples are returned.
+
+        Returns:
+            Dict[str, numpy.ndarray]: column -> values, see ``COLUMNS``.
+        """
+        pool_addr = pool_addr.lower()
+        num_rows = 0
+        if os.path.isdir(self._pool_dir(pool_addr)):
+            num_rows = self._get_num_rows(pool_addr)
+        if num_rows == 0:
+            return {column: numpy.zeros(0, dtype) for column, dtype in COLUMNS.items()}
+
+        columns = {
+            column: numpy.memmap(
+                self._column_file(pool_addr, column),
+                dtype=dtype,
+                mode="r",
+                shape=(num_rows,),
+            )
+            for column, dtype in COLUMNS.items()
+        }
+
+        mask = numpy.ones(num_rows, dtype=bool)
+        if selectors is not None:
+            mask &= numpy.isin(columns["selector"], selectors)
+        if min_block is not None:
+            mask &= columns["block"] >= min_block
+        if max_block is not None:
+            mask &= columns["block"] <= max_block
+
+        return {column: values[mask] for column, values in columns.items()}
+
+
+def configure_sample_store(directory: str):
+
+    global _SAMPLE_STORE
+    if _SAMPLE_STORE is not None:
+        _SAMPLE_STORE.flush()
+    if not directory:
+        _SAMPLE_STORE = None
+        return
+
+    _SAMPLE_STORE = SampleStore(directory)
+    atexit.register(_SAMPLE_STORE.flush)
+    RICH_CONSOLE.log(f"Storing gas samples in [green]{directory}.")
+
+
+def get_sample_store() -> Optional[SampleStore]:
+    return _SAMPLE_STORE
+
+
+def record_gas_samples(pool_addr: str, flat_trace: FlatTrace, address_id: int):
+
+    if _SAMPLE_STORE is not None and flat_trace is not None:
+        _SAMPLE_STORE.add(pool_addr, flat_trace, address_id)
+
+
+def sample_store_options(f):
+    """
+    Adds ``--sample_store`` to a click command, and sets up the gas sample
+    store before the command runs.
+    """
+
+    @click.option(
+        "--sample_store",
+        required=False,
+        help=(
+            "Gas sample store directory. " "Pass an empty string to not store samples"
+        ),
+        type=str,
+        default=DEFAULT_SAMPLE_STORE_DIR,
+    )
+    @functools.wraps(f)
+    def wrapper(*args, sample_store, **kwargs):
+        configure_sample_store(sample_store)
+        return f(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,115 @@
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import ape
+from ape.utils.abi import parse_type
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.registry import registry
+from eth_utils import function_signature_to_4byte_selector
+from ethpm_types import ContractType
+from ethpm_types.abi import MethodABI
+
+_SELECTOR_INDEXES: Dict[str, Dict[int, "MethodEntry"]] = {}
+_SELECTOR_INDEXES_LOCK = threading.Lock()
+_SELECTOR_INDEX_KEYS: Dict[str, str] = {}
+
+
+class MethodEntry(NamedTuple):
+    """
+    Everything needed to name a call and decode its arguments and return
+    values, precomputed once per method.
+    """
+
+    name: str
+    abi: MethodABI
+    input_names: List[str]
+    input_types: List[str]
+    input_parsed_types: List[Any]  # ``parse_type`` of each input type
+    input_decoder: TupleDecoder
+    output_types: List[str]
+    output_parsed_types: List[Any]
+    output_decoder: TupleDecoder
+
+
+def _get_tuple_decoder(types: List[str]) -> TupleDecoder:
+    return TupleDecoder(decoders=[registry.get_decoder(t) for t in types])
+
+
+def _build_method_entry(abi: MethodABI) -> MethodEntry:
+
+    input_types = [i.canonical_type for i in abi.inputs]  # type: ignore
+    output_types = [o.canonical_type for o in abi.outputs]  # type: ignore
+    return MethodEntry(
+        name=abi.name,
+        abi=abi,
+        input_names=[i.name or f"{idx}" for idx, i in enumerate(abi.inputs)],
+        input_types=input_types,
+        input_parsed_types=[parse_type(t) for t in input_types],
+        input_decoder=_get_tuple_decoder(input_types),
+        output_types=output_types,
+        output_parsed_types=[parse_type(t) for t in output_types],
+        output_decoder=_get_tuple_decoder(output_types),
+    )
+
+
+def build_selector_index(
+    contract_type: ContractType,
+) -> Dict[int, MethodEntry]:
+
+    index = {}
+    # mutable methods win selector clashes, same as the old lookup order:
+    for methods in [contract_type.view_methods, contract_type.mutable_methods]:
+        for abi in methods:
+            selector = function_signature_to_4byte_selector(abi.selector)
+            index[int.from_bytes(selector, "big")] = _build_method_entry(abi)
+
+    return index
+
+
+def get_selector_index(
+    address: str, contract_type: ContractType
+) -> Dict[int, MethodEntry]:
+    """
+    Map of int selector -> ``MethodEntry`` for the contract type of
+    ``address``. Built on first use and then shared for the rest of the run.
+    """
+    key = _SELECTOR_INDEX_KEYS.get(address.lower(), address.lower())
+    index = _SELECTOR_INDEXES.get(key)
+    if index is None:
+        index = build_selector_index(contract_type)
+        with _SELECTOR_INDEXES_LOCK:
+            _SELECTOR_INDEXES[key] = index
+
+    return index
+
+
+def set_selector_index_key(address: str, key: str):
+    """
+    Contracts with the same key share one selector index, e.g. proxies of the
+    same implementation.
+    """
+    _SELECTOR_INDEX_KEYS[address.lower()] = key
+
+
+def get_method_entry(contract: ape.Contract, selector: bytes) -> Optional[MethodEntry]:
+
+    index = get_selector_index(contract.address, contract.contract_type)
+    return index.get(int.from_bytes(selector[:4], "big"))
+
+
+def get_method_name(contract: ape.Contract, selector: int) -> str:
+
+    index = get_selector_index(contract.address, contract.contract_type)
+    method = index.get(selector)
+    if method is None:
+        return f"0x{selector:08x}"
+
+    return method.name or f"<0x{selector:08x}>"
+
+
+def decode_inputs(method: MethodEntry, raw_data: bytes) -> Tuple:
+    return method.input_decoder(ContextFramesBytesIO(raw_data))
+
+
+def decode_outputs(method: MethodEntry, raw_data: bytes) -> Tuple:
+    return method.output_decoder(ContextFramesBytesIO(raw_data))
@@ -0,0 +1,255 @@
+import atexit
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import ape
+import click
+from rich.console import Console as RichConsole
+
+from scripts.utils.fast_json import json_dumps, json_loads
+
+DEFAULT_TRACE_CACHE_FILE = "./trace_cache.sqlite"
+DEFAULT_TRACE_CACHE_SIZE_MB = 4096
+FINALITY_DEPTH = 64  # blocks; traces younger than this can still be reorged
+HEAD_REFRESH_INTERVAL = 60  # seconds
+RICH_CONSOLE = RichConsole(file=sys.stdout)
+
+_TRACE_CACHE = None
+
+
+def _to_key(tx_hash) -> str:
+
+    if isinstance(tx_hash, bytes):
+        tx_hash = tx_hash.hex()
+    tx_hash = tx_hash.lower()
+    if not tx_hash.startswith("0x"):
+        tx_hash = f"0x{tx_hash}"
+
+    return tx_hash
+
+
+class TraceCache:
+    """
+    On-disk cache of raw parity traces, keyed by transaction hash.
+
+    Traces are stored zlib compressed in a single sqlite file. Once the total
+    compressed size goes over ``max_size_mb``, the least recently read traces
+    are evicted first. Access times of cache hits are kept in memory and only
+    written with the next ``put_many`` (or ``flush``), so reads never write to
+    the database. In read only mode the cache is never written to, so it can
+    be shared between concurrent runs.
+    """
+
+    def __init__(self, filename: str, max_size_mb: int, read_only: bool = False):
+
+        self.filename = filename
+        self.max_size = max_size_mb * 1024 * 1024
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._finalized_block = 0
+        self._finalized_block_checked_at = 0.0
+        self._access_times: Dict[str, float] = {}
+
+        if read_only:
+            self._db = sqlite3.connect(
+                f"file:{filename}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            self._db = sqlite3.connect(filename, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS traces ("
+                "tx_hash TEXT PRIMARY KEY, "
+                "data BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS traces_last_access "
+                "ON traces (last_access)"
+            )
+            self._db.commit()
+
+        (self.size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM traces"
+        ).fetchone()
+
+    def get_many(self, tx_hashes: List[str]) -> Dict[str, List[Dict]]:
+
+        keys = {_to_key(tx_hash): tx_hash for tx_hash in tx_hashes}
+        rows = []
+        with self._lock:
+            # sqlite caps the number of bound parameters per query:
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                end = start + 500
+                chunk = key_list[start:end]
+                rows.extend(
+                    self._db.execute(
+                        "SELECT tx_hash, data FROM traces WHERE tx_hash IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+
+            if not self.read_only:
+                now = time.time()
+                self._access_times.update((key, now) for key, _ in rows)
+
+        return {keys[key]: json_loads(zlib.decompress(data)) for key, data in rows}
+
+    def get(self, tx_hash: str) -> Optional[List[Dict]]:
+
+        return self.get_many([tx_hash]).get(tx_hash)
+
+    def put_many(self, raw_traces: Dict[str, List[Dict]]):
+
+        if self.read_only:
+            return
+
+        # only cache traces of finalized blocks: anything newer can be reorged
+        finalized_block = self._get_finalized_block()
+        now = time.time()
+        rows = []
+        for tx_hash, raw_trace in raw_traces.items():
+            if not raw_trace or raw_trace[0].get("blockNumber", 0) > finalized_block:
+                continue
+            data = zlib.compress(json_dumps(raw_trace))
+            rows.append((_to_key(tx_hash), data, len(data), now))
+
+        if not rows:
+            return
+
+        with self._lock:
+            self._write_access_times()
+            for key, _, size, _ in rows:
+                (previous_size,) = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM traces " "WHERE tx_hash = ?",
+                    (key,),
+                ).fetchone()
+                self.size += size - previous_size
+            self._db.executemany(
+                "INSERT OR REPLACE INTO traces VALUES (?, ?, ?, ?)", rows
+            )
+            if self.size > self.max_size:
+                self._evict()
+            self._db.commit()
+
+    def put(self, tx_hash: str, raw_trace: List[Dict]):
+
+        self.put_many({tx_hash: raw_trace})
+
+    def _write_access_times(self):
+
+        self._db.executemany(
+            "UPDATE traces SET last_access = ? WHERE tx_hash = ?",
+            [(now, key) for key, now in self._access_times.items()],
+        )
+        self._access_times = {}
+
+    def flush(self):
+
+        if self.read_only:
+            return
+
+        with self._lock:
+            self._write_access_times()
+            self._db.commit()
+
+    def _evict(self):
+
+        # drop least recently used traces until we are back under the cap:
+        to_free = self.size - self.max_size
+        evicted = []
+        for key, size in self._db.execute(
+            "SELECT tx_hash, size FROM traces ORDER BY last_access ASC"
+        ):
+            if to_free <= 0:
+                break
+            evicted.append((key,))
+            to_free -= size
+            self.size -= size
+
+        self._db.executemany("DELETE FROM traces WHERE tx_hash = ?", evicted)
+        RICH_CONSOLE.log(f"Evicted [blue]{len(evicted)} traces from trace cache.")
+
+    def _get_finalized_block(self) -> int:
+
+        if time.time() - self._finalized_block_checked_at > HEAD_REFRESH_INTERVAL:
+            self._finalized_block = ape.chain.blocks.height - FINALITY_DEPTH
+            self._finalized_block_checked_at = time.time()
+
+        return self._finalized_block
+
+
+def configure_trace_cache(
+    filename: str,
+    max_size_mb: int = DEFAULT_TRACE_CACHE_SIZE_MB,
+    read_only: bool = False,
+):
+
+    global _TRACE_CACHE
+    if _TRACE_CACHE is not None:
+        _TRACE_CACHE.flush()
+    if not filename or (read_only and not os.path.exists(filename)):
+        _TRACE_CACHE = None
+        return
+
+    _TRACE_CACHE = TraceCache(filename, max_size_mb, read_only)
+    atexit.register(_TRACE_CACHE.flush)
+    RICH_CONSOLE.log(
+        f"Using trace cache [green]{filename} "
+        f"({_TRACE_CACHE.size / 1024 / 1024:.1f} MB"
+        f"{', read only' if read_only else ''})."
+    )
+
+
+def get_trace_cache() -> Optional[TraceCache]:
+    return _TRACE_CACHE
+
+
+def trace_cache_options(f):
+    """
+    Adds ``--trace_cache``, ``--trace_cache_size_mb`` and
+    ``--trace_cache_read_only`` to a click command, and sets up the trace
+    cache before the command runs.
+    """
+
+    @click.option(
+        "--trace_cache",
+        required=False,
+        help="Trace cache file. Pass an empty string to disable caching",
+        type=str,
+        default=DEFAULT_TRACE_CACHE_FILE,
+    )
+    @click.option(
+        "--trace_cache_size_mb",
+        required=False,
+        help=("Max size of the trace cache. " "Least recently used traces go first"),
+        type=int,
+        default=DEFAULT_TRACE_CACHE_SIZE_MB,
+    )
+    @click.option(
+        "--trace_cache_read_only",
+        is_flag=True,
+        default=False,
+        help="Only read from the trace cache, never write to it",
+    )
+    @functools.wraps(f)
+    def wrapper(
+        *args,
+        trace_cache,
+        trace_cache_size_mb,
+        trace_cache_read_only,
+        **kwargs,
+    ):
+        configure_trace_cache(trace_cache, trace_cache_size_mb, trace_cache_read_only)
+        return f(*args, **kwargs)
+
+    return wrapper
@@ -1,62 +1,180 @@
 import sys
-from typing import List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 import ape
 from rich.console import Console as RichConsole
 
 MAX_ZERO_TX_QUERIES = 1
+DEFAULT_BLOCK_WINDOW = 10000
+MIN_BLOCK_WINDOW = 100
+MAX_BLOCK_WINDOW = 1000000
+MAX_TXES_PER_QUERY = 2000  # keeps node responses (and their latency) bounded
+SEGMENTS_PER_WORKER = 4  # more segments than workers, so we can stop early
+ADDRESS_CHUNK_SIZE = 100  # addresses per eth_getLogs filter
 RICH_CONSOLE = RichConsole(file=sys.stdout)
 
 
-def get_block_ranges(end_block: int, nblocks: int = 10000) -> Tuple[int, int]:
-    return max(end_block - nblocks, 0), max(end_block, 0)
+def get_block_ranges(
+    end_block: int, nblocks: int = DEFAULT_BLOCK_WINDOW
+) -> Tuple[int, int]:
+    return max(end_block - nblocks + 1, 0), max(end_block, 0)
 
 
-def get_transactions_in_block_range(
-    pool: ape.Contract,
+def get_next_block_window(
+    block_window: int, num_txes: int, num_txes_needed: int
+) -> int:
+    """
+    Size the next block window from the tx density of the last one: big enough
+    to find the txes still needed, but no bigger, so we don't scan (or trace)
+    logs past the newest ``max_transactions`` txes.
+    """
+    if num_txes == 0:
+        return min(block_window * 2, MAX_BLOCK_WINDOW)
+
+    tx_density = num_txes / block_window
+    next_block_window = min(num_txes_needed, MAX_TXES_PER_QUERY) / tx_density
+    return int(min(max(next_block_window, MIN_BLOCK_WINDOW), MAX_BLOCK_WINDOW))
+
+
+def get_logs_in_block_range(
+    addresses: List[str], block_start: int, block_end: int
+) -> List[Dict]:
+
+    # raw request: skips web3's log formatters, we only need a couple of fields
+    web3 = ape.chain.provider.web3
+    response = web3.provider.make_request(
+        "eth_getLogs",
+        [
+            {
+                "address": addresses,
+                "fromBlock": hex(block_start),
+                "toBlock": hex(block_end),
+            }
+        ],
+    )
+    if "error" in response:
+        raise ValueError(response["error"])
+
+    return response["result"]
+
+
+def _parse_raw_log(log: Dict) -> Tuple[int, int, str, int]:
+    return (
+        int(log["blockNumber"], 16),
+        int(log["transactionIndex"], 16),
+        log["transactionHash"],
+        int(log["logIndex"], 16),
+    )
+
+
+def get_logs_for_contract_in_block_range(
+    contract: ape.Contract,
     block_start: int,
     block_end: int,
-    logged_txes: List[Tuple[int, str]] = [],
+    decode_events: bool = False,
+) -> List[Tuple[int, int, str, int]]:
+    """
+    Get every log ``contract`` emitted in a block range.
+
+    Returns:
+        List[Tuple[int, int, str, int]]: (block number, tx index, tx hash,
+            log index) of each log, in chain order.
+    """
+    logs = []
+    if decode_events:
+        for _, event in contract._events_.items():
+
+            initialised_event = ape.contracts.ContractEvent(contract, event[0].abi)
+            for log in initialised_event.range(block_start, block_end):
+                logs.append(
+                    (
+                        log.block_number,
+                        getattr(log, "transaction_index", None) or 0,
+                        log.transaction_hash,
+                        log.log_index,
+                    )
+                )
+    else:
+        # one log scan per window for all events, no abi decoding:
+        for log in get_logs_in_block_range([contract.address], block_start, block_end):
+            logs.append(_parse_raw_log(log))
+
+    return sorted(logs)
+
+
+def _get_new_txes(
+    logs: List[Tuple[int, int, str, int]], logged_txes: Set[str]
 ) -> List[Tuple[int, str]]:
 
-    tx_in_block = []
-    for _, event in pool._events_.items():
+    # first appearance of each tx we haven't seen yet, in chain order:
+    txes = {}
+    for block_number, _, tx, _ in logs:
+        if tx not in logged_txes and tx not in txes:
+            txes[tx] = block_number
+
+    return [(block_number, tx) for tx, block_number in txes.items()]
 
-        initialised_event = ape.contracts.ContractEvent(pool, event[0].abi)
-        for log in initialised_event.range(block_start, block_end):
-            tx = log.transaction_hash
-            block_number = log.block_number
-            if tx not in logged_txes:
-                tx_in_block.append((block_number, tx))
 
-    txes = list(set(tx_in_block))
+def get_transactions_in_block_range(
+    pool: ape.Contract,
+    block_start: int,
+    block_end: int,
+    logged_txes: Optional[Set[str]] = None,
+    decode_events: bool = False,
+) -> List[Tuple[int, str]]:
+
+    logs = get_logs_for_contract_in_block_range(
+        pool, block_start, block_end, decode_events
+    )
+    txes = _get_new_txes(logs, logged_txes or set())
     RICH_CONSOLE.log(f"Found [red]{len(txes)} transactions.")
     return txes
 
 
-def get_all_transactions_for_contract(
-    contract: ape.Contract, max_transactions: int, max_block: int = None
-) -> List[Tuple[int, str]]:
+def scan_logs_backwards(
+    contract: ape.Contract,
+    head: int,
+    max_transactions: int,
+    decode_events: bool = False,
+) -> Iterator[Tuple[int, int, List[Tuple[int, int, str, int]]]]:
+    """
+    Walk back from ``head`` with block windows sized to the contract's tx
+    density, until ``max_transactions`` distinct txes were seen or we run out
+    of history.
 
-    head = ape.chain.blocks.height
-    if max_block:
-        head = max_block
-    block_start, block_end = get_block_ranges(head)
+    Yields:
+        Tuple: (block start, block end, logs in the window) for each window
+            scanned, newest window first. See
+            ``get_logs_for_contract_in_block_range`` for the log format.
+    """
+    block_window = DEFAULT_BLOCK_WINDOW
+    block_start, block_end = get_block_ranges(head, block_window)
 
-    RICH_CONSOLE.log(f"Getting transactions for contract [red]{contract.address}.")
     zero_tx_queries = 0
-    txes = []
-    while zero_tx_queries < MAX_ZERO_TX_QUERIES and len(txes) < max_transactions:
+    logged_txes = set()
+    while zero_tx_queries < MAX_ZERO_TX_QUERIES and len(logged_txes) < max_transactions:
 
-        if block_start == block_end:  # reached genesis
-            RICH_CONSOLE.log("[yellow]Reached genesis.")
-            break
+        try:
+            logs = get_logs_for_contract_in_block_range(
+                contract, block_start, block_end, decode_events
+            )
+        except ValueError as e:
+            # the node refused the query (too many results, response too big,
+            # timeout): retry with a smaller window
+            if block_window <= MIN_BLOCK_WINDOW:
+                raise
+            RICH_CONSOLE.log(f"[yellow]Shrinking block window: {e}")
+            block_window = max(block_window // 4, MIN_BLOCK_WINDOW)
+            block_start, block_end = get_block_ranges(block_end, block_window)
+            continue
 
-        tx_in_block = get_transactions_in_block_range(
-            contract, block_start, block_end, txes
-        )
+        new_txes = {tx for _, _, tx, _ in logs} - logged_txes
 
-        if len(tx_in_block) == 0:
+        # only an empty window of at least the default size counts towards
+        # stopping, smaller ones just mean we sized the window too tight:
+        if len(new_txes) == 0 and block_window >= DEFAULT_BLOCK_WINDOW:
 
             RICH_CONSOLE.log(
                 f"no transactions found in [blue]{block_start} - [blue]{block_end} ..."
@@ -72,15 +190,367 @@ def get_all_transactions_for_contract(
             except ape.exceptions.SignatureError:
                 # view method returns signature error which means contract abi is rekt.
                 # so we will be a bit more lenient here
-                block_start, block_end = get_block_ranges(block_start)
                 # we count it as a zero tx query else it will just keep searching and reverting until block = 0
                 zero_tx_queries += 1
-                continue
             except:  # catch all: it reverts most likely because pool didnt exist then
                 break
 
-        txes = txes + tx_in_block
+        logged_txes.update(new_txes)
+        yield block_start, block_end, logs
+
+        if block_start == 0:  # reached genesis
+            RICH_CONSOLE.log("[yellow]Reached genesis.")
+            break
+
+        block_window = get_next_block_window(
+            block_end - block_start + 1,
+            len(new_txes),
+            max_transactions - len(logged_txes),
+        )
+        block_start, block_end = get_block_ranges(block_start - 1, block_window)
+
+
+def scan_logs_forwards(
+    contract: ape.Contract,
+    block_start: int,
+    block_end: int,
+    decode_events: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[Tuple[int, int, List[Tuple[int, int, str, int]]]]:
+    """
+    Scan every block from ``block_start`` to ``block_end``, oldest window
+    first. Yields the same tuples as ``scan_logs_backwards``. If ``stop`` is
+    set, the scan ends before the next window.
+    """
+    block_window = DEFAULT_BLOCK_WINDOW
+    while block_start <= block_end and not (stop and stop.is_set()):
+
+        window_end = min(block_start + block_window - 1, block_end)
+        try:
+            logs = get_logs_for_contract_in_block_range(
+                contract, block_start, window_end, decode_events
+            )
+        except ValueError as e:
+            if block_window <= MIN_BLOCK_WINDOW:
+                raise
+            RICH_CONSOLE.log(f"[yellow]Shrinking block window: {e}")
+            block_window = max(block_window // 4, MIN_BLOCK_WINDOW)
+            continue
+
+        yield block_start, window_end, logs
+
+        block_window = get_next_block_window(
+            window_end - block_start + 1, len(logs), MAX_TXES_PER_QUERY
+        )
+        block_start = window_end + 1
+
+
+def get_deploy_block(address: str, head: int) -> int:
+    """
+    Binary search for the first block at which ``address`` has code.
+    Needs an archive node. Returns ``head`` if there is no code at ``head``.
+    """
+    web3 = ape.chain.provider.web3
+    if not web3.eth.get_code(address, block_identifier=head):
+        return head
+
+    low, high = 0, head
+    while low < high:
+        mid = (low + high) // 2
+        if web3.eth.get_code(address, block_identifier=mid):
+            high = mid
+        else:
+            low = mid + 1
+
+    return low
+
+
+def scan_logs_in_parallel(
+    contract: ape.Contract,
+    head: int,
+    max_transactions: int,
+    concurrency: int,
+    decode_events: bool = False,
+) -> Iterator[Tuple[int, int, List[Tuple[int, int, str, int]]]]:
+    """
+    Same as ``scan_logs_backwards``, but splits ``[deploy block, head]`` into
+    segments that a pool of ``concurrency`` workers scans at once.
+
+    Segments are handed out newest first and yielded in that order. Once
+    ``max_transactions`` distinct txes were yielded, the older segments that
+    haven't started yet are cancelled.
+    """
+    deploy_block = get_deploy_block(contract.address, head)
+    num_blocks = head - deploy_block + 1
+    segment_blocks = max(
+        DEFAULT_BLOCK_WINDOW,
+        -(-num_blocks // (concurrency * SEGMENTS_PER_WORKER)),
+    )
+    RICH_CONSOLE.log(
+        f"Scanning blocks [blue]{deploy_block} - [blue]{head} in segments of "
+        f"[blue]{segment_blocks} blocks with [blue]{concurrency} workers."
+    )
+
+    segments = []
+    segment_end = head
+    while segment_end >= deploy_block:
+        segment_start = max(segment_end - segment_blocks + 1, deploy_block)
+        segments.append((segment_start, segment_end))
+        segment_end = segment_start - 1
+
+    def scan_segment(segment: Tuple[int, int]) -> List[Tuple[int, int, str, int]]:
+        logs = []
+        for _, _, window_logs in scan_logs_forwards(
+            contract, segment[0], segment[1], decode_events, stop
+        ):
+            logs.extend(window_logs)
+        return logs
+
+    # segments that are already running stop at their next window once this
+    # is set, so they don't keep spending the node's rate limit:
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # the executor's queue is FIFO, so the newest segments go first:
+        futures = [executor.submit(scan_segment, segment) for segment in segments]
+        logged_txes = set()
+        for (segment_start, segment_end), future in zip(segments, futures):
+            logs = future.result()
+            logged_txes.update(tx for _, _, tx, _ in logs)
+            yield segment_start, segment_end, logs
+            if len(logged_txes) >= max_transactions:
+                break
+    finally:
+        # also runs when the consumer stops early:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_all_transactions_for_contract(
+    contract: ape.Contract,
+    max_transactions: int,
+    max_block: int = None,
+    decode_events: bool = False,
+    concurrency: int = 1,
+) -> List[Tuple[int, str]]:
+    """
+    Get the newest ``max_transactions`` txes where ``contract`` emitted an
+    event, walking back from ``max_block`` (or the chain head) with block
+    windows sized to the contract's tx density. With ``concurrency`` > 1, block
+    segments are scanned in parallel instead.
+
+    Returns:
+        List[Tuple[int, str]]: (block number, tx hash), oldest first.
+    """
+    head = ape.chain.blocks.height
+    if max_block:
+        head = max_block
+
+    RICH_CONSOLE.log(f"Getting transactions for contract [red]{contract.address}.")
+    if concurrency > 1:
+        windows = scan_logs_in_parallel(
+            contract, head, max_transactions, concurrency, decode_events
+        )
+    else:
+        windows = scan_logs_backwards(contract, head, max_transactions, decode_events)
+
+    txes = []
+    logged_txes = set()
+    for _, _, logs in windows:
+
+        # we walk backwards, so only keep the newest txes of the last window:
+        tx_in_block = _get_new_txes(logs, logged_txes)
+        num_txes_needed = max_transactions - len(txes)
+        txes = tx_in_block[-num_txes_needed:] + txes
+        logged_txes.update(tx for _, tx in tx_in_block)
         RICH_CONSOLE.log(f"Total transactions: [blue]{len(txes)}")
-        block_start, block_end = get_block_ranges(block_start)
 
     return txes
+
+
+# ---- multi address discovery ---- #
+
+
+def get_logs_for_addresses_in_block_range(
+    addresses: List[str], block_start: int, block_end: int
+) -> Dict[str, List[Tuple[int, int, str, int]]]:
+    """
+    Get every log a set of contracts emitted in a block range, with one
+    ``eth_getLogs`` call per ``ADDRESS_CHUNK_SIZE`` addresses.
+
+    Returns:
+        Dict[str, List[Tuple[int, int, str, int]]]: logs of each (lowercased)
+            address, in the format of ``get_logs_for_contract_in_block_range``.
+    """
+    logs = {address.lower(): [] for address in addresses}
+    for start in range(0, len(addresses), ADDRESS_CHUNK_SIZE):
+        end = start + ADDRESS_CHUNK_SIZE
+        chunk = addresses[start:end]
+        for log in get_logs_in_block_range(chunk, block_start, block_end):
+            logs[log["address"].lower()].append(_parse_raw_log(log))
+
+    for address_logs in logs.values():
+        address_logs.sort()
+
+    return logs
+
+
+def _get_empty_blocks_to_stop(
+    num_blocks_scanned: int, num_txes: int, num_txes_needed: int
+) -> int:
+
+    # the multi address version of the serial stop rule: a pool is done once
+    # it went quiet for as many blocks as its next window would have spanned
+    if num_txes == 0:
+        return DEFAULT_BLOCK_WINDOW
+
+    return max(
+        DEFAULT_BLOCK_WINDOW,
+        get_next_block_window(num_blocks_scanned, num_txes, num_txes_needed),
+    )
+
+
+def scan_logs_backwards_for_addresses(
+    addresses: List[str], head: int, max_transactions: int
+) -> Iterator[Tuple[int, int, Dict[str, List[Tuple[int, int, str, int]]]]]:
+    """
+    ``scan_logs_backwards`` for many contracts at once: every block window is
+    queried for all contracts that still need txes, and the logs are routed
+    back to each contract.
+
+    A contract drops out of the scan once it has ``max_transactions`` txes,
+    or once it had no logs for as many blocks as its own tx density says a
+    serial scan would have looked at. Unlike the serial scanner, this does not
+    call ``A`` to check if the contract existed yet.
+
+    Yields:
+        Tuple: (block start, block end, logs of each contract that was part of
+            the window), newest window first.
+    """
+    logged_txes = {address.lower(): set() for address in addresses}
+    empty_blocks = dict.fromkeys(logged_txes, 0)
+    active = list(logged_txes)
+
+    block_window = DEFAULT_BLOCK_WINDOW
+    block_start, block_end = get_block_ranges(head, block_window)
+    while active:
+
+        try:
+            logs = get_logs_for_addresses_in_block_range(active, block_start, block_end)
+        except ValueError as e:
+            if block_window <= MIN_BLOCK_WINDOW:
+                raise
+            RICH_CONSOLE.log(f"[yellow]Shrinking block window: {e}")
+            block_window = max(block_window // 4, MIN_BLOCK_WINDOW)
+            block_start, block_end = get_block_ranges(block_end, block_window)
+            continue
+
+        yield block_start, block_end, logs
+
+        if block_start == 0:  # reached genesis
+            RICH_CONSOLE.log("[yellow]Reached genesis.")
+            break
+
+        num_new_txes = 0
+        num_txes_needed = 0
+        still_active = []
+        for address in active:
+
+            new_txes = {tx for _, _, tx, _ in logs[address]} - logged_txes[address]
+            logged_txes[address].update(new_txes)
+            num_new_txes += len(new_txes)
+            if new_txes:
+                empty_blocks[address] = 0
+            else:
+                empty_blocks[address] += block_end - block_start + 1
+
+            num_txes = len(logged_txes[address])
+            empty_blocks_to_stop = _get_empty_blocks_to_stop(
+                head - block_start + 1, num_txes, max_transactions - num_txes
+            )
+            if (
+                num_txes < max_transactions
+                and empty_blocks[address] < empty_blocks_to_stop
+            ):
+                still_active.append(address)
+                num_txes_needed += max_transactions - num_txes
+
+        RICH_CONSOLE.log(
+            f"Scanned [blue]{block_start} - [blue]{block_end}: "
+            f"[blue]{num_new_txes} new transactions, "
+            f"[blue]{len(still_active)}/{len(logged_txes)} pools still "
+            f"scanning."
+        )
+        active = still_active
+        block_window = get_next_block_window(
+            block_end - block_start + 1, num_new_txes, num_txes_needed
+        )
+        block_start, block_end = get_block_ranges(block_start - 1, block_window)
+
+
+def scan_logs_forwards_for_addresses(
+    addresses: List[str], block_start: int, block_end: int
+) -> Iterator[Tuple[int, int, Dict[str, List[Tuple[int, int, str, int]]]]]:
+    """
+    ``scan_logs_forwards`` for many contracts at once. Yields the same tuples
+    as ``scan_logs_backwards_for_addresses``, oldest window first.
+    """
+    block_window = DEFAULT_BLOCK_WINDOW
+    while block_start <= block_end:
+
+        window_end = min(block_start + block_window - 1, block_end)
+        try:
+            logs = get_logs_for_addresses_in_block_range(
+                addresses, block_start, window_end
+            )
+        except ValueError as e:
+            if block_window <= MIN_BLOCK_WINDOW:
+                raise
+            RICH_CONSOLE.log(f"[yellow]Shrinking block window: {e}")
+            block_window = max(block_window // 4, MIN_BLOCK_WINDOW)
+            continue
+
+        yield block_start, window_end, logs
+
+        block_window = get_next_block_window(
+            window_end - block_start + 1,
+            sum(len(address_logs) for address_logs in logs.values()),
+            MAX_TXES_PER_QUERY,
+        )
+        block_start = window_end + 1
+
+
+def get_all_transactions_for_addresses(
+    addresses: List[str], max_transactions: int, max_block: int = None
+) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    ``get_all_transactions_for_contract`` for many contracts, sharing each
+    ``eth_getLogs`` call between all of them.
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]]: the newest ``max_transactions``
+            (block number, tx hash) of each (lowercased) address, oldest first.
+    """
+    head = ape.chain.blocks.height
+    if max_block:
+        head = max_block
+
+    RICH_CONSOLE.log(f"Getting transactions for [red]{len(addresses)} contracts.")
+    txes = {address.lower(): [] for address in addresses}
+    logged_txes = {address: set() for address in txes}
+    for _, _, logs in scan_logs_backwards_for_addresses(
+        addresses, head, max_transactions
+    ):
+        for address, address_logs in logs.items():
+
+            tx_in_block = _get_new_txes(address_logs, logged_txes[address])
+            num_txes_needed = max_transactions - len(txes[address])
+            if num_txes_needed > 0:
+                txes[address] = tx_in_block[-num_txes_needed:] + txes[address]
+            logged_txes[address].update(tx for _, tx in tx_in_block)
+
+    RICH_CONSOLE.log(
+        f"Total transactions: "
+        f"[blue]{sum(len(pool_txes) for pool_txes in txes.values())}"
+    )
+    return txes
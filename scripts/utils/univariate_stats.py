@@ -0,0 +1,97 @@
+from typing import Dict, Tuple
+
+import numpy
+
+from scripts.utils.gas_samples import GasSamples, group_by_method
+
+
+def get_univariate_gas_table(
+    count: int, mean: float, m2: float, min_gas: int, max_gas: int
+) -> Dict:
+
+    std = numpy.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+    return {
+        "mean": int(mean),
+        "std": int(std),
+        "min": int(min_gas),
+        "max": int(max_gas),
+        "count": int(count),
+        "m2": int(round(m2)),
+    }
+
+
+def get_univariate_gas_tables(samples: GasSamples) -> Dict[str, Dict]:
+    """
+    Univariate gas table of every method in ``samples``.
+    """
+    # count, mean and m2 (sum of squared deviations from the mean) are
+    # sufficient statistics, so tables can be merged later on. all methods
+    # are reduced at once, over gas sorted by method:
+    method_names, starts, gas = group_by_method(samples)
+    counts = numpy.diff(numpy.append(starts, gas.size))
+    means = numpy.add.reduceat(gas, starts) / counts
+    m2s = numpy.add.reduceat((gas - numpy.repeat(means, counts)) ** 2, starts)
+    mins = numpy.minimum.reduceat(gas, starts)
+    maxs = numpy.maximum.reduceat(gas, starts)
+
+    return {
+        method_name: get_univariate_gas_table(count, mean, m2, min_gas, max_gas)
+        for method_name, count, mean, m2, min_gas, max_gas in zip(
+            method_names, counts, means, m2s, mins, maxs
+        )
+    }
+
+
+def merge_moments(
+    count_a: float,
+    mean_a: float,
+    m2_a: float,
+    count_b: float,
+    mean_b: float,
+    m2_b: float,
+) -> Tuple[float, float, float]:
+
+    # Chan et al.'s pairwise update of count, mean and m2:
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta**2 * count_a * count_b / count
+    return count, mean, m2
+
+
+def get_m2(stats: Dict) -> float:
+
+    # tables written before m2 was stored: recover it from the sample std
+    if "m2" in stats:
+        return stats["m2"]
+
+    return stats["std"] ** 2 * max(stats["count"] - 1, 0)
+
+
+def merge_univariate_gas_stats(cached_gas_table: Dict, gas_table: Dict) -> Dict:
+
+    merged_gas_table = dict(cached_gas_table)
+    for method_name, stats in gas_table.items():
+
+        cached_stats = cached_gas_table.get(method_name)
+        if not cached_stats:
+            merged_gas_table[method_name] = stats
+            continue
+
+        count, mean, m2 = merge_moments(
+            cached_stats["count"],
+            cached_stats["mean"],
+            get_m2(cached_stats),
+            stats["count"],
+            stats["mean"],
+            get_m2(stats),
+        )
+        merged_gas_table[method_name] = get_univariate_gas_table(
+            count,
+            mean,
+            m2,
+            min(cached_stats["min"], stats["min"]),
+            max(cached_stats["max"], stats["max"]),
+        )
+
+    return merged_gas_table
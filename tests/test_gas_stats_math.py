@@ -0,0 +1,100 @@
+import numpy
+import pytest
+
+from scripts.utils.gas_samples import gas_samples_from_rows
+from scripts.utils.mixture import WarmStart, fit_gaussian_mixtures
+from scripts.utils.quantile_sketch import QuantileSketch
+from scripts.utils.univariate_stats import (get_univariate_gas_tables,
+                                            merge_univariate_gas_stats)
+
+
+def _get_rows(rng: numpy.random.Generator, num_txes: int, first_block: int):
+
+    rows = []
+    for block_number in range(first_block, first_block + num_txes):
+        gas_costs = {"exchange": int(rng.normal(120000, 8000))}
+        if rng.random() < 0.3:
+            gas_costs["add_liquidity"] = int(rng.normal(200000, 15000))
+        rows.append((block_number, gas_costs))
+
+    return rows
+
+
+def test_univariate_merge_equals_stats_of_concatenated_samples():
+
+    rng = numpy.random.default_rng(0)
+    old_rows = _get_rows(rng, 500, 15_000_000)
+    new_rows = _get_rows(rng, 300, 15_000_500)
+
+    merged = merge_univariate_gas_stats(
+        get_univariate_gas_tables(gas_samples_from_rows(old_rows)),
+        get_univariate_gas_tables(gas_samples_from_rows(new_rows)),
+    )
+    expected = get_univariate_gas_tables(gas_samples_from_rows(old_rows + new_rows))
+
+    assert merged.keys() == expected.keys()
+    for method_name, stats in expected.items():
+        merged_stats = merged[method_name]
+        assert merged_stats["count"] == stats["count"]
+        assert merged_stats["min"] == stats["min"]
+        assert merged_stats["max"] == stats["max"]
+        # stored means are truncated to ints, which the merge works from:
+        assert merged_stats["mean"] == pytest.approx(stats["mean"], abs=1)
+        assert merged_stats["std"] == pytest.approx(stats["std"], abs=1)
+        assert merged_stats["m2"] == pytest.approx(stats["m2"], rel=1e-5)
+
+
+def test_sketch_merge_counts_and_median():
+
+    rng = numpy.random.default_rng(1)
+    values_a = rng.lognormal(numpy.log(150000), 0.3, 5000)
+    values_b = rng.lognormal(numpy.log(90000), 0.2, 3000)
+
+    sketch_a, sketch_b = QuantileSketch(), QuantileSketch()
+    sketch_a.add(values_a)
+    sketch_b.add(numpy.append(values_b, [0, 0]))
+    # merged after a round trip through the gas table format:
+    merged = QuantileSketch.from_dict(sketch_a.to_dict())
+    merged.merge(QuantileSketch.from_dict(sketch_b.to_dict()))
+
+    assert merged.count == values_a.size + values_b.size + 2
+    assert merged.zero_count == 2
+
+    values = numpy.concatenate([values_a, values_b, [0, 0]])
+    exact_median = numpy.quantile(values, 0.5, method="lower")
+    assert merged.get_quantile(0.5) == pytest.approx(
+        exact_median, rel=merged.relative_accuracy
+    )
+
+
+def test_em_recovers_two_component_mixture():
+
+    rng = numpy.random.default_rng(2)
+    sample = numpy.concatenate(
+        [rng.normal(100000, 2000, 7000), rng.normal(160000, 4000, 3000)]
+    )
+
+    (fit,) = fit_gaussian_mixtures([sample], 2)
+
+    assert fit.weights == pytest.approx([0.7, 0.3], abs=0.02)
+    assert fit.means == pytest.approx([100000, 160000], rel=0.01)
+    assert fit.stds == pytest.approx([2000, 4000], rel=0.1)
+
+
+def test_em_recovers_from_warm_start_with_zero_weight():
+
+    rng = numpy.random.default_rng(3)
+    sample = numpy.concatenate(
+        [rng.normal(100000, 2000, 5000), rng.normal(160000, 4000, 5000)]
+    )
+    # stored weights are rounded, so a component can come back as 0:
+    warm_start = WarmStart(
+        weights=numpy.array([1.0, 0.0]),
+        means=numpy.array([100000.0, 160000.0]),
+        stds=numpy.array([2000.0, 4000.0]),
+    )
+
+    (fit,) = fit_gaussian_mixtures([sample], 2, [warm_start])
+
+    assert fit.weights == pytest.approx([0.5, 0.5], abs=0.02)
+    assert fit.means == pytest.approx([100000, 160000], rel=0.01)
@@ -0,0 +1,67 @@
+import numpy
+
+from scripts.utils.gas_samples import concat_gas_samples, gas_samples_from_rows
+from scripts.utils.pooling import fill_in_thin_methods, get_thin_methods
+from scripts.utils.rolling_stats import (get_bucket_moments,
+                                         get_rolling_gas_table)
+from scripts.utils.univariate_stats import get_univariate_gas_tables
+
+BUCKET_BLOCKS = 100
+
+
+def _get_gas_stats(samples):
+
+    return {
+        "univariate": get_univariate_gas_tables(samples),
+        "rolling": get_rolling_gas_table(
+            samples.method_names,
+            get_bucket_moments(samples, BUCKET_BLOCKS),
+            BUCKET_BLOCKS,
+            4.0,
+        ),
+    }
+
+
+def test_pooling_with_rolling_stats():
+
+    rng = numpy.random.default_rng(0)
+    # add_liquidity is thin in the first pool, but not in the group:
+    pool_samples = gas_samples_from_rows(
+        [
+            (
+                15_000_000 + idx,
+                {"exchange": int(rng.normal(120000, 8000))}
+                if idx % 50
+                else {"add_liquidity": int(rng.normal(200000, 15000))},
+            )
+            for idx in range(500)
+        ]
+    )
+    other_pool_samples = gas_samples_from_rows(
+        [
+            (15_000_000 + idx, {"add_liquidity": int(rng.normal(210000, 1e4))})
+            for idx in range(300)
+        ]
+    )
+    gas_stats = _get_gas_stats(pool_samples)
+    own_rolling_stats = gas_stats["rolling"]
+    group_stats = _get_gas_stats(concat_gas_samples([pool_samples, other_pool_samples]))
+
+    method_counts = {
+        method: stats["count"] for method, stats in gas_stats["univariate"].items()
+    }
+    thin_methods = get_thin_methods(method_counts, 100)
+    pooled_methods = fill_in_thin_methods(
+        gas_stats, group_stats, method_counts, thin_methods
+    )
+
+    assert thin_methods == ["add_liquidity"]
+    assert pooled_methods == {"add_liquidity"}
+    assert (
+        gas_stats["univariate"]["add_liquidity"]
+        == group_stats["univariate"]["add_liquidity"]
+    )
+    assert gas_stats["own_stats"]["univariate"]["add_liquidity"]["count"] == 10
+    # rolling stats stay the pool's own:
+    assert gas_stats["rolling"] is own_rolling_stats
+    assert "rolling" not in gas_stats["own_stats"]